@@ -0,0 +1,268 @@
+"""
+Run a file of questions through the search pipeline (m1 / m2) offline.
+
+Usage:
+    python batch.py questions.jsonl answers.jsonl --concurrency 16
+    python batch.py questions.csv answers.jsonl --model m2 --engine bm25 --workers 2
+    python batch.py questions.jsonl answers.jsonl --retry-errors       # re-run failed questions
+
+Input is JSONL (one object per line, or a bare JSON string) or CSV with a
+"question" column. Optional fields/columns: id, engine, model, full_text and
+the /search filter parameters surah, verse_from, verse_to, book, chapter_id.
+Without an id, the line number is used.
+
+Each answer is appended to the output as soon as it is ready:
+{"id", "question", "engine", "model", "elapsed_s", "response"} or, on
+failure, {"id", ..., "error"}. A degraded answer (LLM unavailable:
+direct-search or unvalidated results) keeps its "response" but is also
+recorded as an error, and so is a row with an invalid filter value. The
+output file is the checkpoint. A re-run skips ids already answered, so an
+interrupted batch resumes where it stopped. With --retry-errors a failed
+id gets a new line, and the last line per id wins.
+
+--concurrency is the number of questions in flight (they mostly wait on
+the LLM). --workers N also moves retrieval to N processes, so scoring
+runs outside this process's GIL.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Set
+from filters import doc_id_of, filters_from_params
+
+FILTER_FIELDS = ('surah', 'verse_from', 'verse_to', 'book', 'chapter_id')
+INT_FIELDS = ('surah', 'verse_from', 'verse_to', 'chapter_id')
+
+# Set inside each retrieval worker process by _init_worker
+_worker_engines = None
+
+
+def _parse_json_line(line: str):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return {'question': line.strip(), 'error': f"Invalid JSON: {e}"}
+
+
+def read_questions(path: str) -> Iterator[dict]:
+    """
+    Normalized question rows: {'id', 'question', and any optional fields given}.
+    A row that cannot be used (bad JSON, non-integer filter, verse range without
+    a surah) carries an 'error'
+    and is written to the output as a failed answer.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = ((line_no, row) for line_no, row in enumerate(csv.DictReader(f), start=1))
+        else:
+            rows = ((line_no, _parse_json_line(line)) for line_no, line in enumerate(f, start=1) if line.strip())
+        for line_no, row in rows:
+            if isinstance(row, str):
+                row = {'question': row}
+            row = {k: v for k, v in row.items() if v not in (None, '')}
+            if not row.get('question'):
+                continue
+            row['id'] = str(row.get('id', line_no))
+            for field in INT_FIELDS:
+                if field in row and 'error' not in row:
+                    try:
+                        row[field] = int(row[field])
+                    except (TypeError, ValueError):
+                        row['error'] = f"Invalid {field}: {row[field]!r}"
+            if 'error' not in row:
+                try:
+                    filters_from_params(**{field: row.get(field) for field in FILTER_FIELDS})
+                except ValueError as e:
+                    row['error'] = str(e)
+
+            if isinstance(row.get('full_text'), str):
+                row['full_text'] = row['full_text'].lower() in ('1', 'true', 'yes')
+            yield row
+
+
+def completed_ids(output_path: str, retry_errors: bool) -> Set[str]:
+    """Ids already answered in an existing output file (a torn last line is ignored)."""
+    done = set()
+    try:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'error' in entry and retry_errors:
+                    done.discard(entry['id'])
+                else:
+                    done.add(entry['id'])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _init_worker(indices_dir: str):
+    global _worker_engines
+    from load_engines import load_engines_fast
+    _worker_engines = load_engines_fast(indices_dir)
+
+
+def _worker_search(key: str, query: str, top_k: int, doc_filter) -> List[dict]:
+    results = _worker_engines[key].search(query, top_k=top_k, doc_filter=doc_filter)
+    # The parent re-attaches text and metadata from its own copy of the index
+    for res in results:
+        res.pop('text', None)
+        res.pop('metadata', None)
+    return results
+
+
+class RemoteEngine:
+    """Runs an engine's searches in the retrieval worker processes."""
+
+    def __init__(self, key: str, local_engine, pool: ProcessPoolExecutor, records: Dict[str, dict]):
+        from startup import is_unbuilt
+        self.key = key
+        self.pool = pool
+        self.records = records
+        self.engine_label = getattr(local_engine, 'engine_label', None) or type(local_engine).__name__
+        if not is_unbuilt(local_engine) and hasattr(local_engine, 'search_boolean'):
+            self.search_boolean = self.search
+
+    def search(self, query: str, top_k: int = 10, doc_filter=None) -> List[dict]:
+        results = self.pool.submit(_worker_search, self.key, query, top_k, doc_filter).result()
+        for res in results:
+            record = self.records[res['doc_id']]
+            res['text'] = record.get('arabic_original', '')
+            res['metadata'] = record
+        return results
+
+
+def remote_engines(engines: dict, pool: ProcessPoolExecutor) -> dict:
+    """A copy of engines whose search engines delegate to the worker pool."""
+    records = {
+        corpus: {doc_id_of(doc, idx): doc for idx, doc in enumerate(engines[f'{corpus}_index'])}
+        for corpus in ('quran', 'hadith')
+    }
+    remote = dict(engines)
+    for key, engine in engines.items():
+        # Engines are the keys named <engine>_<corpus>
+        corpus = key.rsplit('_', 1)[-1]
+        if corpus in records:
+            remote[key] = RemoteEngine(key, engine, pool, records[corpus])
+    return remote
+
+
+def answer(engines: dict, llm_models: dict, row: dict, defaults: argparse.Namespace) -> dict:
+    from run_user_query import run_pipeline
+    engine = row.get('engine', defaults.engine)
+    model = row.get('model', defaults.model)
+    entry = {'id': row['id'], 'question': row['question'], 'engine': engine, 'model': model}
+    if 'error' in row:
+        entry['error'] = row['error']
+        entry['elapsed_s'] = 0.0
+        return entry
+    filters = filters_from_params(**{field: row.get(field) for field in FILTER_FIELDS})
+    start = time.perf_counter()
+    try:
+        response = run_pipeline(engines, row['question'], engine, model, llm_models, filters,
+                                row.get('full_text', defaults.full_text))
+        entry['response'] = response.model_dump(mode='json')
+        if response.degraded:
+            # Kept for inspection, but retried by --retry-errors like a failure
+            entry['error'] = "Degraded: LLM unavailable, results not validated"
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+    entry['elapsed_s'] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def _ends_mid_line(path: str) -> bool:
+    """Whether an existing output file ends in a torn (unterminated) line."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, 2)
+            return f.read(1) != b'\n'
+    except FileNotFoundError:
+        return False
+
+
+def run_batch(rows: List[dict], output_path: str, engines: dict, llm_models: dict,
+              args: argparse.Namespace) -> Dict[str, int]:
+    counts = {'done': 0, 'errors': 0}
+    start = time.perf_counter()
+    torn = _ends_mid_line(output_path)
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        if torn:
+            # Terminate the line an interrupted run left half written, so the first new answer starts its own
+            out.write('\n')
+        futures = [pool.submit(answer, engines, llm_models, row, args) for row in rows]
+        try:
+            for future in as_completed(futures):
+                entry = future.result()
+                out.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                out.flush()
+                counts['done'] += 1
+                counts['errors'] += 'error' in entry
+                if counts['done'] % args.progress_every == 0 or counts['done'] == len(rows):
+                    elapsed = time.perf_counter() - start
+                    rate = counts['done'] / elapsed if elapsed else 0.0
+                    eta = (len(rows) - counts['done']) / rate if rate else 0.0
+                    print(f"{counts['done']}/{len(rows)} done, {counts['errors']} errors, "
+                          f"{rate:.2f} q/s, eta {eta:.0f}s", file=sys.stderr)
+        except KeyboardInterrupt:
+            # Everything written so far is kept; a re-run resumes from there
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions with the search pipeline")
+    parser.add_argument("input", help="Questions as JSONL or CSV")
+    parser.add_argument("output", help="JSONL answers (appended to; also the resume checkpoint)")
+    parser.add_argument("--engine", default="bm25")
+    parser.add_argument("--model", default="m1", choices=["m1", "m2"])
+    parser.add_argument("--full-text", action="store_true", help="Include the full text of each result")
+    parser.add_argument("--concurrency", type=int, default=8, help="Questions in flight at once")
+    parser.add_argument("--workers", type=int, default=0, help="Retrieval worker processes (0: in-process)")
+    parser.add_argument("--indices-dir", default="indices")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run questions whose answer was an error")
+    parser.add_argument("--limit", type=int, help="Answer at most this many new questions")
+    parser.add_argument("--progress-every", type=int, default=10)
+    args = parser.parse_args()
+
+    done = completed_ids(args.output, args.retry_errors)
+    rows = [row for row in read_questions(args.input) if row['id'] not in done]
+    if args.limit:
+        rows = rows[:args.limit]
+    print(f"{len(done)} already answered, {len(rows)} to go", file=sys.stderr)
+    if not rows:
+        return
+
+    from load_engines import load_engines_fast
+    from gemini_llm import SearchModelOne, SearchModelTwo
+    engines = load_engines_fast(args.indices_dir)
+    pool = None
+    if args.workers > 0:
+        # spawn: workers must not inherit this process's threads and locks
+        pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(args.indices_dir,))
+        engines = remote_engines(engines, pool)
+    llm_models = {"m1": SearchModelOne(), "m2": SearchModelTwo()}
+
+    try:
+        counts = run_batch(rows, args.output, engines, llm_models, args)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    print(f"finished: {counts['done']} answered, {counts['errors']} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
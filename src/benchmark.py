@@ -0,0 +1,252 @@
+"""
+Offline benchmark for the search engines and the end-to-end pipeline.
+
+Usage:
+    python benchmark.py                          # all six engines, both corpora
+    python benchmark.py --engines bm25 bm25_lib --repeat 20
+    python benchmark.py --e2e --repeat 5         # run_query with a stubbed LLM
+    python benchmark.py --e2e --llm-latency 0.8  # SearchModelOne on the fake LLM backend
+    python benchmark.py --json results.json      # also write the raw report
+    python benchmark.py --baseline results.json  # fail if p95 regressed by more than --tolerance
+"""
+import argparse
+import copy
+import json
+import resource
+import sys
+import time
+from typing import Dict, List
+from startup import LazyEngine
+
+ENGINE_KEYS = ["bm25", "bm25_lib", "tfidf", "tfidf_lib", "vsm", "vsm_lib"]
+
+# Custom engine -> library engine it should agree with
+PARITY_PAIRS = [("bm25", "bm25_lib"), ("tfidf", "tfidf_lib"), ("vsm", "vsm_lib")]
+
+# Ranking features the custom engines add on top of the library formulas
+# (stem matching, fuzzy expansion, near-duplicate collapse), switched off for parity runs
+PARITY_DISABLED = ("stem_index", "stem_postings", "term_dictionary", "duplicate_clusters", "cluster_of")
+
+BENCH_QUERIES = {
+    "single_term": ["الصبر", "الجنة", "الزكاة", "الصيام", "التوبة", "الميراث"],
+    "high_df": ["الله", "قال", "من", "في", "الذين امنوا", "رسول الله"],
+    "llm_phrase": [
+        "يا ايها الذين امنوا اتقوا الله وكونوا مع الصادقين",
+        "ان الله مع الصابرين الذين اذا اصابتهم مصيبة",
+        "قال رسول الله صلى الله عليه وسلم انما الاعمال بالنيات",
+        "واقيموا الصلاة واتوا الزكاة واركعوا مع الراكعين",
+        "من صام رمضان ايمانا واحتسابا غفر له ما تقدم من ذنبه",
+    ],
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def latency_summary(latencies: List[float], wall_time: float) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "qps": len(latencies) / wall_time if wall_time else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def topk_overlap(a: List[dict], b: List[dict]) -> float:
+    ids_a = {r['doc_id'] for r in a}
+    ids_b = {r['doc_id'] for r in b}
+    if not ids_a and not ids_b:
+        return 1.0
+    return len(ids_a & ids_b) / max(len(ids_a), len(ids_b))
+
+
+def warm_engine(engine, queries: List[str], top_k: int) -> Dict[str, float]:
+    """
+    Build a deferred engine and run every query once before timing, so lazily
+    built structures (fuzzy delete index, prefix trie) are not in the latencies.
+    """
+    start = time.perf_counter()
+    if isinstance(engine, LazyEngine):
+        engine.get()
+    build = time.perf_counter() - start
+    for q in queries:
+        engine.search(q, top_k=top_k)
+    return {"build_ms": build * 1000, "warmup_ms": (time.perf_counter() - start - build) * 1000}
+
+
+def bench_engine(engine, queries: List[str], top_k: int, repeat: int):
+    latencies = []
+    results = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            t0 = time.perf_counter()
+            results[q] = engine.search(q, top_k=top_k)
+            latencies.append(time.perf_counter() - t0)
+    return latency_summary(latencies, time.perf_counter() - start), results
+
+
+def parity_reference(engine):
+    """A shallow copy of a custom engine scoring with the plain formula its library engine implements."""
+    reference = copy.copy(engine)
+    for attr in PARITY_DISABLED:
+        if hasattr(reference, attr):
+            setattr(reference, attr, None)
+    return reference
+
+
+def run_engine_benchmarks(engines: dict, engine_keys: List[str], top_k: int, repeat: int) -> dict:
+    report = {}
+    for corpus in ("quran", "hadith"):
+        top_results = {}
+        for key in engine_keys:
+            engine = engines[f"{key}_{corpus}"]
+            report[f"{corpus}/{key}/warmup"] = warm_engine(
+                engine, [q for queries in BENCH_QUERIES.values() for q in queries], top_k)
+            for category, queries in BENCH_QUERIES.items():
+                summary, results = bench_engine(engine, queries, top_k, repeat)
+                report[f"{corpus}/{key}/{category}"] = summary
+                top_results.setdefault(key, {}).update(results)
+
+        for custom, lib in PARITY_PAIRS:
+            if custom in top_results and lib in top_results:
+                reference = parity_reference(engines[f"{custom}_{corpus}"])
+                overlaps = [
+                    topk_overlap(reference.search(q, top_k=top_k), top_results[lib][q])
+                    for q in top_results[lib]
+                ]
+                report[f"{corpus}/parity/{custom}~{lib}"] = {"topk_overlap": sum(overlaps) / len(overlaps)}
+    return report
+
+
+class StubModel:
+    """
+    Stand-in for SearchModelOne: generates fixed queries for every question
+    and marks every candidate as relevant, with no network calls.
+    """
+    def __init__(self, queries_per_source: int = 3):
+        self.queries_per_source = queries_per_source
+        self.backend = None
+
+    def available(self) -> bool:
+        return True
+
+    def generate_queries(self, user_question: str) -> List[dict]:
+        phrases = BENCH_QUERIES["llm_phrase"][:self.queries_per_source]
+        return ([{"query": p, "type": "quran"} for p in phrases] +
+                [{"query": p, "type": "hadith"} for p in phrases])
+
+    def filter_results_batch(self, user_question: str, query_results_map: List[dict]) -> dict:
+        return {
+            q_idx: [{"index": i, "observation": "stub", "is_relevant": True} for i in range(len(item['results']))]
+            for q_idx, item in enumerate(query_results_map)
+        }
+
+
+def run_e2e_benchmark(engines: dict, engine_keys: List[str], repeat: int, llm_latency: float = None) -> dict:
+    from run_user_query import run_query
+
+    if llm_latency is None:
+        model = StubModel()
+    else:
+        from gemini_llm import SearchModelOne
+        from llm_backends import FakeBackend
+        model = SearchModelOne(backend=FakeBackend(latency=llm_latency))
+    questions = BENCH_QUERIES["llm_phrase"]
+    report = {}
+    for key in engine_keys:
+        for corpus in ("quran", "hadith"):
+            report[f"e2e/{key}/{corpus}/warmup"] = warm_engine(engines[f"{key}_{corpus}"], questions, 5)
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for question in questions:
+                t0 = time.perf_counter()
+                response = run_query(question, engines[f"{key}_quran"], engines[f"{key}_hadith"], model)
+                response.model_dump_json()
+                latencies.append(time.perf_counter() - t0)
+        report[f"e2e/{key}"] = latency_summary(latencies, time.perf_counter() - start)
+    return report
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, stats in report.items():
+        old = baseline.get(name)
+        if not old or name.startswith("_"):
+            continue
+        if "p95_ms" in stats and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']:.2f}ms -> {stats['p95_ms']:.2f}ms")
+        if "topk_overlap" in stats and stats["topk_overlap"] < old["topk_overlap"] - tolerance:
+            regressions.append(f"{name}: overlap {old['topk_overlap']:.3f} -> {stats['topk_overlap']:.3f}")
+    return regressions
+
+
+def print_report(report: dict):
+    for name, stats in report.items():
+        if "topk_overlap" in stats:
+            print(f"{name:45s} overlap@k={stats['topk_overlap']:.3f}")
+        elif "build_ms" in stats:
+            print(f"{name:45s} build={stats['build_ms']:8.2f}ms warm-up={stats['warmup_ms']:8.2f}ms")
+        else:
+            print(f"{name:45s} p50={stats['p50_ms']:8.2f}ms p95={stats['p95_ms']:8.2f}ms "
+                  f"p99={stats['p99_ms']:8.2f}ms qps={stats['qps']:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search engines on the real Quran and Hadith indices.")
+    parser.add_argument("--engines", nargs="+", default=ENGINE_KEYS)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--e2e", action="store_true", help="Benchmark run_query end to end with a stubbed LLM")
+    parser.add_argument("--llm-latency", type=float,
+                        help="With --e2e, use SearchModelOne on the fake LLM backend with this delay per call")
+    parser.add_argument("--json", help="Write the full report as JSON to this path")
+    parser.add_argument("--baseline", help="Previous --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative p95 slowdown")
+    args = parser.parse_args()
+
+    from load_engines import load_engines_fast
+
+    t0 = time.perf_counter()
+    engines = load_engines_fast()
+    load_time = time.perf_counter() - t0
+
+    if args.e2e:
+        report = run_e2e_benchmark(engines, args.engines, args.repeat, args.llm_latency)
+    else:
+        report = run_engine_benchmarks(engines, args.engines, args.top_k, args.repeat)
+
+    print_report(report)
+    print(f"\nengine load time: {load_time:.2f}s   peak RSS: {peak_rss_mb():.1f} MB")
+
+    if args.json:
+        report["_meta"] = {"load_time_s": load_time, "peak_rss_mb": peak_rss_mb(), "repeat": args.repeat}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            print('\n'.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
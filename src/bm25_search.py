@@ -1,21 +1,66 @@
 import math
-from collections import defaultdict
+import time
 from typing import List, Dict, Any
+import numpy as np
 from preprocessing import SafeIslamicArabicProcessor
+from metrics import ANYTIME_SEARCHES, POSTINGS_TRAVERSED
+from filters import DocFilter
+from frozen_index import FrozenPostings, accumulate, contains_row, doc_filter_mask, readonly, shared_postings, top_k_rows
+from term_dictionary import TermDictionary
+from stemming import LightStemmer
+from boolean_query import is_boolean_query, parse_boolean_query, positive_terms, lazy_boolean_index
+from near_duplicates import cluster_array, collapse_duplicates
+from impact_index import ImpactIndex, RankedResults, stem_key
+
+# Initial estimate of the regular scorer's cost per posting, refined by a moving average of
+# searches with at least RATE_MIN_POSTINGS postings
+SECONDS_PER_POSTING = 100e-9
+RATE_MIN_POSTINGS = 1000
+RATE_SMOOTHING = 0.1
 
 
 class BM25SearchEngine:
+    # search() takes a deadline and postings budget (metrics.search_budget)
+    supports_budget = True
+
     def __init__(self, name: str, inverted_index: Dict[str, Any], doc_metadata: Dict[str, Any], 
-                 processor: SafeIslamicArabicProcessor, k1: float = 1.5, b: float = 0.75):
+                 processor: SafeIslamicArabicProcessor, k1: float = 1.5, b: float = 0.75,
+                 term_dictionary: TermDictionary = None, fuzzy_expansions: int = 2, fuzzy_weight: float = 0.5,
+                 stem_index: Dict[str, Any] = None, stemmer: LightStemmer = None, stem_weight: float = 0.5,
+                 duplicate_clusters: Dict[str, str] = None, impact_index: ImpactIndex = None,
+                 postings: FrozenPostings = None, stem_postings: FrozenPostings = None):
         self.name = name
         self.inverted_index = inverted_index
         self.doc_metadata = doc_metadata
         self.processor = processor
         self.k1 = k1
         self.b = b
+        # Query tokens missing from the index are expanded to their closest
+        # dictionary terms, scored at fuzzy_weight
+        self.term_dictionary = term_dictionary
+        self.fuzzy_expansions = fuzzy_expansions
+        self.fuzzy_weight = fuzzy_weight
+        # Occurrences of other surface forms sharing the token's stem count at stem_weight
+        self.stem_index = stem_index
+        self.stemmer = stemmer
+        self.stem_weight = stem_weight
+        # Near-duplicate documents (near_duplicates.py) collapse to their best hit in the top-k
+        self.duplicate_clusters = duplicate_clusters
         
         self.N = len(doc_metadata)
         self.avg_dl = sum(len(d.get('tokens', [])) for d in doc_metadata.values()) / self.N
+
+        # Read-only scoring arrays; the dict indices stay for positions and boolean queries
+        self.doc_ids = tuple(doc_metadata)
+        self.doc_lens = readonly(np.array([len(d.get('tokens', [])) for d in doc_metadata.values()], dtype=np.float64))
+        self.postings = shared_postings(inverted_index, self.doc_ids, postings)
+        self.stem_postings = shared_postings(stem_index, self.doc_ids, stem_postings) if stem_index is not None else None
+        self.cluster_of = cluster_array(duplicate_clusters, self.doc_ids)
+        # Impact-ordered postings for searches with a deadline or postings budget (impact_index.py)
+        self.impact_index = impact_index if impact_index is not None and impact_index.doc_ids == self.doc_ids else None
+        self.seconds_per_posting = SECONDS_PER_POSTING
+        # Built on the first boolean query (see boolean_query.lazy_boolean_index)
+        self._boolean_index = None
     
     def _calculate_idf(self, df: int) -> float:
         return math.log(((self.N - df + 0.5) / (df + 0.5)) + 1)
@@ -25,43 +70,252 @@ class BM25SearchEngine:
         denominator = tf + self.k1 * (1 - self.b + self.b * (doc_len / self.avg_dl))
         return idf * (numerator / denominator)
     
-    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    def _bm25_contribution(self, rows: np.ndarray, tfs: np.ndarray, idf: float) -> np.ndarray:
+        tfs = tfs.astype(np.float64)
+        denominator = tfs + self.k1 * (1 - self.b + self.b * (self.doc_lens[rows] / self.avg_dl))
+        return idf * (tfs * (self.k1 + 1) / denominator)
+
+    def _term_postings(self, token: str):
+        """(rows, tf, df) for one query token, or None if neither it nor its stem is indexed."""
+        surface = self.postings.get(token)
+        stem_entry = self._stem_entry(token)
+        if stem_entry is None:
+            if surface is None:
+                return None
+            rows, tfs = surface
+            return rows, tfs, self.postings.df_of(token)
+
+        # The stem postings are a superset of the surface postings:
+        # tf = surface_tf + stem_weight * (stem_tf - surface_tf)
+        rows, stem_tfs = self.stem_postings.get(self.stemmer.stem(token))
+        tfs = self.stem_weight * stem_tfs.astype(np.float64)
+        if surface is None:
+            return rows, tfs, stem_entry['df']
+        surface_rows, surface_tfs = surface
+        tfs[np.searchsorted(rows, surface_rows)] += (1 - self.stem_weight) * surface_tfs
+        return rows, tfs, self.postings.df_of(token)
+
+    def _stem_entry(self, token: str):
+        if self.stem_index is None or self.stemmer is None:
+            return None
+        return self.stem_index.get(self.stemmer.stem(token))
+
+    def _expand_tokens(self, query_tokens: List[str]) -> List[tuple]:
+        """(token, weight) pairs to score, with unknown tokens replaced by near matches."""
+        weighted = []
+        for token in query_tokens:
+            if token in self.inverted_index or self._stem_entry(token) is not None:
+                weighted.append((token, 1.0))
+            elif self.term_dictionary is not None:
+                for term, _, _ in self.term_dictionary.fuzzy(token, limit=self.fuzzy_expansions):
+                    weighted.append((term, self.fuzzy_weight))
+        return weighted
+
+    def _cluster_id(self, doc_id: str):
+        return self.duplicate_clusters.get(doc_id) if self.duplicate_clusters is not None else None
+
+    def _match_positions(self, doc_id: str, terms) -> List[int]:
+        """Token positions of terms (and, with stemming, of their stem variants) in one document."""
+        positions = set()
+        for term in terms:
+            positions.update(self.inverted_index.get(term, {}).get('postings', {}).get(doc_id, ()))
+        if self.stem_index is not None and self.stemmer is not None:
+            stems = {self.stemmer.stem(term) for term in terms}
+            doc_tokens = self.doc_metadata[doc_id].get('tokens', [])
+            positions.update(i for i, token in enumerate(doc_tokens) if self.stemmer.stem(token) in stems)
+        return sorted(positions)
+
+    def _query_terms(self, expanded: List[tuple]) -> Dict[str, tuple]:
+        """token -> (rows, tf, idf); repeated tokens add their idf, as they add their score."""
+        terms = {}
+        for token, weight in expanded:
+            term_postings = self._term_postings(token)
+            if term_postings is None:
+                continue
+            rows, tf, df = term_postings
+            idf = self._calculate_idf(df) * weight
+            if token in terms:
+                idf += terms[token][2]
+            terms[token] = (rows, tf, idf)
+        return terms
+
+    def _over_budget(self, postings: int, deadline: float = None, postings_budget: int = None) -> bool:
+        """Whether scoring `postings` with the regular scorer would overrun the postings budget or deadline."""
+        if postings_budget is not None and postings > postings_budget:
+            return True
+        return deadline is not None and time.perf_counter() + postings * self.seconds_per_posting >= deadline
+
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None,
+               deadline: float = None, postings_budget: int = None) -> List[Dict[str, Any]]:
+        """
+        deadline (a time.perf_counter() value) and postings_budget bound the
+        search. The regular scorer runs whenever it fits; otherwise the query
+        is scored from the impact-ordered postings, which may stop early, and
+        the returned RankedResults have exact=False.
+        """
+        if is_boolean_query(query):
+            return self.search_boolean(query, top_k=top_k, doc_filter=doc_filter)
+
         query_result = self.processor.preprocess(query)
         query_tokens = query_result['tokens']
+        expanded = self._expand_tokens(query_tokens)
+        terms = self._query_terms(expanded)
+        postings_traversed = sum(len(rows) for rows, _, _ in terms.values())
+
+        bounded = deadline is not None or postings_budget is not None
+        if bounded and self.impact_index is not None and self._over_budget(postings_traversed, deadline,
+                                                                           postings_budget):
+            return self._search_anytime(expanded, terms, top_k, doc_filter, deadline, postings_budget)
+
+        doc_mask = doc_filter_mask(doc_filter, len(self.doc_ids))
+        POSTINGS_TRAVERSED.inc(postings_traversed, engine=type(self).__name__, corpus=self.name.lower())
+        if bounded:
+            ANYTIME_SEARCHES.inc(outcome='regular', corpus=self.name.lower())
+
+        start = time.perf_counter()
+        scores, matched = accumulate(len(self.doc_ids), list(terms.values()), self._bm25_contribution, doc_mask)
+        scores = scores[0]
+        if postings_traversed >= RATE_MIN_POSTINGS:
+            # Moving average of the scoring cost, used to predict whether a query fits its deadline
+            rate = (time.perf_counter() - start) / postings_traversed
+            self.seconds_per_posting += RATE_SMOOTHING * (rate - self.seconds_per_posting)
+
+        results = []
+        for row in top_k_rows(scores, matched, top_k, by_matched=True, cluster_of=self.cluster_of):
+            doc_id = self.doc_ids[row]
+            doc_info = self.doc_metadata[doc_id]
+            matched_tokens = [token for token, (rows, _, _) in terms.items() if contains_row(rows, row)]
+            results.append({
+                'doc_id': doc_id,
+                'score': float(scores[row]),
+                'text': doc_info.get('arabic_original', ''),
+                'metadata': doc_info,
+                'matched_tokens': matched_tokens,
+                'cluster_id': self._cluster_id(doc_id),
+                # Only computed for the returned top-k, for snippets
+                'positions': self._match_positions(doc_id, matched_tokens)
+            })
         
-        scores = defaultdict(float)
-        matched_tokens = defaultdict(set)
-        
-        for token in query_tokens:
-            if token in self.inverted_index:
-                idx_entry = self.inverted_index[token]
-                df = idx_entry['df']
-                idf = self._calculate_idf(df)
-                
-                postings = idx_entry['postings']
-                for doc_id, positions in postings.items():
-                    tf = len(positions)
-                    doc_len = len(self.doc_metadata[doc_id].get('tokens', []))
-                    
-                    score = self._score_bm25(tf, doc_len, idf)
-                    scores[doc_id] += score
-                    matched_tokens[doc_id].add(token)
-        
-        sorted_docs = sorted(
-            scores.items(),
-            key=lambda x: (len(matched_tokens[x[0]]), x[1]),
-            reverse=True
-        )[:top_k]
-        
+        return results
+
+    def _impact_weights(self, expanded: List[tuple]) -> Dict[str, float]:
+        """
+        Impact-index terms and query weights approximating the regular scorer:
+        a token with a stem splits its weight between its surface postings
+        and its stem postings, as its tf is split by stem_weight.
+        """
+        weights = {}
+        for token, weight in expanded:
+            pairs = [(token, weight)]
+            if self._stem_entry(token) is not None:
+                key = stem_key(self.stemmer.stem(token))
+                if key in self.impact_index:
+                    surface_weight = 1 - self.stem_weight if token in self.impact_index else 0.0
+                    pairs = [(token, weight * surface_weight), (key, weight * self.stem_weight)]
+            for term, term_weight in pairs:
+                if term_weight > 0 and term in self.impact_index:
+                    weights[term] = weights.get(term, 0.0) + term_weight
+        return weights
+
+    def _search_anytime(self, expanded: List[tuple], terms: Dict[str, tuple], top_k: int = 10,
+                        doc_filter: DocFilter = None, deadline: float = None,
+                        postings_budget: int = None) -> RankedResults:
+        """
+        Score-at-a-time BM25 over the quantized impacts, highest impacts first,
+        stopping at the deadline or postings budget. Ranked by score alone, so
+        never exact, even when every posting gets scored.
+        """
+        weights = self._impact_weights(expanded)
+        if not weights:
+            return RankedResults(exact=False)
+
+        scores, complete, scored = self.impact_index.search(list(weights.items()), len(self.doc_ids),
+                                                            doc_filter_mask(doc_filter, len(self.doc_ids)),
+                                                            deadline, postings_budget)
+        POSTINGS_TRAVERSED.inc(scored, engine=type(self).__name__, corpus=self.name.lower())
+        ANYTIME_SEARCHES.inc(outcome='complete' if complete else 'truncated', corpus=self.name.lower())
+
+        results = RankedResults(exact=False, postings_scored=scored)
+        for row in top_k_rows(scores, scores > 0, top_k, cluster_of=self.cluster_of):
+            doc_id = self.doc_ids[row]
+            doc_info = self.doc_metadata[doc_id]
+            matched_tokens = [token for token, (rows, _, _) in terms.items() if contains_row(rows, row)]
+            results.append({
+                'doc_id': doc_id,
+                'score': float(scores[row]),
+                'text': doc_info.get('arabic_original', ''),
+                'metadata': doc_info,
+                'matched_tokens': matched_tokens,
+                'cluster_id': self._cluster_id(doc_id),
+                'positions': self._match_positions(doc_id, matched_tokens)
+            })
+        return results
+
+    def _expand_boolean_terms(self, tree, weights: Dict[str, float]):
+        """
+        Replace each unknown term of a parsed boolean query by the OR of its
+        typo corrections; their scoring weights are recorded in weights.
+        """
+        kind = tree[0]
+        if kind == 'term':
+            expanded = self._expand_tokens([tree[1]])
+            if not expanded or expanded == [(tree[1], 1.0)]:
+                return tree
+            weights.update(expanded)
+            return ('or', [('term', term) for term, _ in expanded])
+        if kind == 'not':
+            return ('not', self._expand_boolean_terms(tree[1], weights))
+        return (kind, [self._expand_boolean_terms(child, weights) for child in tree[1]])
+
+    def search_boolean(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
+        """
+        AND / OR / NOT query. Only documents matching the expression are scored,
+        by BM25 over the terms not under a NOT. Terms match like plain search:
+        stem variants count, and an unknown word matches its typo corrections.
+        """
+        tree = parse_boolean_query(query, lambda word: self.processor.preprocess(word)['tokens'])
+        if tree is None:
+            return []
+        weights = {}
+        tree = self._expand_boolean_terms(tree, weights)
+        boolean_index = lazy_boolean_index(self)
+        restrict_to = doc_filter.rows.tolist() if doc_filter is not None else None
+        ordinals = boolean_index.matching_ordinals(tree, restrict_to)
+
+        # Matching documents are scored like plain search: surface and stem postings of the positive terms
+        rows = np.array(ordinals, dtype=np.int64)
+        scores = np.zeros(len(rows))
+        matched_terms = [[] for _ in ordinals]
+        terms = list(dict.fromkeys(positive_terms(tree)))
+        for term in terms:
+            term_postings = self._term_postings(term)
+            if term_postings is None or not len(rows) or not len(term_postings[0]):
+                continue
+            term_rows, tfs, df = term_postings
+            idx = np.minimum(np.searchsorted(term_rows, rows), len(term_rows) - 1)
+            hit = term_rows[idx] == rows
+            idf = self._calculate_idf(df) * weights.get(term, 1.0)
+            scores[hit] += self._bm25_contribution(term_rows[idx[hit]], tfs[idx[hit]], idf)
+            for i in np.flatnonzero(hit).tolist():
+                matched_terms[i].append(term)
+        scored = [(self.doc_ids[row], float(score), matched)
+                  for row, score, matched in zip(rows.tolist(), scores.tolist(), matched_terms)]
+
+        POSTINGS_TRAVERSED.inc(len(ordinals) * max(len(terms), 1), engine=type(self).__name__, corpus=self.name.lower())
+
+        scored.sort(key=lambda x: (len(x[2]), x[1]), reverse=True)
+        if self.duplicate_clusters is not None:
+            scored = collapse_duplicates(scored, lambda x: self.duplicate_clusters.get(x[0], x[0]), top_k)
         results = []
-        for doc_id, score in sorted_docs:
+        for doc_id, score, matched in scored[:top_k]:
             doc_info = self.doc_metadata[doc_id]
             results.append({
                 'doc_id': doc_id,
                 'score': score,
                 'text': doc_info.get('arabic_original', ''),
                 'metadata': doc_info,
-                'matched_tokens': list(matched_tokens[doc_id])
+                'matched_tokens': matched,
+                'cluster_id': self._cluster_id(doc_id),
+                'positions': self._match_positions(doc_id, matched)
             })
-        
         return results
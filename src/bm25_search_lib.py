@@ -1,6 +1,7 @@
 from rank_bm25 import BM25Okapi
 from typing import List, Dict, Any
 from preprocessing import SafeIslamicArabicProcessor
+from filters import DocFilter
 
 
 class BM25SearchEngineLib:
@@ -29,16 +30,22 @@ class BM25SearchEngineLib:
         
         self.bm25 = BM25Okapi(tokenized_corpus)
     
-    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
         query_result = self.processor.preprocess(query)
         query_tokens = query_result['tokens']
         
         if not query_tokens:
             return []
         
-        scores = self.bm25.get_scores(query_tokens)
+        if doc_filter is None:
+            candidates = range(len(self.documents))
+            scores = self.bm25.get_scores(query_tokens)
+        else:
+            # Score only the filtered rows
+            candidates = doc_filter.rows.tolist()
+            scores = dict(zip(candidates, self.bm25.get_batch_scores(query_tokens, candidates)))
         
-        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
+        top_indices = sorted(candidates, key=lambda i: scores[i], reverse=True)[:top_k]
         
         results = []
         for idx in top_indices:
@@ -0,0 +1,122 @@
+import math
+from collections import Counter
+from typing import Any, Dict, List
+import numpy as np
+from preprocessing import SafeIslamicArabicProcessor
+from english_text import EnglishTextProcessor
+from metrics import POSTINGS_TRAVERSED
+from filters import DocFilter
+from frozen_index import (FrozenPostings, accumulate, contains_row, doc_filter_mask, readonly, row_index,
+                          shared_postings, top_k_rows)
+from near_duplicates import cluster_array
+
+# Per-field weight and length normalization (b); the narrator field is short and repeats the English isnad
+FIELD_WEIGHTS = {'arabic': 1.0, 'english': 1.0, 'narrator': 0.5}
+FIELD_B = {'arabic': 0.75, 'english': 0.75, 'narrator': 0.3}
+# Which analyzer tokenizes the query for each field
+FIELD_LANGUAGE = {'arabic': 'ar', 'english': 'en', 'narrator': 'en'}
+
+
+class BM25FSearchEngine:
+    """
+    Field-weighted BM25 (BM25F) over the Arabic text and, where the corpus has
+    them, the English translation and narrator fields (english_text.py).
+
+    A query is tokenized once per language: Arabic tokens are looked up in
+    the Arabic field, English tokens in the English fields. For each term,
+    the length-normalized tf of every field it occurs in is weighted and
+    summed into one pseudo-tf per document, and BM25 saturation is applied
+    to that sum. All fields are scored in one pass over the postings.
+    """
+    def __init__(self, name: str, inverted_index: Dict[str, Any], doc_metadata: Dict[str, Any],
+                 processor: SafeIslamicArabicProcessor, field_indices: Dict[str, dict] = None,
+                 english_processor: EnglishTextProcessor = None, k1: float = 1.2,
+                 field_weights: Dict[str, float] = FIELD_WEIGHTS, field_b: Dict[str, float] = FIELD_B,
+                 duplicate_clusters: Dict[str, str] = None, postings: FrozenPostings = None):
+        self.name = name
+        self.inverted_index = inverted_index
+        self.doc_metadata = doc_metadata
+        self.analyzers = {'ar': processor, 'en': english_processor or EnglishTextProcessor()}
+        self.k1 = k1
+        self.field_weights = field_weights
+        self.duplicate_clusters = duplicate_clusters
+
+        self.N = len(doc_metadata)
+        self.doc_ids = tuple(doc_metadata)
+        row_of = row_index(self.doc_ids)
+        self.cluster_of = cluster_array(duplicate_clusters, self.doc_ids)
+
+        # field -> read-only postings and per-row length norm 1 - b + b * len / avg_len
+        self.fields = {}
+        self.length_norms = {}
+        # The Arabic field reuses the corpus's shared postings when given
+        self.fields['arabic'] = shared_postings(inverted_index, self.doc_ids, postings)
+        for field, index in (field_indices or {}).items():
+            self.fields[field] = FrozenPostings(index, row_of, self.N)
+        for field, field_postings in self.fields.items():
+            lengths = np.bincount(field_postings.rows, weights=field_postings.tfs, minlength=self.N)
+            avg_len = lengths.mean() or 1.0
+            b = field_b.get(field, 0.75)
+            self.length_norms[field] = readonly(1 - b + b * lengths / avg_len)
+
+    def _idf(self, df: int) -> float:
+        return math.log(((self.N - df + 0.5) / (df + 0.5)) + 1)
+
+    def _term_postings(self, language: str, token: str):
+        """(rows, weighted pseudo-tf) of one query token over the fields of its language, or None."""
+        parts = []
+        for field, postings in self.fields.items():
+            if FIELD_LANGUAGE.get(field) != language:
+                continue
+            entry = postings.get(token)
+            if entry is not None:
+                rows, tfs = entry
+                parts.append((rows, self.field_weights.get(field, 1.0) * tfs / self.length_norms[field][rows]))
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        rows, inverse = np.unique(np.concatenate([rows for rows, _ in parts]), return_inverse=True)
+        return rows, np.bincount(inverse, weights=np.concatenate([tfs for _, tfs in parts]))
+
+    def _saturation(self, rows: np.ndarray, pseudo_tfs: np.ndarray, idf: float) -> np.ndarray:
+        return idf * pseudo_tfs * (self.k1 + 1) / (self.k1 + pseudo_tfs)
+
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
+        # (language, token) -> (rows, pseudo-tf, idf); a repeated token counts once per occurrence
+        terms = {}
+        for language, analyzer in self.analyzers.items():
+            for token, count in Counter(analyzer.preprocess(query)['tokens']).items():
+                term_postings = self._term_postings(language, token)
+                if term_postings is not None:
+                    rows, pseudo_tfs = term_postings
+                    terms[(language, token)] = (rows, pseudo_tfs, count * self._idf(len(rows)))
+        if not terms:
+            return []
+
+        POSTINGS_TRAVERSED.inc(sum(len(rows) for rows, _, _ in terms.values()), engine=type(self).__name__,
+                               corpus=self.name.lower())
+        scores, matched = accumulate(self.N, list(terms.values()), self._saturation,
+                                     doc_filter_mask(doc_filter, self.N))
+        scores = scores[0]
+
+        results = []
+        for row in top_k_rows(scores, matched, top_k, by_matched=True, cluster_of=self.cluster_of):
+            doc_id = self.doc_ids[row]
+            doc_info = self.doc_metadata[doc_id]
+            matched_terms = [(language, token) for (language, token), (rows, _, _) in terms.items()
+                             if contains_row(rows, row)]
+            results.append({
+                'doc_id': doc_id,
+                'score': float(scores[row]),
+                'text': doc_info.get('arabic_original', ''),
+                'metadata': doc_info,
+                # Arabic tokens locate the snippet; English matches have no position in the Arabic text
+                'matched_tokens': [token for language, token in matched_terms if language == 'ar'],
+                'matched_fields': [field for field, postings in self.fields.items()
+                                   if any(FIELD_LANGUAGE.get(field) == language and token in postings
+                                          and contains_row(postings.get(token)[0], row)
+                                          for language, token in matched_terms)],
+                'cluster_id': (self.duplicate_clusters or {}).get(doc_id)
+            })
+        return results
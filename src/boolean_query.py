@@ -0,0 +1,284 @@
+"""
+Boolean query mode: AND / OR / NOT operators with parentheses, e.g.
+    الصلاة AND (الزكاة OR الصيام) NOT الحج
+Terms next to each other without an operator are ANDed. With a stem
+index, a term matches every surface form sharing its stem, as in plain
+BM25 search. Operators only count in Arabic queries: an English question
+containing "NOT" is a question, not a boolean query.
+
+Postings are kept as sorted doc-ordinal lists intersected by galloping
+search; high-df terms additionally get a dense bitmap (a Python int) so
+that AND/OR/NOT against them are word-parallel bit operations.
+"""
+import re
+import threading
+from bisect import bisect_left
+from typing import List, Optional, Tuple, Union
+from english_text import detect_language
+
+OPERATORS = {'AND', 'OR', 'NOT'}
+# Terms whose df exceeds N / BITMAP_DF_RATIO get a precomputed bitmap
+BITMAP_DF_RATIO = 16
+
+_TOKEN_RE = re.compile(r'\(|\)|[^\s()]+')
+
+
+def is_boolean_query(query: str) -> bool:
+    tokens = _TOKEN_RE.findall(query)
+    if not any(tok in OPERATORS for tok in tokens):
+        return False
+    # The operators themselves are Latin; the language is judged on the other words
+    return detect_language(' '.join(tok for tok in tokens if tok not in OPERATORS)) != 'en'
+
+
+class BooleanQueryError(ValueError):
+    pass
+
+
+def parse_boolean_query(query: str, normalize_term) -> tuple:
+    """
+    Parse into a tree of ('term', token) / ('and', [..]) / ('or', [..]) / ('not', node).
+    normalize_term maps a raw word to its index tokens (an empty list drops it).
+    """
+    tokens = _TOKEN_RE.findall(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == 'OR':
+            take()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and():
+        children = [parse_unary()]
+        while peek() is not None and peek() not in (')', 'OR'):
+            if peek() == 'AND':
+                take()
+            children.append(parse_unary())
+        children = [c for c in children if c is not None]
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parse_unary():
+        tok = peek()
+        if tok is None:
+            raise BooleanQueryError("Unexpected end of query")
+        if tok == 'NOT':
+            take()
+            child = parse_unary()
+            return ('not', child) if child is not None else None
+        if tok == '(':
+            take()
+            node = parse_or()
+            if peek() != ')':
+                raise BooleanQueryError("Missing closing parenthesis")
+            take()
+            return node
+        if tok in OPERATORS or tok == ')':
+            raise BooleanQueryError(f"Unexpected token: {tok}")
+        terms = normalize_term(take())
+        if not terms:
+            return None
+        return ('term', terms[0]) if len(terms) == 1 else ('and', [('term', t) for t in terms])
+
+    tree = parse_or()
+    if pos != len(tokens):
+        raise BooleanQueryError(f"Unexpected token: {tokens[pos]}")
+    return tree
+
+
+def galloping_intersect(small: List[int], large: List[int]) -> List[int]:
+    """Intersect two sorted lists, galloping through the larger one."""
+    result = []
+    n = len(large)
+    lo = 0
+    for x in small:
+        bound = 1
+        while lo + bound < n and large[lo + bound] < x:
+            bound *= 2
+        lo = bisect_left(large, x, lo, min(lo + bound + 1, n))
+        if lo >= n:
+            break
+        if large[lo] == x:
+            result.append(x)
+            lo += 1
+    return result
+
+
+def _bitmap_from(ordinals: List[int], n: int) -> int:
+    buf = bytearray((n + 7) // 8)
+    for o in ordinals:
+        buf[o >> 3] |= 1 << (o & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def _ordinals_from(bitmap: int, n: int) -> List[int]:
+    buf = bitmap.to_bytes((n + 7) // 8, 'little')
+    out = []
+    for byte_idx, byte in enumerate(buf):
+        while byte:
+            low = byte & -byte
+            out.append((byte_idx << 3) + low.bit_length() - 1)
+            byte ^= low
+    return out
+
+
+# A doc set is either ('list', sorted ordinals) or ('bitmap', int)
+DocSet = Tuple[str, Union[List[int], int]]
+
+
+class BooleanIndex:
+    """
+    Doc-ordinal postings (and bitmaps for high-df terms) derived from an
+    inverted index and, optionally, a stem index with the stemmer that built it.
+    """
+
+    def __init__(self, inverted_index: dict, doc_ids: List[str], stem_index: Optional[dict] = None,
+                 stemmer=None):
+        self.n = len(doc_ids)
+        self.doc_ids = doc_ids
+        ordinal = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self.postings, self.bitmaps = self._doc_sets(inverted_index, ordinal)
+        self.stemmer = stemmer if stem_index is not None else None
+        self.stem_postings, self.stem_bitmaps = self._doc_sets(stem_index or {}, ordinal)
+        self.all_bitmap = (1 << self.n) - 1
+
+    def _doc_sets(self, index: dict, ordinal: dict) -> Tuple[dict, dict]:
+        postings = {}
+        bitmaps = {}
+        threshold = self.n / BITMAP_DF_RATIO
+        for term, entry in index.items():
+            ords = sorted(ordinal[d] for d in entry['postings'] if d in ordinal)
+            postings[term] = ords
+            if len(ords) > threshold:
+                bitmaps[term] = _bitmap_from(ords, self.n)
+        return postings, bitmaps
+
+    def _term_set(self, term: str) -> DocSet:
+        """Documents containing term or, with stems, any word sharing its stem."""
+        postings, bitmaps = self.postings, self.bitmaps
+        if self.stemmer is not None:
+            stem = self.stemmer.stem(term)
+            if stem in self.stem_postings:
+                postings, bitmaps, term = self.stem_postings, self.stem_bitmaps, stem
+        if term in bitmaps:
+            return ('bitmap', bitmaps[term])
+        return ('list', postings.get(term, []))
+
+    def _size(self, s: DocSet) -> int:
+        return len(s[1]) if s[0] == 'list' else self.n
+
+    def _as_bitmap(self, s: DocSet) -> int:
+        return s[1] if s[0] == 'bitmap' else _bitmap_from(s[1], self.n)
+
+    def _as_list(self, s: DocSet) -> List[int]:
+        return s[1] if s[0] == 'list' else _ordinals_from(s[1], self.n)
+
+    def evaluate(self, node) -> DocSet:
+        kind = node[0]
+        if kind == 'term':
+            return self._term_set(node[1])
+        if kind == 'not':
+            return ('bitmap', self.all_bitmap & ~self._as_bitmap(self.evaluate(node[1])))
+        if kind == 'or':
+            sets = [self.evaluate(c) for c in node[1]]
+            if all(s[0] == 'list' for s in sets):
+                return ('list', sorted(set().union(*(s[1] for s in sets))))
+            bitmap = 0
+            for s in sets:
+                bitmap |= self._as_bitmap(s)
+            return ('bitmap', bitmap)
+        return self._evaluate_and(node[1])
+
+    def _evaluate_and(self, children: list) -> DocSet:
+        positives = [self.evaluate(c) for c in children if c[0] != 'not']
+        negatives = [self.evaluate(c[1]) for c in children if c[0] == 'not']
+
+        if not positives:
+            result = ('bitmap', self.all_bitmap)
+        else:
+            positives.sort(key=self._size)
+            lists = [s[1] for s in positives if s[0] == 'list']
+            bitmaps = [s[1] for s in positives if s[0] == 'bitmap']
+            if lists:
+                # Rarest first: every later step only touches the running intersection
+                current = lists[0]
+                for other in lists[1:]:
+                    if not current:
+                        break
+                    current = galloping_intersect(current, other)
+                if bitmaps and current:
+                    combined = bitmaps[0]
+                    for b in bitmaps[1:]:
+                        combined &= b
+                    buf = combined.to_bytes((self.n + 7) // 8, 'little')
+                    current = [o for o in current if buf[o >> 3] >> (o & 7) & 1]
+                result = ('list', current)
+            else:
+                combined = bitmaps[0]
+                for b in bitmaps[1:]:
+                    combined &= b
+                result = ('bitmap', combined)
+
+        for neg in negatives:
+            if result[0] == 'list':
+                if neg[0] == 'bitmap':
+                    buf = neg[1].to_bytes((self.n + 7) // 8, 'little')
+                    result = ('list', [o for o in result[1] if not buf[o >> 3] >> (o & 7) & 1])
+                else:
+                    excluded = set(neg[1])
+                    result = ('list', [o for o in result[1] if o not in excluded])
+            else:
+                result = ('bitmap', result[1] & ~self._as_bitmap(neg))
+        return result
+
+    def matching_ordinals(self, tree, restrict_to: Optional[List[int]] = None) -> List[int]:
+        result = self.evaluate(tree)
+        if restrict_to is not None:
+            result = self._evaluate_and_sets(result, ('list', list(restrict_to)))
+        return self._as_list(result)
+
+    def _evaluate_and_sets(self, a: DocSet, b: DocSet) -> DocSet:
+        if a[0] == 'list' and b[0] == 'list':
+            small, large = sorted((a[1], b[1]), key=len)
+            return ('list', galloping_intersect(small, large))
+        return ('bitmap', self._as_bitmap(a) & self._as_bitmap(b))
+
+
+def positive_terms(tree) -> List[str]:
+    """Terms that contribute to ranking (everything not under a NOT)."""
+    if tree is None:
+        return []
+    kind = tree[0]
+    if kind == 'term':
+        return [tree[1]]
+    if kind == 'not':
+        return []
+    terms = []
+    for child in tree[1]:
+        terms.extend(positive_terms(child))
+    return terms
+
+
+_lock = threading.Lock()
+
+
+def lazy_boolean_index(engine) -> BooleanIndex:
+    """Build the engine's BooleanIndex on first use; most traffic never needs it."""
+    if engine._boolean_index is None:
+        with _lock:
+            if engine._boolean_index is None:
+                engine._boolean_index = BooleanIndex(engine.inverted_index, list(engine.doc_metadata),
+                                                     getattr(engine, 'stem_index', None),
+                                                     getattr(engine, 'stemmer', None))
+    return engine._boolean_index
@@ -7,8 +7,14 @@ from indexing import (
     build_inverted_index_hadith,
     save_inverted_index
 )
+from filters import build_filter_tables, save_filter_tables
+from term_dictionary import build_term_dictionary, save_term_dictionary
+from stemming import LightStemmer, build_stem_index, save_stem_index
+from near_duplicates import build_duplicate_clusters, save_duplicate_clusters
+from english_text import EnglishTextProcessor, build_field_indices, save_field_indices
+from impact_index import build_impact_index, save_impact_index
 
-def build_indices():
+def build_indices(output_dir: str = 'indices'):
     """
     Build and save all indices for Quran and Hadith.
     This includes the forward indices (documents) and inverted indices.
@@ -20,15 +26,43 @@ def build_indices():
     hadith_index = build_hadith_index('hadith', processor)
     
  
-    save_index(quran_index, "quran")
-    save_index(hadith_index, "hadith")
+    save_index(quran_index, "quran", output_dir)
+    save_index(hadith_index, "hadith", output_dir)
 
     quran_inverted_index = build_inverted_index_quran(quran_index)
     hadith_inverted_index = build_inverted_index_hadith(hadith_index)
 
-    save_inverted_index(quran_inverted_index, "quran")
-    save_inverted_index(hadith_inverted_index, "hadith")
+    save_inverted_index(quran_inverted_index, "quran", output_dir)
+    save_inverted_index(hadith_inverted_index, "hadith", output_dir)
+
+    save_filter_tables(build_filter_tables(quran_index), "quran", output_dir)
+    save_filter_tables(build_filter_tables(hadith_index), "hadith", output_dir)
+
+    save_term_dictionary(build_term_dictionary(quran_inverted_index), "quran", output_dir)
+    save_term_dictionary(build_term_dictionary(hadith_inverted_index), "hadith", output_dir)
+
+    stemmer = LightStemmer(processor)
+    quran_stem_index = build_stem_index(quran_inverted_index, stemmer)
+    hadith_stem_index = build_stem_index(hadith_inverted_index, stemmer)
+    save_stem_index(quran_stem_index, "quran", output_dir)
+    save_stem_index(hadith_stem_index, "hadith", output_dir)
+
+    save_duplicate_clusters(build_duplicate_clusters(quran_index), "quran", output_dir)
+    save_duplicate_clusters(build_duplicate_clusters(hadith_index), "hadith", output_dir)
+
+    # English translation and narrator postings (empty for the Arabic-only Quran)
+    english_processor = EnglishTextProcessor()
+    save_field_indices(build_field_indices(quran_index, english_processor), "quran", output_dir)
+    save_field_indices(build_field_indices(hadith_index, english_processor), "hadith", output_dir)
+
+    # Impact-ordered, quantized BM25 postings for deadline-bounded search
+    save_impact_index(build_impact_index(quran_inverted_index, quran_index, stem_index=quran_stem_index),
+                      "quran", output_dir)
+    save_impact_index(build_impact_index(hadith_inverted_index, hadith_index, stem_index=hadith_stem_index),
+                      "hadith", output_dir)
     
 
 if __name__ == "__main__":
-    build_indices()
+    import sys
+    # Optional output directory, e.g. a new version to hot-reload: python build_indices.py indices_v2
+    build_indices(sys.argv[1] if len(sys.argv) > 1 else 'indices')
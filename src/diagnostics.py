@@ -0,0 +1,222 @@
+"""
+Memory and index diagnostics for a loaded engine set.
+
+Usage:
+    python diagnostics.py                       # shared index structures and every built engine
+    python diagnostics.py --build-all --top 20  # also build the deferred (_lib / lsa) engines first
+    python diagnostics.py --json memory.json    # write the full report
+
+Engines share the index data (records, inverted and stem indices, postings arrays), so
+that data is measured once, under "indices". Each engine's "bytes" are what
+it holds beyond that shared data. The same report is served at
+GET /admin/memory when MUSTADIL_ADMIN=1.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import types
+from typing import Dict, Optional, Set
+import numpy as np
+from startup import LazyEngine, is_unbuilt
+
+# Never followed while measuring: shared interpreter objects, not data
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+               types.MethodType, types.CodeType, types.FrameType)
+
+# Loaded structures shared by the engines, measured before any engine
+SHARED_KEYS = ('processor', 'quran_index', 'hadith_index', 'quran_inverted_index', 'hadith_inverted_index',
+               'quran_filters', 'hadith_filters', 'quran_terms', 'hadith_terms', 'quran_clusters', 'hadith_clusters',
+               'quran_fields', 'hadith_fields', 'quran_postings', 'hadith_postings', 'quran_stem_postings',
+               'hadith_stem_postings')
+
+DF_BUCKETS = ((1, 1), (2, 10), (11, 100), (101, 1000), (1001, None))
+
+
+def deep_sizeof(obj, seen: Optional[Set[int]] = None) -> int:
+    """
+    Bytes reachable from obj that are not already in seen (which is updated).
+    NumPy arrays count their buffer only if they own it.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SKIP_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, np.ndarray):
+            # Views point at their base, which is measured through whoever owns it
+            if current.base is not None:
+                stack.append(current.base)
+            continue
+        if isinstance(current, (str, bytes, int, float, bool)) or current is None:
+            continue
+        stack.extend(gc.get_referents(current))
+    return total
+
+
+def index_stats(inverted_index: Dict[str, dict], top: int = 10) -> dict:
+    """Vocabulary, postings and df distribution of a positional (or stem) index."""
+    dfs = np.array([entry['df'] for entry in inverted_index.values()], dtype=np.int64)
+    if not len(dfs):
+        return {'vocabulary': 0, 'postings': 0}
+    buckets = {}
+    for lo, hi in DF_BUCKETS:
+        label = f"{lo}" if lo == hi else (f"{lo}-{hi}" if hi else f">{lo - 1}")
+        mask = (dfs >= lo) if hi is None else (dfs >= lo) & (dfs <= hi)
+        buckets[label] = int(mask.sum())
+    longest = sorted(inverted_index.items(), key=lambda item: item[1]['df'], reverse=True)[:top]
+    return {
+        'vocabulary': len(dfs),
+        'postings': int(dfs.sum()),
+        'df_percentiles': {f"p{p}": float(np.percentile(dfs, p)) for p in (50, 90, 99)},
+        'df_max': int(dfs.max()),
+        'df_buckets': buckets,
+        'longest_postings': [[term, entry['df']] for term, entry in longest],
+    }
+
+
+def engine_stats(engine) -> dict:
+    """Vocabulary and postings of an engine, from whichever structure it scores with."""
+    fields = getattr(engine, 'fields', None)
+    if isinstance(fields, dict):
+        return {
+            'vocabulary': sum(len(postings.term_ids) for postings in fields.values()),
+            'postings': sum(int(len(postings.rows)) for postings in fields.values()),
+            'fields': {field: {'vocabulary': len(postings.term_ids), 'postings': int(len(postings.rows))}
+                       for field, postings in fields.items()},
+        }
+    postings = getattr(engine, 'postings', None)
+    if postings is not None and hasattr(postings, 'term_ids'):
+        stats = {'vocabulary': len(postings.term_ids), 'postings': int(len(postings.rows))}
+        impact_index = getattr(engine, 'impact_index', None)
+        if impact_index is not None:
+            stats['impact_postings'] = int(len(impact_index.rows))
+        return stats
+    vectorizer = getattr(engine, 'vectorizer', None)
+    if vectorizer is not None:
+        stats = {'vocabulary': len(vectorizer.vocabulary_)}
+        if getattr(engine, 'doc_vectors', None) is not None:
+            stats['postings'] = int(engine.doc_vectors.nnz)
+        if getattr(engine, 'embeddings', None) is not None:
+            stats['embedding_shape'] = list(engine.embeddings.shape)
+        return stats
+    bm25 = getattr(engine, 'bm25', None)
+    if bm25 is not None:
+        return {'vocabulary': len(bm25.idf), 'postings': sum(len(freqs) for freqs in bm25.doc_freqs)}
+    if hasattr(engine, 'shards'):
+        return {'shards': len(engine.shards)}
+    return {}
+
+
+def memory_report(engines: Dict[str, object], top: int = 10) -> dict:
+    """Bytes and index statistics of the shared index structures and each engine."""
+    seen = set()
+    report = engines.get('load_report')
+    timings = report.as_dict() if report is not None else {}
+    load_times = timings.get('engine_build', {})
+
+    indices = {}
+    for key in SHARED_KEYS:
+        if key not in engines:
+            continue
+        indices[key] = {'bytes': deep_sizeof(engines[key], seen)}
+        if key.endswith('_inverted_index'):
+            indices[key].update(index_stats(engines[key], top))
+
+    # Stem indices are only reachable through the BM25 engines
+    for corpus in ('quran', 'hadith'):
+        stem_index = getattr(engines.get(f'bm25_{corpus}'), 'stem_index', None)
+        if stem_index is not None:
+            indices[f'{corpus}_stem_index'] = {'bytes': deep_sizeof(stem_index, seen),
+                                               **index_stats(stem_index, top)}
+
+    engine_rows = {}
+    for key, engine in engines.items():
+        if key in SHARED_KEYS or not (isinstance(engine, LazyEngine) or hasattr(engine, 'search')):
+            continue
+        if is_unbuilt(engine):
+            engine_rows[key] = {'built': False}
+            continue
+        target = engine.get() if isinstance(engine, LazyEngine) else engine
+        engine_rows[key] = {
+            'built': True,
+            'bytes': deep_sizeof(target, seen),
+            'load_s': load_times.get(key),
+            **engine_stats(target),
+        }
+
+    return {
+        'indices': indices,
+        'engines': engine_rows,
+        'total_bytes': sum(row['bytes'] for row in indices.values())
+        + sum(row.get('bytes', 0) for row in engine_rows.values()),
+        'index_load_s': timings.get('index_load', {}),
+        'rss_bytes': _rss_bytes(),
+    }
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mb(n: Optional[int]) -> str:
+    return f"{n / 2 ** 20:9.1f}" if n is not None else f"{'-':>9}"
+
+
+def print_report(report: dict):
+    print(f"{'index structure':<26}{'MB':>9}{'terms':>10}{'postings':>11}{'df p50/p99/max':>20}")
+    for key, row in report['indices'].items():
+        df = f"{row['df_percentiles']['p50']:.0f}/{row['df_percentiles']['p99']:.0f}/{row['df_max']}" \
+            if 'df_percentiles' in row else ''
+        print(f"{key:<26}{_mb(row['bytes'])}{row.get('vocabulary', ''):>10}{row.get('postings', ''):>11}{df:>20}")
+    print(f"\n{'engine':<26}{'MB':>9}{'terms':>10}{'postings':>11}{'build s':>9}")
+    for key, row in report['engines'].items():
+        if not row['built']:
+            print(f"{key:<26}{'(not built)':>20}")
+            continue
+        load_s = f"{row['load_s']:.2f}" if row.get('load_s') is not None else '-'
+        print(f"{key:<26}{_mb(row['bytes'])}{row.get('vocabulary', ''):>10}{row.get('postings', ''):>11}{load_s:>9}")
+    print(f"\ntotal measured: {_mb(report['total_bytes']).strip()} MB   process RSS: {_mb(report['rss_bytes']).strip()} MB")
+    for key, row in report['indices'].items():
+        if row.get('longest_postings'):
+            terms = ', '.join(f"{term} ({df})" for term, df in row['longest_postings'])
+            print(f"longest postings in {key}: {terms}")
+            print(f"  df buckets: {row['df_buckets']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report memory use and index statistics of the engines")
+    parser.add_argument("--indices-dir", default="indices")
+    parser.add_argument("--build-all", action="store_true", help="Build the deferred engines before measuring")
+    parser.add_argument("--top", type=int, default=10, help="Longest postings lists to list per index")
+    parser.add_argument("--json", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    from load_engines import load_engines_fast
+    engines = load_engines_fast(args.indices_dir)
+    if args.build_all:
+        for engine in engines.values():
+            if isinstance(engine, LazyEngine):
+                engine.get()
+
+    start = time.perf_counter()
+    report = memory_report(engines, args.top)
+    print_report(report)
+    print(f"(measured in {time.perf_counter() - start:.1f}s)")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
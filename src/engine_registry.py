@@ -0,0 +1,213 @@
+"""
+Versioned engine sets with zero-downtime reload.
+
+Requests take a reference on the current EngineSet for their whole duration.
+A reload builds and warms a new set on a background thread, swaps it in
+atomically, and releases the old set once its in-flight searches finish.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from metrics import REGISTRY
+from startup import is_unbuilt
+
+logger = logging.getLogger(__name__)
+
+# Run through every engine before a new set takes traffic
+WARMUP_QUERIES = ("الصلاة", "الصبر على البلاء", "رسول الله")
+
+ENGINE_RELOADS = REGISTRY.counter(
+    'mustadil_engine_reloads_total', 'Engine set reloads by outcome.', ('outcome',))
+ENGINE_SETS_DRAINING = REGISTRY.gauge(
+    'mustadil_engine_sets_draining', 'Retired engine sets still serving in-flight requests.')
+
+
+def index_version(indices_dir: str) -> str:
+    """
+    Version of an index directory: a hash of the name, size and modification
+    time of every file in it (JSON indices, impact .npz, ...).
+    """
+    entries = sorted((entry for entry in os.scandir(indices_dir) if entry.is_file()),
+                     key=lambda entry: entry.name) if os.path.isdir(indices_dir) else []
+    if not entries:
+        return f"{indices_dir}@missing"
+    digest = hashlib.sha1()
+    for entry in entries:
+        stat = entry.stat()
+        digest.update(f"{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return f"{indices_dir}@{digest.hexdigest()[:12]}"
+
+
+class EngineSet:
+    """One loaded generation of engines plus a count of the requests using it."""
+
+    def __init__(self, engines: Dict[str, object], indices_dir: str, version: str):
+        self.engines = engines
+        self.indices_dir = indices_dir
+        self.version = version
+        self.loaded_at = time.time()
+        self._refs = 0
+        self._drained = threading.Condition()
+
+    def acquire(self):
+        with self._drained:
+            self._refs += 1
+
+    def release(self):
+        with self._drained:
+            self._refs -= 1
+            if self._refs == 0:
+                self._drained.notify_all()
+
+    def wait_drained(self, timeout: Optional[float] = None) -> bool:
+        with self._drained:
+            return self._drained.wait_for(lambda: self._refs == 0, timeout=timeout)
+
+
+def warm_up(engines: Dict[str, object], queries=WARMUP_QUERIES):
+    """
+    Run a few searches through every built engine so the first real request
+    pays no lazy setup. Deferred engines nobody has used are left unbuilt.
+    """
+    for key, engine in engines.items():
+        if is_unbuilt(engine) or not hasattr(engine, 'search'):
+            continue
+        for query in queries:
+            try:
+                engine.search(query, top_k=5)
+            except Exception:
+                logger.exception("Warm-up query failed on %s", key)
+                raise
+
+
+class EngineRegistry:
+    def __init__(self, loader: Callable[[str], Dict[str, object]], indices_dir: str = 'indices',
+                 drain_timeout: float = 60.0):
+        self.loader = loader
+        self.indices_dir = indices_dir
+        self.drain_timeout = drain_timeout
+        self._current: Optional[EngineSet] = None
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def load(self, indices_dir: Optional[str] = None):
+        """Synchronous (startup) load."""
+        self._swap(self._build(indices_dir or self.indices_dir))
+
+    def _build(self, indices_dir: str) -> EngineSet:
+        version = index_version(indices_dir)
+        engines = self.loader(indices_dir)
+        report = engines.get('load_report')
+        if report is not None:
+            with report.timed('warm_up', 'all'):
+                warm_up(engines)
+            logger.info("Engines loaded from %s: %s", indices_dir, report.as_dict())
+        else:
+            warm_up(engines)
+        return EngineSet(engines, indices_dir, version)
+
+    def _swap(self, new_set: EngineSet) -> Optional[EngineSet]:
+        with self._swap_lock:
+            old_set, self._current = self._current, new_set
+            self.indices_dir = new_set.indices_dir
+        return old_set
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._current.version if self._current else None
+
+    def current(self) -> Dict[str, object]:
+        """The current engines, without holding a reference (for stateless helpers like the processor)."""
+        return self._current.engines
+
+    @contextmanager
+    def acquire(self):
+        """Pin the current engine set for the duration of a request."""
+        with self._swap_lock:
+            engine_set = self._current
+            engine_set.acquire()
+        try:
+            yield engine_set.engines
+        finally:
+            engine_set.release()
+
+    def reloading(self) -> bool:
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def reload(self, indices_dir: Optional[str] = None) -> bool:
+        """Start a background reload; False if one is already running."""
+        with self._reload_lock:
+            if self.reloading():
+                return False
+            self._reload_thread = threading.Thread(
+                target=self._reload, args=(indices_dir or self.indices_dir,), name="engine-reload", daemon=True)
+            self._reload_thread.start()
+            return True
+
+    def _reload(self, indices_dir: str):
+        try:
+            new_set = self._build(indices_dir)
+        except Exception as e:
+            # The current set keeps serving
+            logger.exception("Engine reload from %s failed", indices_dir)
+            self.last_error = f"{type(e).__name__}: {e}"
+            ENGINE_RELOADS.inc(outcome="error")
+            return
+        self.last_error = None
+        old_set = self._swap(new_set)
+        ENGINE_RELOADS.inc(outcome="success")
+        logger.info("Engines swapped to %s", new_set.version)
+        if old_set is None:
+            return
+        ENGINE_SETS_DRAINING.inc()
+        if not old_set.wait_drained(self.drain_timeout):
+            logger.warning("Engine set %s still in use after %ss; releasing anyway", old_set.version,
+                           self.drain_timeout)
+        ENGINE_SETS_DRAINING.dec()
+        # Stop engines that own resources (e.g. shard worker processes), then drop
+        # the registry's references so the old indices can be garbage collected
+        for engine in old_set.engines.values():
+            if not is_unbuilt(engine) and hasattr(engine, 'close'):
+                engine.close()
+        old_set.engines = {}
+
+    def status(self) -> dict:
+        report = self._current.engines.get('load_report') if self._current else None
+        return {
+            "version": self.version,
+            "indices_dir": self.indices_dir,
+            "loaded_at": self._current.loaded_at if self._current else None,
+            "reloading": self.reloading(),
+            "last_error": self.last_error,
+            "startup": report.as_dict() if report is not None else None,
+        }
+
+    def watch(self, interval: float = 10.0):
+        """
+        Poll the index directory and reload when its version changes. A change
+        must be seen on two consecutive polls, so a build still writing files
+        is not picked up half way.
+        """
+        def poll():
+            pending = None
+            while True:
+                time.sleep(interval)
+                try:
+                    version = index_version(self.indices_dir)
+                except OSError:
+                    continue
+                if version == self.version or self.reloading():
+                    pending = None
+                elif version == pending:
+                    pending = None
+                    self.reload()
+                else:
+                    pending = version
+
+        threading.Thread(target=poll, name="index-watch", daemon=True).start()
@@ -0,0 +1,134 @@
+"""
+English text of the hadith records as searchable fields.
+
+EnglishTextProcessor is the English counterpart of SafeIslamicArabicProcessor:
+it folds accents and transliteration marks (A'isha -> aisha), lowercases,
+drops stop words and strips plural endings (S-stemmer). At index time, two
+field indices are built from each record, in the same shape as the Arabic
+inverted index:
+
+    english   the full English translation
+    narrator  the record's narrator or, when that is empty (most of Malik),
+              the English isnad: the text before the first "that" / "said"
+
+detect_language() tells English questions from Arabic ones, so English
+questions can skip LLM query generation.
+"""
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List
+
+# Fields built by build_field_indices, in addition to the Arabic 'tokens'
+ENGLISH_FIELDS = ('english', 'narrator')
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been before being but by can could did do does
+for from had has have he her him his how i if in into is it its me my no not of on or our she so than that
+the their them then there these they this those to up upon us was we were what when where which while who
+whom why will with would you your al
+""".split())
+
+_APOSTROPHES = re.compile(r"['`‘’ʻʼʾʿ]")
+_WORDS = re.compile(r'[a-z0-9]+')
+# Case-sensitive: "Said" is also a narrator's name
+_ISNAD_END = re.compile(r'\b(?:that|said|say|says)\b|[:"]')
+# Longest English isnad taken when no "that" / "said" ends it
+ISNAD_MAX_WORDS = 40
+
+
+class EnglishTextProcessor:
+    def __init__(self, stopwords=STOPWORDS):
+        self.stopwords = stopwords
+
+    def normalize(self, text: str) -> str:
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+        return _APOSTROPHES.sub('', text).lower()
+
+    def stem(self, token: str) -> str:
+        """S-stemmer: ies -> y, es -> e, s -> '' (not after s, u, or in very short words)."""
+        if len(token) <= 3 or not token.endswith('s'):
+            return token
+        if token.endswith('ies') and not token.endswith(('eies', 'aies')):
+            return token[:-3] + 'y'
+        if token.endswith('es') and not token.endswith(('aes', 'ees', 'oes')):
+            return token[:-1]
+        if token.endswith(('ss', 'us')):
+            return token
+        return token[:-1]
+
+    def tokenize(self, text: str) -> List[str]:
+        return [self.stem(t) for t in _WORDS.findall(text) if t not in self.stopwords]
+
+    def preprocess(self, text: str) -> Dict[str, Any]:
+        normalized = self.normalize(text)
+        tokens = self.tokenize(normalized)
+        return {
+            'original': text,
+            'normalized': normalized,
+            'tokens': tokens,
+            'clean': ' '.join(tokens)
+        }
+
+
+def detect_language(text: str) -> str:
+    """'en' when Latin letters clearly outnumber Arabic ones, else 'ar'."""
+    arabic = sum(1 for c in text if '\u0600' <= c <= '\u06ff')
+    latin = sum(1 for c in text if c.isascii() and c.isalpha())
+    return 'en' if latin >= 3 and latin > 2 * arabic else 'ar'
+
+
+def narrator_text(record: dict) -> str:
+    narrator = record.get('narrator') or ''
+    if narrator.strip():
+        return narrator
+    english = record.get('english_text') or ''
+    match = _ISNAD_END.search(english)
+    isnad = english[:match.start()] if match else english
+    return ' '.join(isnad.split()[:ISNAD_MAX_WORDS])
+
+
+def _field_text(record: dict, field: str) -> str:
+    if field == 'narrator':
+        return narrator_text(record)
+    return record.get('english_text') or ''
+
+
+def build_field_indices(index_data: list, processor: EnglishTextProcessor) -> Dict[str, dict]:
+    """
+    Positional postings per English field, keyed like the Arabic index:
+    {field: {term: {'df': n, 'postings': {doc_id: [positions]}}}}.
+    Empty for a corpus without English text.
+    """
+    if not any(record.get('english_text') for record in index_data):
+        return {}
+    fields = {}
+    for field in ENGLISH_FIELDS:
+        postings = defaultdict(lambda: defaultdict(list))
+        for record in index_data:
+            doc_id = str(record.get('hadith_id', 'unknown'))
+            for position, term in enumerate(processor.preprocess(_field_text(record, field))['tokens']):
+                postings[term][doc_id].append(position)
+        fields[field] = {
+            term: {'df': len(docs), 'postings': dict(docs)}
+            for term, docs in postings.items()
+        }
+    return fields
+
+
+def save_field_indices(field_indices: Dict[str, dict], name: str, output_dir: str = 'indices'):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(f'{output_dir}/{name}_fields.json', 'w', encoding='utf-8') as f:
+        json.dump(field_indices, f, ensure_ascii=False)
+
+
+def load_field_indices(index_data: list, processor: EnglishTextProcessor, name: str,
+                       input_dir: str = 'indices') -> Dict[str, dict]:
+    path = f'{input_dir}/{name}_fields.json'
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return build_field_indices(index_data, processor)
@@ -0,0 +1,167 @@
+"""
+Metadata filters (surah / verse range, hadith book / chapter) resolved
+against precomputed row-range tables built at index time.
+
+Rows are positions in the forward index (quran_index.json / hadith_index.json),
+which is the order every engine sees its documents in.
+"""
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+
+
+class DocFilter:
+    """A resolved filter: matching rows (sorted) for matrix engines and their doc ids for postings engines."""
+    __slots__ = ('rows', 'doc_ids')
+
+    def __init__(self, rows: np.ndarray, doc_ids: frozenset):
+        self.rows = rows
+        self.doc_ids = doc_ids
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+# Excludes a corpus entirely, e.g. hadith when only a surah filter is given
+EMPTY_FILTER = DocFilter(np.empty(0, dtype=np.int64), frozenset())
+
+
+def doc_id_of(doc: dict, idx: int) -> str:
+    if 'chapter' in doc and 'verse' in doc:
+        return f"{doc['chapter']}_{doc['verse']}"
+    if 'hadith_id' in doc:
+        return str(doc['hadith_id'])
+    return str(idx)
+
+
+def _row_ranges(rows: List[int]) -> List[List[int]]:
+    """Run-length encode sorted rows as [start, end) ranges."""
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] = row + 1
+        else:
+            ranges.append([row, row + 1])
+    return ranges
+
+
+def build_filter_tables(index_data: list) -> Dict[str, Dict[str, List[List[int]]]]:
+    """Build the row-range tables for one corpus (run at index build time)."""
+    groups = {'chapter': {}, 'book': {}, 'book_chapter': {}}
+    for row, record in enumerate(index_data):
+        if 'verse' in record:
+            groups['chapter'].setdefault(str(record['chapter']), []).append(row)
+        if 'book' in record:
+            groups['book'].setdefault(record['book'], []).append(row)
+            groups['book_chapter'].setdefault(f"{record['book']}|{record.get('chapter_id')}", []).append(row)
+    return {
+        field: {key: _row_ranges(rows) for key, rows in table.items()}
+        for field, table in groups.items() if table
+    }
+
+
+def save_filter_tables(tables: dict, name: str, output_dir: str = 'indices'):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(f'{output_dir}/{name}_filters.json', 'w', encoding='utf-8') as f:
+        json.dump(tables, f, ensure_ascii=False)
+
+
+def load_filter_tables(documents: list, name: str, input_dir: str = 'indices') -> 'FilterTables':
+    path = f'{input_dir}/{name}_filters.json'
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            tables = json.load(f)
+    else:
+        tables = build_filter_tables(documents)
+    return FilterTables(tables, documents)
+
+
+class FilterTables:
+    """
+    Resolves filter specs such as {'chapter': 2, 'verse_from': 1, 'verse_to': 20}
+    or {'book': 'Muwatta Malik', 'chapter_id': 3} into a DocFilter.
+    """
+    FIELDS = ('chapter', 'verse_from', 'verse_to', 'book', 'chapter_id')
+
+    def __init__(self, tables: dict, documents: list):
+        self.tables = tables
+        self.documents = documents
+        self.doc_ids = [doc_id_of(doc, idx) for idx, doc in enumerate(documents)]
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _rows_for(self, field: str, key: str) -> np.ndarray:
+        ranges = self.tables.get(field, {}).get(key, [])
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+    def resolve(self, spec: Optional[dict]) -> Optional[DocFilter]:
+        """None for an empty spec (no filtering); otherwise a cached DocFilter."""
+        spec = {k: v for k, v in (spec or {}).items() if k in self.FIELDS and v is not None}
+        if not spec:
+            return None
+        key = tuple(sorted((k, str(v)) for k, v in spec.items()))
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        rows = None
+        if 'chapter' in spec:
+            rows = self._rows_for('chapter', str(spec['chapter']))
+            if 'verse_from' in spec or 'verse_to' in spec:
+                lo = int(spec.get('verse_from', 1))
+                hi = int(spec.get('verse_to', 10 ** 9))
+                rows = np.array([r for r in rows if lo <= int(self.documents[r]['verse']) <= hi], dtype=np.int64)
+        if 'book' in spec:
+            if 'chapter_id' in spec:
+                book_rows = self._rows_for('book_chapter', f"{spec['book']}|{spec['chapter_id']}")
+            else:
+                book_rows = self._rows_for('book', spec['book'])
+            rows = book_rows if rows is None else np.intersect1d(rows, book_rows)
+        if rows is None:
+            # chapter_id alone: match it in every book
+            prefix_rows = [
+                self._rows_for('book_chapter', key)
+                for key in self.tables.get('book_chapter', {})
+                if key.rsplit('|', 1)[-1] == str(spec.get('chapter_id'))
+            ]
+            rows = np.sort(np.concatenate(prefix_rows)) if prefix_rows else np.empty(0, dtype=np.int64)
+
+        doc_filter = DocFilter(rows, frozenset(self.doc_ids[r] for r in rows))
+        with self._lock:
+            self._cache[key] = doc_filter
+        return doc_filter
+
+
+
+def filters_from_params(surah=None, verse_from=None, verse_to=None, book=None, chapter_id=None) -> dict:
+    """
+    Per-corpus filter specs from the /search query parameters.
+    Raises ValueError for a verse range without a surah, which would otherwise be ignored.
+    """
+    if surah is None and (verse_from is not None or verse_to is not None):
+        raise ValueError("verse_from / verse_to need a surah")
+    return {
+        'quran': {'chapter': surah, 'verse_from': verse_from, 'verse_to': verse_to} if surah is not None else None,
+        'hadith': {'book': book, 'chapter_id': chapter_id} if book is not None or chapter_id is not None else None,
+    }
+
+
+def resolve_doc_filters(engines: dict, filters: Optional[dict]) -> dict:
+    """
+    Resolve per-corpus filter specs against the precomputed tables.
+    Filtering only one corpus excludes the other one.
+    """
+    filters = filters or {}
+    doc_filters = {
+        corpus: engines[f'{corpus}_filters'].resolve(spec)
+        for corpus, spec in filters.items() if spec
+    }
+    if len(doc_filters) == 1:
+        other = 'hadith' if 'quran' in doc_filters else 'quran'
+        doc_filters[other] = EMPTY_FILTER
+    return doc_filters
@@ -0,0 +1,184 @@
+"""
+Read-only postings in CSR form and a sectioned scoring loop.
+
+FrozenPostings stores every term's postings as slices of flat NumPy arrays
+(doc rows sorted per term, tf values) marked read-only, so any number of
+threads can read them without locks. accumulate() splits a query's postings
+by doc-row range into sections; each section accumulates into its own
+arrays, and the NumPy work inside a section releases the GIL, so a long
+query can use several cores. Nothing is shared for writing, which also
+keeps it correct on free-threaded CPython.
+
+Rows are positions in the forward index, the same order as doc_metadata.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+
+# Postings per section below which splitting costs more than it saves
+SECTION_MIN_POSTINGS = 20_000
+SCORING_THREADS = int(os.getenv("MUSTADIL_SCORING_THREADS", str(os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+_serial: ContextVar[bool] = ContextVar('serial_scoring', default=False)
+
+
+def _scoring_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix="scoring")
+        return _pool
+
+
+@contextmanager
+def serial_scoring():
+    """Score on the calling thread only in this context, e.g. while a profiler is attached to it."""
+    token = _serial.set(True)
+    try:
+        yield
+    finally:
+        _serial.reset(token)
+
+
+def readonly(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+class FrozenPostings:
+    """Immutable CSR postings: term -> (sorted doc rows, tf) as read-only array views."""
+    __slots__ = ('term_ids', 'indptr', 'rows', 'tfs', 'df', 'n_docs')
+
+    def __init__(self, index: Dict[str, dict], row_of: Mapping[str, int], n_docs: int):
+        term_ids = {}
+        lengths = []
+        all_rows = []
+        all_tfs = []
+        dfs = []
+        for term, entry in index.items():
+            # Positional postings hold a positions list, stem postings a tf count
+            pairs = sorted(
+                (row_of[doc_id], value if isinstance(value, int) else len(value))
+                for doc_id, value in entry['postings'].items() if doc_id in row_of
+            )
+            term_ids[term] = len(term_ids)
+            lengths.append(len(pairs))
+            all_rows.extend(row for row, _ in pairs)
+            all_tfs.extend(tf for _, tf in pairs)
+            dfs.append(entry['df'])
+
+        self.term_ids = MappingProxyType(term_ids)
+        self.indptr = readonly(np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))))
+        self.rows = readonly(np.array(all_rows, dtype=np.int32))
+        self.tfs = readonly(np.array(all_tfs, dtype=np.float32))
+        self.df = readonly(np.array(dfs, dtype=np.int64))
+        self.n_docs = n_docs
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.term_ids
+
+    def get(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return None
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.rows[start:end], self.tfs[start:end]
+
+    def df_of(self, term: str) -> int:
+        return int(self.df[self.term_ids[term]])
+
+    def entry_weights(self, term_weights: np.ndarray) -> np.ndarray:
+        """A per-term array expanded to one value per postings entry."""
+        return np.repeat(term_weights, np.diff(self.indptr))
+
+
+def doc_filter_mask(doc_filter, n_docs: int) -> Optional[np.ndarray]:
+    if doc_filter is None:
+        return None
+    mask = np.zeros(n_docs, dtype=bool)
+    mask[doc_filter.rows] = True
+    return mask
+
+
+# (rows, tfs, per-term context) for one query term
+TermPostings = Tuple[np.ndarray, np.ndarray, object]
+
+
+def accumulate(n_docs: int, postings: Sequence[TermPostings],
+               contribution: Callable[[np.ndarray, np.ndarray, object], np.ndarray],
+               doc_mask: Optional[np.ndarray] = None, n_outputs: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sum contribution(rows, tfs, ctx) over all query terms into per-doc scores
+    (shape (n_outputs, n_docs)) and count the terms matching each doc.
+    Terms must be distinct, and rows within a term sorted and unique.
+    """
+    total = sum(len(rows) for rows, _, _ in postings)
+    n_sections = 1 if _serial.get() else max(1, min(SCORING_THREADS, total // SECTION_MIN_POSTINGS))
+    bounds = np.linspace(0, n_docs, n_sections + 1).astype(np.int64)
+
+    def run(lo: int, hi: int):
+        scores = np.zeros((n_outputs, hi - lo), dtype=np.float64)
+        matched = np.zeros(hi - lo, dtype=np.int32)
+        for rows, tfs, ctx in postings:
+            a, b = np.searchsorted(rows, (lo, hi))
+            section_rows, section_tfs = rows[a:b], tfs[a:b]
+            if doc_mask is not None:
+                keep = doc_mask[section_rows]
+                section_rows, section_tfs = section_rows[keep], section_tfs[keep]
+            local = section_rows - lo
+            scores[:, local] += contribution(section_rows, section_tfs, ctx)
+            matched[local] += 1
+        return scores, matched
+
+    if n_sections == 1:
+        return run(0, n_docs)
+    parts = list(_scoring_pool().map(lambda bound: run(*bound), zip(bounds[:-1], bounds[1:])))
+    return np.concatenate([p[0] for p in parts], axis=1), np.concatenate([p[1] for p in parts])
+
+
+def top_k_rows(scores: np.ndarray, matched: np.ndarray, top_k: int, by_matched: bool = False,
+               cluster_of: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Rows of the best matched docs by score (or by matched term count, then score).
+    With cluster_of (row -> cluster number), only the best row of each cluster is kept.
+    """
+    candidates = np.flatnonzero(matched)
+    if by_matched:
+        order = np.lexsort((-scores[candidates], -matched[candidates]))
+    else:
+        order = np.argsort(-scores[candidates], kind='stable')
+    ranked = candidates[order]
+    if cluster_of is not None:
+        _, first = np.unique(cluster_of[ranked], return_index=True)
+        ranked = ranked[np.sort(first)]
+    return ranked[:top_k].tolist()
+
+
+def contains_row(rows: np.ndarray, row: int) -> bool:
+    """Whether a sorted rows array contains row."""
+    i = np.searchsorted(rows, row)
+    return i < len(rows) and rows[i] == row
+
+
+def row_index(doc_ids: Sequence[str]) -> Mapping[str, int]:
+    return MappingProxyType({doc_id: i for i, doc_id in enumerate(doc_ids)})
+
+
+def shared_postings(index: Dict[str, dict], doc_ids: Sequence[str],
+                    postings: Optional[FrozenPostings] = None) -> FrozenPostings:
+    """
+    postings when given (load_engines builds one per corpus, in forward-index
+    order, for all engines to share), else a new FrozenPostings of index.
+    """
+    if postings is None:
+        return FrozenPostings(index, row_index(doc_ids), len(doc_ids))
+    if postings.n_docs != len(doc_ids):
+        raise ValueError(f"Shared postings cover {postings.n_docs} documents, the engine {len(doc_ids)}")
+    return postings
@@ -0,0 +1,55 @@
+from collections import defaultdict
+from typing import List, Dict, Any
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Fuse several ranked result lists by doc_id using reciprocal-rank fusion:
+    score(d) = sum over lists of 1 / (k + rank(d)).
+    Returns one entry per unique doc_id, best first, carrying 'fused_score'.
+    """
+    fused_scores = defaultdict(float)
+    best_result = {}
+
+    for results in result_lists:
+        for rank, res in enumerate(results, start=1):
+            doc_id = res['doc_id']
+            fused_scores[doc_id] += 1.0 / (k + rank)
+            if doc_id not in best_result or (res.get('score') or 0) > (best_result[doc_id].get('score') or 0):
+                best_result[doc_id] = res
+
+    return _ranked(fused_scores, best_result)
+
+
+def comb_sum(result_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Fuse several ranked result lists by doc_id using CombSUM over
+    per-list max-normalized scores.
+    """
+    fused_scores = defaultdict(float)
+    best_result = {}
+
+    for results in result_lists:
+        if not results:
+            continue
+        max_score = max((res.get('score') or 0) for res in results) or 1.0
+        for res in results:
+            doc_id = res['doc_id']
+            fused_scores[doc_id] += (res.get('score') or 0) / max_score
+            if doc_id not in best_result or (res.get('score') or 0) > (best_result[doc_id].get('score') or 0):
+                best_result[doc_id] = res
+
+    return _ranked(fused_scores, best_result)
+
+
+def _ranked(fused_scores: Dict[str, float], best_result: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    ranked = sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
+    return [{**best_result[doc_id], 'fused_score': score} for doc_id, score in ranked]
+
+
+FUSION_METHODS = {
+    'rrf': reciprocal_rank_fusion,
+    'combsum': comb_sum,
+}
@@ -1,13 +1,27 @@
-from typing import List, Literal, Union
+from typing import List, Literal, Optional, Union
+import logging
 import os
-from google import genai
-from google.genai import types
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from metrics import LLM_TOKENS
+from llm_backends import LLMBackend, create_backend
 
 load_dotenv()
 MODEL_NAME = "gemini-2.5-flash-lite"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+# Phrases requested per corpus by SearchModelTwo; BM25 stem postings recall the
+# morphological variants that used to need separate phrasings
+PHRASES_PER_CORPUS = 6
+
+logger = logging.getLogger(__name__)
+
+
+def record_usage(response, model: str):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_token_count or 0, model=model, kind="prompt")
+    LLM_TOKENS.inc(usage.candidates_token_count or 0, model=model, kind="output")
 
 class SearchQuery(BaseModel):
     query: str = Field(description="Explicit Arabic search phrase.")
@@ -24,6 +38,15 @@ class ValidationResult(BaseModel):
 class ValidationResponse(BaseModel):
     validated_results: List[ValidationResult]
 
+class ExtendedValidationResult(BaseModel):
+    query_index: int = Field(description="The query index (Query X)")
+    result_index: int = Field(description="The result index within that query (Result Y)")
+    observation: str = Field(description="Brief observation about relevance")
+    is_relevant: bool = Field(description="Whether the result is relevant")
+
+class ExtendedValidationResponse(BaseModel):
+    validated_results: List[ExtendedValidationResult]
+
 SYSTEM_INSTRUCTION_ARABIC = """
 أنت خبير فني متقدم في استرجاع المعلومات من "متون" النصوص الإسلامية (القرآن الكريم والحديث الشريف). مهمتك هي استخراج "عبارات دلالية" و "نصوص مرتبطة" من صلب المصادر، وليس تصنيفها.
 
@@ -58,25 +81,35 @@ SYSTEM_INSTRUCTION_VALIDATION_ARABIC = """
 """
 
 
+def backend_available(backend, call_type: str) -> bool:
+    """False when there is no backend or the circuit breaker of this call type is open."""
+    if backend is None:
+        return False
+    available = getattr(backend, 'available', None)
+    return available is None or available(call_type)
+
+
 class SearchModelOne:
-    def __init__(self, api_key: str = GEMINI_API_KEY, validation_model: str = "gemini-2.5-flash-lite"):
+    def __init__(self, api_key: str = GEMINI_API_KEY, validation_model: str = "gemini-2.5-flash-lite",
+                 backend: LLMBackend = None):
         self.api_key = api_key
         self.validation_model = validation_model
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-        else:
-            self.client = None
+        self.backend = backend or create_backend(self.api_key)
+
+    def available(self) -> bool:
+        """False when there is no backend or the query-generation circuit breaker is open."""
+        return backend_available(self.backend, SearchResponse.__name__)
 
     def generate_queries(self, user_question: str) -> List[dict]:
         """
         Generates targeted search queries from a user question.
         Returns a list of dicts with keys 'query' and 'type'.
         """
-        if not self.client:
+        if not self.backend:
             return []
 
         try:
-            response = self.client.models.generate_content(
+            response = self.backend.generate_content(
                 model=MODEL_NAME,
                 contents=user_question,
                 config={
@@ -86,6 +119,7 @@ class SearchModelOne:
                     "temperature": 0.0,
                 },
             )
+            record_usage(response, MODEL_NAME)
 
             if response.text:
                 result = SearchResponse.model_validate_json(response.text)
@@ -100,13 +134,11 @@ class SearchModelOne:
 
             return []
 
-        except Exception as e:
-            print(f"DEBUG Error: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Query generation failed")
             return []
 
-    def filter_results_batch(self, user_question: str, query_results_map: List[dict]) -> dict:
+    def filter_results_batch(self, user_question: str, query_results_map: List[dict]) -> Optional[dict]:
         """
         Validates all search results in a single API call.
         
@@ -116,10 +148,13 @@ class SearchModelOne:
                               where 'results' is a list of result dicts
         
         Returns:
-            Dict mapping query indices to lists of ValidationResult objects
+            Dict mapping query indices to lists of ValidationResult objects,
+            or None when validation failed (no backend, LLM error, open breaker)
         """
-        if not query_results_map or not self.client:
+        if not query_results_map:
             return {}
+        if not self.backend:
+            return None
 
         # Build comprehensive prompt with all queries and results
         all_results_text = ""
@@ -148,16 +183,6 @@ For each result, provide the query index and result index along with your evalua
 IMPORTANT: Return validations for ALL results shown above. Use the format "Query X, Result Y" indices.
 """
 
-        # Extended validation schema to include query_index
-        class ExtendedValidationResult(BaseModel):
-            query_index: int = Field(description="The query index (Query X)")
-            result_index: int = Field(description="The result index within that query (Result Y)")
-            observation: str = Field(description="Brief observation about relevance")
-            is_relevant: bool = Field(description="Whether the result is relevant")
-
-        class ExtendedValidationResponse(BaseModel):
-            validated_results: List[ExtendedValidationResult]
-
         config = {
             "response_mime_type": "application/json",
             "response_json_schema": ExtendedValidationResponse.model_json_schema(),
@@ -166,11 +191,12 @@ IMPORTANT: Return validations for ALL results shown above. Use the format "Query
         }
 
         try:
-            response = self.client.models.generate_content(
+            response = self.backend.generate_content(
                 model=self.validation_model,
                 contents=prompt,
                 config=config,
             )
+            record_usage(response, self.validation_model)
 
             if response.text:
                 result = ExtendedValidationResponse.model_validate_json(response.text)
@@ -189,29 +215,25 @@ IMPORTANT: Return validations for ALL results shown above. Use the format "Query
                 
                 return validations_by_query
 
-            return {}
+            return None
 
-        except Exception as e:
-            print(f"DEBUG: Exception in batch validation: {e}")
-            import traceback
-            traceback.print_exc()
-            return {} 
+        except Exception:
+            logger.exception("Batch validation failed")
+            return None
 
 
 class SearchModelTwo:
-    def __init__(self, api_key: str = GEMINI_API_KEY):
+    def __init__(self, api_key: str = GEMINI_API_KEY, backend: LLMBackend = None):
         self.api_key = api_key
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-            self.model = self.client.models
-        else:
-            self.client = None
-            self.model = None
+        self.backend = backend or create_backend(self.api_key)
+
+    def available(self) -> bool:
+        return backend_available(self.backend, MODEL_NAME)
 
     def generate_queries(self, user_question: str) -> List[dict]:
 
 
-        if not self.model:
+        if not self.backend:
             return []
         
         queries = []
@@ -230,16 +252,17 @@ class SearchModelTwo:
         prompt = f"""
         أنت باحث في مفردات ومعاني القرآن الكريم.
         السؤال: {question}
-        المطلوب: توليد 8-12 عبارة (مقاطع من آيات أو كلمات مفتاحية قرآنية) تتعلق بالموضوع دلالياً أو نصياً.
+        المطلوب: توليد 4-6 عبارات (مقاطع من آيات أو كلمات مفتاحية قرآنية) تتعلق بالموضوع دلالياً أو نصياً.
         🚫 ممنوع: العناوين (مثل: عقيدة)، أو أسماء السور، أو المصطلحات الحديثة.
         ✅ المطلوب: عبارات تعكس "الجوهر القرآني" للموضوع (مثل: "فبأي آلاء ربكما تكذبان" أو "خلق الإنسان من علق").
         أعطِ العبارات فقط، كل في سطر.
         """
         try:
-            response = self.model.generate_content(model=MODEL_NAME, contents=prompt)
+            response = self.backend.generate_content(model=MODEL_NAME, contents=prompt)
+            record_usage(response, MODEL_NAME)
             text = response.text.strip()
             lines = [l.strip() for l in text.splitlines() if l.strip()]
-            return [l for l in lines if 2 <= len(l.split()) <= 10][:12]
+            return [l for l in lines if 2 <= len(l.split()) <= 10][:PHRASES_PER_CORPUS]
         except:
             return []
 
@@ -247,15 +270,16 @@ class SearchModelTwo:
         prompt = f"""
         أنت خبير في متون معاني الحديث الشريف.
         السؤال: {question}
-        المطلوب: توليد 8-12 عبارة (مقاطع من المتون أو عبارات نبوية شائعة) ترتبط بالموضوع دلالياً.
+        المطلوب: توليد 4-6 عبارات (مقاطع من المتون أو عبارات نبوية شائعة) ترتبط بالموضوع دلالياً.
         🚫 ممنوع: أسماء الكتب (صحيح البخاري)، أو التصنيفات الفقهية (كتاب الصلاة)، أو لغة الفقهاء المتأخرين.
         ✅ المطلوب: لغة النبوة والحكمة (مثل: "كلكم راع" أو "المرء مع من أحب").
         أعطِ العبارات فقط، كل في سطر.
         """
         try:
-            response = self.model.generate_content(model=MODEL_NAME, contents=prompt)
+            response = self.backend.generate_content(model=MODEL_NAME, contents=prompt)
+            record_usage(response, MODEL_NAME)
             text = response.text.strip()
             lines = [l.strip() for l in text.splitlines() if l.strip()]
-            return [l for l in lines if 2 <= len(l.split()) <= 10][:12]
+            return [l for l in lines if 2 <= len(l.split()) <= 10][:PHRASES_PER_CORPUS]
         except:
             return []
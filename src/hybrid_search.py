@@ -0,0 +1,137 @@
+import math
+from collections import defaultdict
+from typing import List, Dict, Any
+import numpy as np
+from preprocessing import SafeIslamicArabicProcessor
+from fusion import RRF_K
+from metrics import POSTINGS_TRAVERSED
+from filters import DocFilter
+from frozen_index import FrozenPostings, accumulate, contains_row, doc_filter_mask, readonly, shared_postings
+from near_duplicates import collapse_duplicates
+
+
+class HybridSearchEngine:
+    """
+    Scores BM25 and TF-IDF cosine in a single traversal of the postings and
+    fuses them, either with weighted max-normalized scores or with RRF.
+    """
+    def __init__(self, name: str, inverted_index: Dict[str, Any], doc_metadata: Dict[str, Any],
+                 processor: SafeIslamicArabicProcessor, k1: float = 1.5, b: float = 0.75,
+                 bm25_weight: float = 0.5, vsm_weight: float = 0.5, fusion: str = "weighted",
+                 duplicate_clusters: Dict[str, str] = None, postings: FrozenPostings = None):
+        self.name = name
+        self.inverted_index = inverted_index
+        self.doc_metadata = doc_metadata
+        self.processor = processor
+        self.k1 = k1
+        self.b = b
+        self.bm25_weight = bm25_weight
+        self.vsm_weight = vsm_weight
+        self.fusion = fusion
+        self.duplicate_clusters = duplicate_clusters
+
+        self.N = len(doc_metadata)
+        self.doc_ids = tuple(doc_metadata)
+        self.doc_lens = readonly(np.array([len(d.get('tokens', [])) for d in doc_metadata.values()], dtype=np.float64))
+        self.avg_dl = float(self.doc_lens.sum()) / self.N
+
+        # Read-only postings arrays and per-row cosine norms
+        self.postings = shared_postings(inverted_index, self.doc_ids, postings)
+        vsm_idf = np.array([self._vsm_idf(int(df)) for df in self.postings.df], dtype=np.float64)
+        weights = self.postings.tfs * self.postings.entry_weights(vsm_idf)
+        self.doc_norms = readonly(np.sqrt(np.bincount(self.postings.rows, weights=weights ** 2,
+                                                      minlength=len(self.doc_ids))))
+
+    def _bm25_idf(self, df: int) -> float:
+        return math.log(((self.N - df + 0.5) / (df + 0.5)) + 1)
+
+    def _vsm_idf(self, df: int) -> float:
+        return math.log10(self.N / df) if df > 0 else 0
+
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
+        query_tokens = self.processor.preprocess(query)['tokens']
+        if not query_tokens:
+            return []
+
+        query_tf = defaultdict(int)
+        for t in query_tokens:
+            query_tf[t] += 1
+
+        terms = []
+        query_norm_sq = 0.0
+
+        for term, q_tf in query_tf.items():
+            term_postings = self.postings.get(term)
+            if term_postings is None:
+                continue
+            df = self.postings.df_of(term)
+            bm25_idf = self._bm25_idf(df)
+            vsm_idf = self._vsm_idf(df)
+            q_tfidf = q_tf * vsm_idf
+            query_norm_sq += q_tfidf ** 2
+            rows, tfs = term_postings
+            terms.append((rows, tfs, (q_tf * bm25_idf, q_tfidf * vsm_idf)))
+
+        POSTINGS_TRAVERSED.inc(sum(len(rows) for rows, _, _ in terms), engine=type(self).__name__,
+                               corpus=self.name.lower())
+        (bm25, dots), matched = accumulate(len(self.doc_ids), terms, self._contribution,
+                                           doc_filter_mask(doc_filter, len(self.doc_ids)), n_outputs=2)
+        rows = np.flatnonzero(matched)
+        if not len(rows):
+            return []
+
+        query_norm = math.sqrt(query_norm_sq)
+        denom = query_norm * self.doc_norms[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cosine = np.where(denom > 0, dots[rows] / denom, 0.0)
+
+        row_of = {self.doc_ids[row]: row for row in rows.tolist()}
+        doc_ids = list(row_of)
+        bm25_scores = dict(zip(doc_ids, bm25[rows].tolist()))
+        cosine_scores = dict(zip(doc_ids, cosine.tolist()))
+        if self.fusion == "rrf":
+            fused = self._fuse_rrf(bm25_scores, cosine_scores)
+        else:
+            fused = self._fuse_weighted(bm25_scores, cosine_scores)
+
+        sorted_docs = sorted(fused.items(), key=lambda x: x[1], reverse=True)
+        if self.duplicate_clusters is not None:
+            sorted_docs = collapse_duplicates(sorted_docs, lambda x: self.duplicate_clusters.get(x[0], x[0]), top_k)
+        sorted_docs = sorted_docs[:top_k]
+
+        results = []
+        for doc_id, score in sorted_docs:
+            doc_info = self.doc_metadata[doc_id]
+            results.append({
+                'doc_id': doc_id,
+                'score': score,
+                'text': doc_info.get('arabic_original', ''),
+                'metadata': doc_info,
+                'matched_tokens': [term for term in query_tf if term in self.postings
+                                   and contains_row(self.postings.get(term)[0], row_of[doc_id])],
+                'cluster_id': (self.duplicate_clusters or {}).get(doc_id)
+            })
+
+        return results
+
+    def _contribution(self, rows: np.ndarray, tfs: np.ndarray, weights: tuple) -> np.ndarray:
+        """BM25 and cosine dot-product contributions of one term, as a (2, n) array."""
+        bm25_weight, dot_weight = weights
+        tfs = tfs.astype(np.float64)
+        denominator = tfs + self.k1 * (1 - self.b + self.b * (self.doc_lens[rows] / self.avg_dl))
+        return np.vstack((bm25_weight * (tfs * (self.k1 + 1) / denominator), dot_weight * tfs))
+
+    def _fuse_weighted(self, bm25_scores: Dict[str, float], cosine_scores: Dict[str, float]) -> Dict[str, float]:
+        max_bm25 = max(bm25_scores.values()) or 1.0
+        return {
+            doc_id: self.bm25_weight * (bm25 / max_bm25) + self.vsm_weight * cosine_scores.get(doc_id, 0.0)
+            for doc_id, bm25 in bm25_scores.items()
+        }
+
+    def _fuse_rrf(self, bm25_scores: Dict[str, float], cosine_scores: Dict[str, float]) -> Dict[str, float]:
+        fused = defaultdict(float)
+        for weight, scores in ((self.bm25_weight, bm25_scores), (self.vsm_weight, cosine_scores)):
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            for rank, doc_id in enumerate(ranked, start=1):
+                fused[doc_id] += weight / (RRF_K + rank)
+        return fused
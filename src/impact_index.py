@@ -0,0 +1,204 @@
+"""
+Impact-ordered postings for deadline-bounded ("anytime") BM25.
+
+build_indices.py precomputes every posting's BM25 contribution
+idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avg_dl)), quantizes it
+to 8 bits on one corpus-wide scale, and stores each term's postings sorted
+by that impact, highest first (indices/<corpus>_impacts.npz). Stem
+postings (stemming.py) are stored alongside under stem_key(stem).
+
+ImpactIndex.search scores a query score-at-a-time: blocks of postings are
+taken from all query terms in decreasing order of impact. Past the deadline
+or the postings budget, it stops and ranks what it has. The documents that
+matter most are scored first, so the best-so-far top-k is usually close
+to the exact one. BM25SearchEngine only takes this path when the regular
+scorer would not fit in the budget.
+"""
+import hashlib
+import heapq
+import math
+import os
+import time
+from types import MappingProxyType
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+from frozen_index import readonly
+from filters import doc_id_of
+
+IMPACT_BITS = 8
+# Stem postings share the index under this prefix, which no Arabic token contains
+STEM_PREFIX = '~'
+# Postings scored between two deadline checks
+BLOCK_SIZE = 256
+
+
+class RankedResults(list):
+    """A search result list that also says whether it is exact or a best-so-far cut-off."""
+
+    def __init__(self, results=(), exact: bool = True, postings_scored: int = 0):
+        super().__init__(results)
+        self.exact = exact
+        self.postings_scored = postings_scored
+
+
+class ImpactIndex:
+    """Read-only CSR postings per term: doc rows in decreasing order of quantized BM25 impact."""
+    __slots__ = ('term_ids', 'indptr', 'rows', 'impacts', 'scale', 'k1', 'b', 'doc_ids', 'has_stems',
+                 'fingerprint')
+
+    def __init__(self, terms: Sequence[str], indptr: np.ndarray, rows: np.ndarray, impacts: np.ndarray,
+                 scale: float, k1: float, b: float, doc_ids: Sequence[str], has_stems: bool = False,
+                 fingerprint: str = ''):
+        self.term_ids = MappingProxyType({term: i for i, term in enumerate(terms)})
+        self.indptr = readonly(indptr)
+        self.rows = readonly(rows)
+        self.impacts = readonly(impacts)
+        self.scale = scale
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = tuple(doc_ids)
+        self.has_stems = has_stems
+        # index_fingerprint() of the postings it was built from
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, inverted_index: Dict[str, dict], doc_ids: Sequence[str], doc_lens: Sequence[int],
+              k1: float = 1.5, b: float = 0.75, bits: int = IMPACT_BITS,
+              stem_index: Optional[Dict[str, dict]] = None) -> 'ImpactIndex':
+        n_docs = len(doc_ids)
+        row_of = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+        lengths = np.asarray(doc_lens, dtype=np.float64)
+        avg_dl = lengths.sum() / n_docs
+
+        entries = list(inverted_index.items())
+        entries.extend((stem_key(stem), entry) for stem, entry in (stem_index or {}).items())
+        terms, all_rows, all_impacts, sizes = [], [], [], []
+        for term, entry in entries:
+            # Positional postings hold a positions list, stem postings a tf count
+            pairs = [(row_of[doc_id], value if isinstance(value, int) else len(value))
+                     for doc_id, value in entry['postings'].items() if doc_id in row_of]
+            rows = np.array([row for row, _ in pairs], dtype=np.int32)
+            tfs = np.array([tf for _, tf in pairs], dtype=np.float64)
+            idf = math.log(((n_docs - entry['df'] + 0.5) / (entry['df'] + 0.5)) + 1)
+            impacts = idf * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * lengths[rows] / avg_dl))
+            terms.append(term)
+            all_rows.append(rows)
+            all_impacts.append(impacts)
+            sizes.append(len(rows))
+
+        levels = (1 << bits) - 1
+        max_impact = max((float(i.max()) for i in all_impacts if len(i)), default=1.0)
+        scale = max_impact / levels
+        dtype = np.uint8 if bits <= 8 else np.uint16
+        for i, (rows, impacts) in enumerate(zip(all_rows, all_impacts)):
+            # Every posting keeps at least one level, so a match is never lost to rounding
+            quantized = np.clip(np.rint(impacts / scale), 1, levels).astype(dtype)
+            order = np.argsort(-quantized.astype(np.int32), kind='stable')
+            all_rows[i] = rows[order]
+            all_impacts[i] = quantized[order]
+
+        indptr = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+        return cls(terms, indptr, np.concatenate(all_rows or [np.empty(0, np.int32)]),
+                   np.concatenate(all_impacts or [np.empty(0, dtype)]), scale, k1, b, doc_ids,
+                   stem_index is not None, index_fingerprint(inverted_index, doc_ids, stem_index))
+
+    def save(self, path: str):
+        np.savez(path, terms=np.array(list(self.term_ids), dtype=str), indptr=self.indptr, rows=self.rows,
+                 impacts=self.impacts, params=np.array([self.scale, self.k1, self.b, float(self.has_stems)]),
+                 doc_ids=np.array(self.doc_ids, dtype=str), fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, path: str) -> 'ImpactIndex':
+        with np.load(path) as data:
+            scale, k1, b, *rest = data['params'].tolist()
+            fingerprint = str(data['fingerprint']) if 'fingerprint' in data else ''
+            return cls(data['terms'].tolist(), data['indptr'], data['rows'], data['impacts'],
+                       scale, k1, b, data['doc_ids'].tolist(), bool(rest and rest[0]), fingerprint)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.term_ids
+
+    def search(self, terms: Sequence[Tuple[str, float]], n_docs: int, doc_mask: Optional[np.ndarray] = None,
+               deadline: Optional[float] = None, postings_budget: Optional[int] = None,
+               block_size: int = BLOCK_SIZE) -> Tuple[np.ndarray, bool, int]:
+        """
+        Score-at-a-time accumulation of (term, query weight) pairs. deadline is
+        a time.perf_counter() value. At least one posting is always scored, and
+        the last block is cut to what is left of the postings budget.
+        Returns (scores per row, exact, postings scored).
+        """
+        scores = np.zeros(n_docs, dtype=np.float64)
+        # One pending block per term, keyed by the impact of its first posting
+        heap = []
+        for i, (term, weight) in enumerate(terms):
+            term_id = self.term_ids.get(term)
+            if term_id is None or weight <= 0:
+                continue
+            start, end = int(self.indptr[term_id]), int(self.indptr[term_id + 1])
+            if start < end:
+                heap.append((-float(self.impacts[start]) * weight, i, start, end, weight))
+        heapq.heapify(heap)
+
+        scored = 0
+        while heap:
+            if scored and ((deadline is not None and time.perf_counter() >= deadline)
+                           or (postings_budget is not None and scored >= postings_budget)):
+                return scores * self.scale, False, scored
+            _, i, start, end, weight = heapq.heappop(heap)
+            stop = min(start + block_size, end)
+            if postings_budget is not None:
+                stop = min(stop, start + max(postings_budget - scored, 1))
+            rows = self.rows[start:stop]
+            impacts = self.impacts[start:stop]
+            if doc_mask is not None:
+                keep = doc_mask[rows]
+                rows, impacts = rows[keep], impacts[keep]
+            # Rows are unique within a term, so the fancy-indexed add is safe
+            scores[rows] += weight * impacts
+            scored += stop - start
+            if stop < end:
+                heapq.heappush(heap, (-float(self.impacts[stop]) * weight, i, stop, end, weight))
+        return scores * self.scale, True, scored
+
+
+def stem_key(stem: str) -> str:
+    return STEM_PREFIX + stem
+
+
+def index_fingerprint(inverted_index: Dict[str, dict], doc_ids: Sequence[str],
+                      stem_index: Optional[Dict[str, dict]] = None) -> str:
+    """A hash of the doc ids and of every term's df and postings count (stems included)."""
+    digest = hashlib.sha1('\0'.join(doc_ids).encode('utf-8'))
+    for prefix, index in (('', inverted_index), (STEM_PREFIX, stem_index or {})):
+        for term in sorted(index):
+            entry = index[term]
+            digest.update(f"\n{prefix}{term}\0{entry['df']}\0{len(entry['postings'])}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_impact_index(inverted_index: Dict[str, dict], index_data: list, k1: float = 1.5,
+                       b: float = 0.75, stem_index: Optional[Dict[str, dict]] = None) -> ImpactIndex:
+    doc_ids = [doc_id_of(doc, idx) for idx, doc in enumerate(index_data)]
+    return ImpactIndex.build(inverted_index, doc_ids, [len(doc.get('tokens', [])) for doc in index_data], k1, b,
+                             stem_index=stem_index)
+
+
+def save_impact_index(impact_index: ImpactIndex, name: str, output_dir: str = 'indices'):
+    os.makedirs(output_dir, exist_ok=True)
+    impact_index.save(f'{output_dir}/{name}_impacts.npz')
+
+
+def load_impact_index(inverted_index: Dict[str, dict], index_data: list, name: str, input_dir: str = 'indices',
+                      k1: float = 1.5, b: float = 0.75, stem_index: Optional[Dict[str, dict]] = None) -> ImpactIndex:
+    """
+    Load the impacts built at index time; rebuild if missing, built with other
+    parameters, or built from other postings (see index_fingerprint).
+    """
+    path = f'{input_dir}/{name}_impacts.npz'
+    if os.path.exists(path):
+        impact_index = ImpactIndex.load(path)
+        doc_ids = [doc_id_of(doc, idx) for idx, doc in enumerate(index_data)]
+        if ((impact_index.k1, impact_index.b, impact_index.has_stems) == (k1, b, stem_index is not None)
+                and impact_index.fingerprint == index_fingerprint(inverted_index, doc_ids, stem_index)):
+            return impact_index
+    return build_impact_index(inverted_index, index_data, k1, b, stem_index)
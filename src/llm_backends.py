@@ -0,0 +1,151 @@
+"""
+Pluggable LLM backends used by SearchModelOne / SearchModelTwo.
+
+A backend exposes generate_content(model, contents, config) and returns an
+object with `.text` and `.usage_metadata`, like google.genai responses.
+
+Select with MUSTADIL_LLM_BACKEND=gemini (default) or fake. The fake backend
+reads MUSTADIL_FAKE_LLM_FIXTURES, MUSTADIL_FAKE_LLM_LATENCY, MUSTADIL_FAKE_LLM_JITTER
+and MUSTADIL_FAKE_LLM_ERROR_RATE.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Protocol
+from llm_gateway import GatewayBackend, default_gateway
+
+
+@dataclass
+class UsageMetadata:
+    prompt_token_count: int
+    candidates_token_count: int
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    usage_metadata: Optional[UsageMetadata] = None
+
+
+class LLMBackend(Protocol):
+    def generate_content(self, model: str, contents: str, config: Optional[dict] = None): ...
+
+
+class GeminiBackend:
+    def __init__(self, api_key: str):
+        from google import genai
+        self.client = genai.Client(api_key=api_key)
+
+    def generate_content(self, model: str, contents: str, config: Optional[dict] = None):
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+
+class FakeBackendError(Exception):
+    """Simulated LLM failure; `code` mirrors an HTTP status so retry logic can treat it as transient."""
+    def __init__(self, message: str, code: int = 503):
+        super().__init__(message)
+        self.code = code
+
+
+def _schema_title(config: Optional[dict]) -> Optional[str]:
+    if not config:
+        return None
+    schema = config.get("response_json_schema")
+    return schema.get("title") if isinstance(schema, dict) else None
+
+
+class FakeBackend:
+    """
+    Deterministic local stand-in for Gemini. Replays recorded fixtures when the
+    (schema, contents) pair was seen before, otherwise synthesizes a
+    schema-valid answer. Latency, jitter and error rate are configurable.
+    """
+    def __init__(self, fixtures_path: Optional[str] = None, latency: float = 0.5, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.fixtures = {}
+        if fixtures_path and os.path.exists(fixtures_path):
+            with open(fixtures_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.fixtures[(record.get('schema'), record['contents'])] = record['text']
+
+    def generate_content(self, model: str, contents: str, config: Optional[dict] = None) -> LLMResponse:
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+        time.sleep(delay)
+        if fail:
+            raise FakeBackendError("Simulated LLM failure")
+
+        schema = _schema_title(config)
+        text = self.fixtures.get((schema, contents))
+        if text is None:
+            text = self._synthesize(schema, contents)
+        return LLMResponse(
+            text=text,
+            usage_metadata=UsageMetadata(prompt_token_count=len(contents) // 4, candidates_token_count=len(text) // 4)
+        )
+
+    def _synthesize(self, schema: Optional[str], contents: str) -> str:
+        if schema == "SearchResponse":
+            return json.dumps({"queries": [
+                {"query": contents, "type": "quran"},
+                {"query": contents, "type": "hadith"},
+            ]}, ensure_ascii=False)
+        if schema == "ExtendedValidationResponse":
+            pairs = re.findall(r"Query (\d+), Result (\d+):", contents)
+            return json.dumps({"validated_results": [
+                {"query_index": int(q), "result_index": int(r), "observation": "fake backend", "is_relevant": True}
+                for q, r in pairs
+            ]}, ensure_ascii=False)
+        # Free-text prompts (SearchModelTwo): echo the question line as a phrase
+        match = re.search(r"السؤال:\s*(.+)", contents)
+        return match.group(1).strip() if match else contents.strip().splitlines()[0]
+
+
+class RecordingBackend:
+    """Wraps a real backend and appends every response to a JSONL fixtures file for FakeBackend."""
+    def __init__(self, backend: LLMBackend, fixtures_path: str):
+        self.backend = backend
+        self.fixtures_path = fixtures_path
+        self._lock = threading.Lock()
+
+    def generate_content(self, model: str, contents: str, config: Optional[dict] = None):
+        response = self.backend.generate_content(model, contents, config)
+        record = {"schema": _schema_title(config), "contents": contents, "text": response.text}
+        with self._lock, open(self.fixtures_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return response
+
+
+def create_backend(api_key: str) -> Optional[LLMBackend]:
+    """
+    Backend selected by MUSTADIL_LLM_BACKEND, wrapped in the shared LLM gateway,
+    or None when Gemini has no API key.
+    """
+    kind = os.getenv("MUSTADIL_LLM_BACKEND", "gemini")
+    if kind == "fake":
+        backend = FakeBackend(
+            fixtures_path=os.getenv("MUSTADIL_FAKE_LLM_FIXTURES"),
+            latency=float(os.getenv("MUSTADIL_FAKE_LLM_LATENCY", "0.5")),
+            jitter=float(os.getenv("MUSTADIL_FAKE_LLM_JITTER", "0.0")),
+            error_rate=float(os.getenv("MUSTADIL_FAKE_LLM_ERROR_RATE", "0.0")),
+        )
+    elif not api_key:
+        return None
+    else:
+        backend = GeminiBackend(api_key)
+        record_path = os.getenv("MUSTADIL_LLM_RECORD")
+        if record_path:
+            backend = RecordingBackend(backend, record_path)
+    return GatewayBackend(backend, default_gateway())
@@ -0,0 +1,228 @@
+"""
+Shared gateway in front of every LLM backend call: bounded concurrency,
+per-call deadlines, jittered exponential retry and a circuit breaker per
+call type (the response schema, or the model for free-text calls), so a
+failing validation call cannot hide behind succeeding query generation.
+
+Configured through MUSTADIL_LLM_MAX_IN_FLIGHT, MUSTADIL_LLM_TIMEOUT,
+MUSTADIL_LLM_MAX_RETRIES, MUSTADIL_LLM_BREAKER_THRESHOLD and MUSTADIL_LLM_BREAKER_RESET.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+from metrics import REGISTRY
+
+LLM_QUEUE_DEPTH = REGISTRY.gauge(
+    'mustadil_llm_queue_depth', 'LLM calls waiting for a concurrency slot.')
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    'mustadil_llm_in_flight', 'LLM calls currently running.')
+LLM_BREAKER_STATE = REGISTRY.gauge(
+    'mustadil_llm_breaker_state', 'LLM circuit breaker state (0 closed, 1 half-open, 2 open).', ('call_type',))
+LLM_CALLS = REGISTRY.counter(
+    'mustadil_llm_calls_total', 'LLM call attempts by outcome.', ('outcome',))
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+DEFAULT_CALL_TYPE = "default"
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+
+class LLMTimeoutError(TimeoutError):
+    """The LLM call or the wait for a concurrency slot exceeded its deadline."""
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_CODES
+
+
+def call_type_of(model: str, config: Optional[dict] = None) -> str:
+    """Breaker key of a generate_content call: its response schema title, else the model name."""
+    schema = (config or {}).get("response_json_schema")
+    title = schema.get("title") if isinstance(schema, dict) else None
+    return title or model
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, call_type: str = DEFAULT_CALL_TYPE):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.call_type = call_type
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+        LLM_BREAKER_STATE.set(0, call_type=call_type)
+
+    def _set_state(self, state: str):
+        self._state = state
+        LLM_BREAKER_STATE.set(self._STATE_VALUES[state], call_type=self.call_type)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may proceed; in half-open state only a single probe is let through."""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+class LLMGateway:
+    def __init__(self, max_in_flight: int = 8, timeout: float = 20.0, max_retries: int = 2,
+                 base_delay: float = 0.5, max_delay: float = 4.0,
+                 breaker_factory: Optional[Callable[[str], CircuitBreaker]] = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._breaker_factory = breaker_factory or (lambda call_type: CircuitBreaker(call_type=call_type))
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm")
+
+    def breaker(self, call_type: str = DEFAULT_CALL_TYPE) -> CircuitBreaker:
+        with self._breakers_lock:
+            if call_type not in self._breakers:
+                self._breakers[call_type] = self._breaker_factory(call_type)
+            return self._breakers[call_type]
+
+    def available(self, call_type: str = DEFAULT_CALL_TYPE) -> bool:
+        return self.breaker(call_type).state != CircuitBreaker.OPEN
+
+    def call(self, fn, *args, call_type: str = DEFAULT_CALL_TYPE, **kwargs):
+        """
+        Run fn(*args, **kwargs) through the call type's breaker, the concurrency
+        limit, deadline and retries. The breaker counts one failure or success
+        per call, however many attempts it took.
+        """
+        breaker = self.breaker(call_type)
+        if not breaker.allow():
+            LLM_CALLS.inc(outcome="rejected")
+            raise CircuitOpenError(f"LLM circuit breaker is open ({call_type})")
+        try:
+            result = self._call_with_retries(breaker, fn, *args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            # A non-retryable error (bad request) still means the backend is reachable
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    def _call_with_retries(self, breaker: CircuitBreaker, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            if attempt and breaker.state == CircuitBreaker.OPEN:
+                # Other calls of this type opened the breaker while this one was backing off
+                LLM_CALLS.inc(outcome="rejected")
+                raise CircuitOpenError(f"LLM circuit breaker is open ({breaker.call_type})")
+            try:
+                result = self._call_once(fn, *args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                LLM_CALLS.inc(outcome="retryable_error" if retryable else "error")
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(random.uniform(0, delay))
+                continue
+            LLM_CALLS.inc(outcome="success")
+            return result
+
+    def _call_once(self, fn, *args, **kwargs):
+        LLM_QUEUE_DEPTH.inc()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        LLM_QUEUE_DEPTH.dec()
+        if not acquired:
+            raise LLMTimeoutError("Timed out waiting for an LLM concurrency slot")
+
+        LLM_IN_FLIGHT.inc()
+        future = self._executor.submit(fn, *args, **kwargs)
+
+        def release(_):
+            LLM_IN_FLIGHT.dec()
+            self._slots.release()
+
+        # The slot is held until the backend call really returns, even after a timeout
+        future.add_done_callback(release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise LLMTimeoutError(f"LLM call exceeded {self.timeout}s")
+
+
+class GatewayBackend:
+    """LLM backend that routes every generate_content call through an LLMGateway."""
+    def __init__(self, backend, gateway: LLMGateway):
+        self.backend = backend
+        self.gateway = gateway
+
+    def available(self, call_type: str = DEFAULT_CALL_TYPE) -> bool:
+        return self.gateway.available(call_type)
+
+    def generate_content(self, model: str, contents: str, config: Optional[dict] = None):
+        return self.gateway.call(self.backend.generate_content, model, contents, config,
+                                 call_type=call_type_of(model, config))
+
+
+_default_gateway = None
+_default_gateway_lock = threading.Lock()
+
+
+def default_gateway() -> LLMGateway:
+    """Process-wide gateway shared by all models."""
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is None:
+            _default_gateway = LLMGateway(
+                max_in_flight=int(os.getenv("MUSTADIL_LLM_MAX_IN_FLIGHT", "8")),
+                timeout=float(os.getenv("MUSTADIL_LLM_TIMEOUT", "20")),
+                max_retries=int(os.getenv("MUSTADIL_LLM_MAX_RETRIES", "2")),
+                breaker_factory=lambda call_type: CircuitBreaker(
+                    failure_threshold=int(os.getenv("MUSTADIL_LLM_BREAKER_THRESHOLD", "5")),
+                    reset_timeout=float(os.getenv("MUSTADIL_LLM_BREAKER_RESET", "30")),
+                    call_type=call_type,
+                ),
+            )
+        return _default_gateway
@@ -1,131 +1,233 @@
 import json
+import logging
+import os
+import threading
 from preprocessing import SafeIslamicArabicProcessor
 from tfidf_search import TFIDFSearchEngine
 from bm25_search import BM25SearchEngine
 from vsm_search import VectorSpaceModel
-from tfidf_search_lib import TFIDFSearchEngineLib
-from bm25_search_lib import BM25SearchEngineLib
-from vsm_search_lib import VectorSpaceModelLib
+from hybrid_search import HybridSearchEngine
+from bm25f_search import BM25FSearchEngine
+from sharded_search import ShardedSearchEngine
+from startup import LazyEngine, StartupReport, is_unbuilt
+from frozen_index import FrozenPostings, row_index
+from filters import load_filter_tables
+from term_dictionary import load_term_dictionary
+from stemming import LightStemmer, load_stem_index
+from near_duplicates import collapse_enabled, load_duplicate_clusters
+from english_text import EnglishTextProcessor, load_field_indices
+from impact_index import load_impact_index
 
 
-def load_engines_fast():
+# Engines whose modules import scikit-learn / rank_bm25: (key prefix, module, class).
+# They are built on first use unless listed in MUSTADIL_PRELOAD_ENGINES ("all" for every one).
+DEFERRED_ENGINES = [
+    ('tfidf_lib', 'tfidf_search_lib', 'TFIDFSearchEngineLib'),
+    ('bm25_lib', 'bm25_search_lib', 'BM25SearchEngineLib'),
+    ('vsm_lib', 'vsm_search_lib', 'VectorSpaceModelLib'),
+    ('lsa', 'lsa_search', 'LatentSemanticEngine'),
+]
+
+# The no-LLM fallback engines; with MUSTADIL_PRELOAD_FALLBACK=1 they are built in the background
+# right after loading (importing scikit-learn / scipy), otherwise on first use like the others
+FALLBACK_ENGINES = ('lsa_quran', 'lsa_hadith')
+
+logger = logging.getLogger(__name__)
+
+
+def _load_json(report: StartupReport, path: str):
+    with report.timed('index_load', os.path.basename(path)):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+def _build_engines(engines: list):
+    for engine in engines:
+        try:
+            engine.get()
+        except Exception:
+            logger.exception("Building deferred engine %s failed", engine.key)
+
+
+def load_engines_fast(indices_dir: str = 'indices'):
     """
     Load search engines from pre-built indices (much faster than rebuilding)
     """
+    report = StartupReport()
     processor = SafeIslamicArabicProcessor()
     
-    
-    with open('indices/quran_index.json', 'r', encoding='utf-8') as f:
-        quran_index = json.load(f)
-    
-    with open('indices/hadith_index.json', 'r', encoding='utf-8') as f:
-        hadith_index = json.load(f)
-    
-    with open('indices/quran_inverted_index.json', 'r', encoding='utf-8') as f:
-        quran_inverted_index = json.load(f)
-    
-    with open('indices/hadith_inverted_index.json', 'r', encoding='utf-8') as f:
-        hadith_inverted_index = json.load(f)
+    quran_index = _load_json(report, f'{indices_dir}/quran_index.json')
+    hadith_index = _load_json(report, f'{indices_dir}/hadith_index.json')
+    quran_inverted_index = _load_json(report, f'{indices_dir}/quran_inverted_index.json')
+    hadith_inverted_index = _load_json(report, f'{indices_dir}/hadith_inverted_index.json')
 
     
     quran_dict = {f"{r['chapter']}_{r['verse']}": r for r in quran_index}
     hadith_dict = {str(r['hadith_id']): r for r in hadith_index}
     
-    
-    tfidf_quran = TFIDFSearchEngine(
-        inverted_index=quran_inverted_index,
-        documents=quran_index,
-        total_docs=len(quran_index),
-        processor=processor
-    )
-    
-    tfidf_hadith = TFIDFSearchEngine(
-        inverted_index=hadith_inverted_index,
-        documents=hadith_index,
-        total_docs=len(hadith_index),
-        processor=processor
-    )
-    
-    bm25_quran = BM25SearchEngine(
-        name="Quran",
-        inverted_index=quran_inverted_index,
-        doc_metadata=quran_dict,
-        processor=processor
-    )
-    
-    bm25_hadith = BM25SearchEngine(
-        name="Hadith",
-        inverted_index=hadith_inverted_index,
-        doc_metadata=hadith_dict,
-        processor=processor
-    )
-    
-    vsm_quran = VectorSpaceModel(
-        name="Quran",
-        inverted_index=quran_inverted_index,
-        doc_metadata=quran_dict,
-        processor=processor
-    )
-    
-    vsm_hadith = VectorSpaceModel(
-        name="Hadith",
-        inverted_index=hadith_inverted_index,
-        doc_metadata=hadith_dict,
-        processor=processor
-    )
-    
-    tfidf_quran_lib = TFIDFSearchEngineLib(
-        documents=quran_index,
-        processor=processor
-    )
-    
-    tfidf_hadith_lib = TFIDFSearchEngineLib(
-        documents=hadith_index,
-        processor=processor
-    )
-    
-    bm25_quran_lib = BM25SearchEngineLib(
-        name="Quran",
-        documents=quran_index,
-        processor=processor
-    )
-    
-    bm25_hadith_lib = BM25SearchEngineLib(
-        name="Hadith",
-        documents=hadith_index,
-        processor=processor
-    )
-    
-    vsm_quran_lib = VectorSpaceModelLib(
-        name="Quran",
-        documents=quran_index,
-        processor=processor
-    )
-    
-    vsm_hadith_lib = VectorSpaceModelLib(
-        name="Hadith",
-        documents=hadith_index,
-        processor=processor
-    )
-    
-    
-    
-    return {
+    with report.timed('index_load', 'filters'):
+        quran_filters = load_filter_tables(quran_index, "quran", indices_dir)
+        hadith_filters = load_filter_tables(hadith_index, "hadith", indices_dir)
+    
+    with report.timed('index_load', 'term_dictionaries'):
+        quran_terms = load_term_dictionary(quran_inverted_index, "quran", indices_dir)
+        hadith_terms = load_term_dictionary(hadith_inverted_index, "hadith", indices_dir)
+    
+    stemmer = LightStemmer(processor)
+    with report.timed('index_load', 'stem_indices'):
+        quran_stem_index = load_stem_index(quran_inverted_index, stemmer, "quran", indices_dir)
+        hadith_stem_index = load_stem_index(hadith_inverted_index, stemmer, "hadith", indices_dir)
+    
+    english_processor = EnglishTextProcessor()
+    with report.timed('index_load', 'field_indices'):
+        quran_fields = load_field_indices(quran_index, english_processor, "quran", indices_dir)
+        hadith_fields = load_field_indices(hadith_index, english_processor, "hadith", indices_dir)
+    
+    with report.timed('index_load', 'impact_indices'):
+        quran_impacts = load_impact_index(quran_inverted_index, quran_index, "quran", indices_dir,
+                                          stem_index=quran_stem_index)
+        hadith_impacts = load_impact_index(hadith_inverted_index, hadith_index, "hadith", indices_dir,
+                                           stem_index=hadith_stem_index)
+    
+    # One read-only CSR copy of each corpus's postings (and stem postings), shared by every engine
+    shared = {}
+    with report.timed('index_load', 'frozen_postings'):
+        for corpus, doc_metadata, inverted_index, stem_index in (
+            ("quran", quran_dict, quran_inverted_index, quran_stem_index),
+            ("hadith", hadith_dict, hadith_inverted_index, hadith_stem_index),
+        ):
+            row_of = row_index(tuple(doc_metadata))
+            shared[corpus] = (FrozenPostings(inverted_index, row_of, len(row_of)),
+                              FrozenPostings(stem_index, row_of, len(row_of)))
+    
+    # MUSTADIL_COLLAPSE_DUPLICATES=0 returns near-duplicate documents as separate hits
+    quran_clusters = hadith_clusters = None
+    if collapse_enabled():
+        with report.timed('index_load', 'duplicate_clusters'):
+            quran_clusters = load_duplicate_clusters(quran_index, "quran", indices_dir)
+            hadith_clusters = load_duplicate_clusters(hadith_index, "hadith", indices_dir)
+    
+    engines = {
         'processor': processor,
+        'load_report': report,
         'quran_index': quran_index,
         'hadith_index': hadith_index,
         'quran_inverted_index': quran_inverted_index,
         'hadith_inverted_index': hadith_inverted_index,
-        'tfidf_quran': tfidf_quran,
-        'tfidf_hadith': tfidf_hadith,
-        'bm25_quran': bm25_quran,
-        'bm25_hadith': bm25_hadith,
-        'vsm_quran': vsm_quran,
-        'vsm_hadith': vsm_hadith,
-        'tfidf_lib_quran': tfidf_quran_lib,
-        'tfidf_lib_hadith': tfidf_hadith_lib,
-        'bm25_lib_quran': bm25_quran_lib,
-        'bm25_lib_hadith': bm25_hadith_lib,
-        'vsm_lib_quran': vsm_quran_lib,
-        'vsm_lib_hadith': vsm_hadith_lib
+        'quran_filters': quran_filters,
+        'hadith_filters': hadith_filters,
+        'quran_terms': quran_terms,
+        'hadith_terms': hadith_terms,
+        'quran_clusters': quran_clusters,
+        'hadith_clusters': hadith_clusters,
+        'quran_fields': quran_fields,
+        'hadith_fields': hadith_fields,
+        'quran_postings': shared['quran'][0],
+        'hadith_postings': shared['hadith'][0],
+        'quran_stem_postings': shared['quran'][1],
+        'hadith_stem_postings': shared['hadith'][1],
     }
+    
+    for corpus, index, doc_metadata, inverted_index, terms, stem_index, clusters, fields, impacts in (
+        ("quran", quran_index, quran_dict, quran_inverted_index, quran_terms, quran_stem_index, quran_clusters,
+         quran_fields, quran_impacts),
+        ("hadith", hadith_index, hadith_dict, hadith_inverted_index, hadith_terms, hadith_stem_index, hadith_clusters,
+         hadith_fields, hadith_impacts),
+    ):
+        name = corpus.capitalize()
+        postings, stem_postings = shared[corpus]
+        with report.timed('engine_build', f'tfidf_{corpus}'):
+            engines[f'tfidf_{corpus}'] = TFIDFSearchEngine(
+                name=name,
+                inverted_index=inverted_index,
+                documents=index,
+                total_docs=len(index),
+                processor=processor,
+                duplicate_clusters=clusters,
+                postings=postings
+            )
+        
+        with report.timed('engine_build', f'bm25_{corpus}'):
+            engines[f'bm25_{corpus}'] = BM25SearchEngine(
+                name=name,
+                inverted_index=inverted_index,
+                doc_metadata=doc_metadata,
+                processor=processor,
+                term_dictionary=terms,
+                stem_index=stem_index,
+                stemmer=stemmer,
+                duplicate_clusters=clusters,
+                impact_index=impacts,
+                postings=postings,
+                stem_postings=stem_postings
+            )
+        
+        with report.timed('engine_build', f'vsm_{corpus}'):
+            engines[f'vsm_{corpus}'] = VectorSpaceModel(
+                name=name,
+                inverted_index=inverted_index,
+                doc_metadata=doc_metadata,
+                processor=processor,
+                duplicate_clusters=clusters,
+                postings=postings
+            )
+        
+        with report.timed('engine_build', f'hybrid_{corpus}'):
+            engines[f'hybrid_{corpus}'] = HybridSearchEngine(
+                name=name,
+                inverted_index=inverted_index,
+                doc_metadata=doc_metadata,
+                processor=processor,
+                duplicate_clusters=clusters,
+                postings=postings
+            )
+        
+        with report.timed('engine_build', f'bm25f_{corpus}'):
+            engines[f'bm25f_{corpus}'] = BM25FSearchEngine(
+                name=name,
+                inverted_index=inverted_index,
+                doc_metadata=doc_metadata,
+                processor=processor,
+                field_indices=fields,
+                english_processor=english_processor,
+                duplicate_clusters=clusters,
+                postings=postings
+            )
+        
+        for prefix, module, class_name in DEFERRED_ENGINES:
+            kwargs = {'documents': index, 'processor': processor}
+            if prefix != 'tfidf_lib':
+                kwargs['name'] = name
+            engines[f'{prefix}_{corpus}'] = LazyEngine(f'{prefix}_{corpus}', module, class_name, kwargs, report)
+    
+    preload = os.getenv("MUSTADIL_PRELOAD_ENGINES", "")
+    for key in preload.split(','):
+        key = key.strip()
+        for engine_key, engine in engines.items():
+            if isinstance(engine, LazyEngine) and key in ('all', engine_key):
+                engine.get()
+    
+    fallback = [engines[key] for key in FALLBACK_ENGINES if key in engines]
+    if os.getenv("MUSTADIL_PRELOAD_FALLBACK", "") == "1" and any(is_unbuilt(e) for e in fallback):
+        threading.Thread(target=_build_engines, args=(fallback,), name="preload-fallback", daemon=True).start()
+    
+    # MUSTADIL_<CORPUS>_SHARDS=book|<n> serves that corpus from worker processes as "bm25_sharded"
+    for corpus, inverted_index, doc_metadata, terms, stem_index, clusters in (
+        ("quran", quran_inverted_index, quran_dict, quran_terms, quran_stem_index, quran_clusters),
+        ("hadith", hadith_inverted_index, hadith_dict, hadith_terms, hadith_stem_index, hadith_clusters),
+    ):
+        spec = os.getenv(f"MUSTADIL_{corpus.upper()}_SHARDS")
+        if spec:
+            with report.timed('engine_build', f'bm25_sharded_{corpus}'):
+                engines[f'bm25_sharded_{corpus}'] = ShardedSearchEngine(
+                    name=corpus.capitalize(),
+                    inverted_index=inverted_index,
+                    doc_metadata=doc_metadata,
+                    spec=spec,
+                    term_dictionary=terms,
+                    stem_index=stem_index,
+                    replicas=int(os.getenv("MUSTADIL_SHARD_REPLICAS", "1")),
+                    duplicate_clusters=clusters
+                )
+    
+    return engines
@@ -0,0 +1,95 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
+from typing import List, Dict, Any
+from preprocessing import SafeIslamicArabicProcessor
+from filters import DocFilter
+
+
+class LatentSemanticEngine:
+    """
+    Latent semantic (LSA) retrieval over the token index. Documents are
+    embedded with TruncatedSVD of their TF-IDF matrix into a row-normalized
+    float32 matrix, searched with a blocked exact dot product.
+    Needs no LLM call, so it can serve the user question directly.
+    """
+    def __init__(self, name: str, documents: list, processor: SafeIslamicArabicProcessor,
+                 n_components: int = 200, max_df: float = 0.5, block_size: int = 4096,
+                 random_state: int = 42):
+        self.name = name
+        self.documents = documents
+        self.processor = processor
+        self.block_size = block_size
+
+        self.idx_to_doc_id = {}
+        doc_texts = []
+        for idx, doc in enumerate(documents):
+            doc_texts.append(' '.join(doc.get('tokens', [])))
+            if 'chapter' in doc and 'verse' in doc:
+                self.idx_to_doc_id[idx] = f"{doc['chapter']}_{doc['verse']}"
+            elif 'hadith_id' in doc:
+                self.idx_to_doc_id[idx] = str(doc['hadith_id'])
+            else:
+                self.idx_to_doc_id[idx] = str(idx)
+
+        self.vectorizer = TfidfVectorizer(
+            tokenizer=lambda x: x.split(),
+            lowercase=False,
+            token_pattern=None,
+            sublinear_tf=True,
+            max_df=max_df
+        )
+        term_matrix = self.vectorizer.fit_transform(doc_texts)
+
+        n_components = max(1, min(n_components, term_matrix.shape[1] - 1, term_matrix.shape[0] - 1))
+        self.svd = TruncatedSVD(n_components=n_components, random_state=random_state)
+        embeddings = self.svd.fit_transform(term_matrix).astype(np.float32)
+        self.embeddings = self._normalize_rows(embeddings)
+
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed(self, query: str) -> np.ndarray:
+        query_tokens = self.processor.preprocess(query)['tokens']
+        if not query_tokens:
+            return None
+        query_vector = self.vectorizer.transform([' '.join(query_tokens)])
+        if query_vector.nnz == 0:
+            return None
+        embedding = self.svd.transform(query_vector).astype(np.float32)
+        return self._normalize_rows(embedding)[0]
+
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
+        query_embedding = self.embed(query)
+        if query_embedding is None:
+            return []
+
+        rows = np.arange(self.embeddings.shape[0]) if doc_filter is None else doc_filter.rows
+        best_idx = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block_rows = rows[start:start + self.block_size]
+            block = self.embeddings[start:start + self.block_size] if doc_filter is None else self.embeddings[block_rows]
+            block_scores = block @ query_embedding
+            k = min(top_k, block_scores.shape[0])
+            block_top = np.argpartition(-block_scores, k - 1)[:k]
+            best_idx = np.concatenate([best_idx, block_rows[block_top]])
+            best_scores = np.concatenate([best_scores, block_scores[block_top]])
+
+        order = np.argsort(-best_scores)[:top_k]
+
+        results = []
+        for idx, score in zip(best_idx[order], best_scores[order]):
+            if score > 0:
+                doc = self.documents[idx]
+                results.append({
+                    'doc_id': self.idx_to_doc_id[idx],
+                    'score': float(score),
+                    'text': doc.get('arabic_original', ''),
+                    'metadata': doc
+                })
+
+        return results
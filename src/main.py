@@ -1,8 +1,22 @@
-from fastapi import FastAPI
+import os
+import time
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
 from load_engines import load_engines_fast
 from gemini_llm import SearchModelOne, SearchModelTwo
-from run_user_query import run_query, run_query_model_two
+from run_user_query import run_pipeline
 from schemas import AppSearchResponse
+from metrics import (REGISTRY, REQUEST_LATENCY, current_request_timings, search_budget, start_request_timings,
+                     server_timing_header)
+from profiling import PROFILE_MODES, profiling_enabled, profile_call, save_profile
+from singleflight import SingleFlight
+from filters import filters_from_params
+from boolean_query import BooleanQueryError
+from engine_registry import EngineRegistry
+from query_log import query_log_from_env
+from serialization import json_response, parse_fields
+from diagnostics import memory_report
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -15,35 +29,197 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-engines = {}
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    timings['total'] = elapsed
+    response.headers['Server-Timing'] = server_timing_header(timings)
+    route = request.scope.get('route')
+    REQUEST_LATENCY.observe(elapsed, path=route.path if route else 'unmatched')
+    return response
+
+registry = EngineRegistry(load_engines_fast)
 llm_model = {
     "m1": SearchModelOne(),
     "m2": SearchModelTwo()
 }
+inflight_searches = SingleFlight("search")
+# MUSTADIL_QUERY_LOG=<path> appends every /search request to a JSONL log (see replay.py)
+query_log = query_log_from_env()
+# Default per-request search deadline (ms, LLM stages included) and per-search postings budget;
+# searches that run out return their best-so-far top-k and the response has "exact": false
+SEARCH_DEADLINE_MS = os.getenv("MUSTADIL_SEARCH_DEADLINE_MS")
+SEARCH_POSTINGS_BUDGET = os.getenv("MUSTADIL_SEARCH_POSTINGS_BUDGET")
 
 
 
 @app.on_event("startup")
 async def startup_event():
-    global engines
-    engines = load_engines_fast()
-
-
-@app.get("/search/{engine}/{model}/{query}")
-def search(query: str, engine: str = "bm25", model: str = "m1") -> AppSearchResponse:
-    engine_quran = engines.get(f'{engine}_quran', engines.get('bm25_quran'))
-    engine_hadith = engines.get(f'{engine}_hadith', engines.get('bm25_hadith'))
-    
-    selected_model = llm_model.get(model, llm_model["m1"])
-    
-    if model == "m2":
-        return run_query_model_two(query, engine_quran, engine_hadith, selected_model)
+    registry.load()
+    # MUSTADIL_INDEX_WATCH=<seconds> reloads automatically when the index files change
+    watch_interval = os.getenv("MUSTADIL_INDEX_WATCH")
+    if watch_interval:
+        registry.watch(float(watch_interval))
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if query_log is not None:
+        query_log.close()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/search/{engine}/{model}/{query}", response_model=AppSearchResponse)
+def search(query: str, engine: str = "bm25", model: str = "m1",
+           surah: Optional[int] = None, verse_from: Optional[int] = None, verse_to: Optional[int] = None,
+           book: Optional[str] = None, chapter_id: Optional[int] = None,
+           full_text: bool = False, fields: Optional[str] = None,
+           deadline_ms: Optional[int] = None) -> Response:
+    try:
+        result_fields = parse_fields(fields)
+        filters = filters_from_params(surah, verse_from, verse_to, book, chapter_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    normalized = ' '.join(registry.current()['processor'].preprocess(query)['normalized'].split())
+    if deadline_ms is None and SEARCH_DEADLINE_MS:
+        deadline_ms = int(SEARCH_DEADLINE_MS)
+    key = (normalized, engine, model, repr(filters), full_text, deadline_ms)
+    start = time.perf_counter()
+    try:
+        response, shared = inflight_searches.do(
+            key, lambda: run_search(query, engine, model, filters, full_text, deadline_ms))
+    except BooleanQueryError as e:
+        log_search(query, engine, model, filters, full_text, start, error=str(e))
+        raise HTTPException(status_code=400, detail=f"Invalid boolean query: {e}")
+    log_search(query, engine, model, filters, full_text, start, response=response, shared=shared)
+    return json_response(response, result_fields)
+
+
+def log_search(query: str, engine: str, model: str, filters: dict, full_text: bool, start: float,
+               response: Optional[AppSearchResponse] = None, shared: bool = False, error: Optional[str] = None):
+    if query_log is None:
+        return
+    entry = {
+        'question': query,
+        'engine': engine,
+        'model': model,
+        'filters': {corpus: spec for corpus, spec in filters.items() if spec},
+        'full_text': full_text,
+        'latency': time.perf_counter() - start,
+        'timings': current_request_timings(),
+        'shared': shared,
+    }
+    if response is not None:
+        entry['generated_queries'] = response.generated_queries
+        entry['result_ids'] = [item.doc_id for item in response.results]
+    if error is not None:
+        entry['error'] = error
+    query_log.record(entry)
+
+
+@app.get("/autocomplete/{corpus}/{prefix}")
+def autocomplete(corpus: str, prefix: str, limit: int = 10):
+    """Most frequent indexed terms starting with the last (partially typed) word of prefix."""
+    engines = registry.current()
+    terms = engines.get(f'{corpus}_terms')
+    if terms is None:
+        raise HTTPException(status_code=404, detail=f"Unknown corpus: {corpus}")
+    words = engines['processor'].preprocess(prefix)['normalized'].split()
+    if not words:
+        return {"prefix": prefix, "completions": []}
+    completions = terms.complete(words[-1], limit=max(1, min(limit, 50)))
+    return {"prefix": prefix, "completions": [{"term": t, "df": df} for t, df in completions]}
+
+
+def require_admin():
+    if os.getenv("MUSTADIL_ADMIN") != "1":
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+
+
+@app.post("/admin/reload")
+def reload_engines(indices_dir: Optional[str] = None):
+    """
+    Build and warm a new engine set from indices_dir (default: the current one)
+    in the background, then swap it in without dropping requests.
+    Only available when MUSTADIL_ADMIN=1.
+    """
+    require_admin()
+    if indices_dir is not None and not os.path.isdir(indices_dir):
+        raise HTTPException(status_code=400, detail=f"No such index directory: {indices_dir}")
+    started = registry.reload(indices_dir)
+    return {"started": started, **registry.status()}
+
+
+@app.get("/admin/engines")
+def engines_status():
+    """Serving index version, reload status and startup timings. Only available when MUSTADIL_ADMIN=1."""
+    require_admin()
+    return registry.status()
+
+
+@app.get("/admin/memory")
+def engines_memory(top: int = 10):
+    """
+    Memory footprint and index statistics of the serving engine set.
+    Deferred engines that have not been used yet are listed as not built.
+    Only available when MUSTADIL_ADMIN=1.
+    """
+    require_admin()
+    with registry.acquire() as engines:
+        return memory_report(engines, top=max(0, min(top, 100)))
+
+
+@app.get("/admin/profile/{engine}/{model}/{query}")
+def profile_search(query: str, engine: str = "bm25", model: str = "m1", mode: str = "cprofile",
+                   sort: str = "cumulative", limit: int = 40, save: bool = False):
+    """
+    Run the /search pipeline under a profiler and return the report.
+    Scoring runs on the request thread while profiled; profile requests run one at a time.
+    Only available when MUSTADIL_ADMIN=1 and MUSTADIL_PROFILING=1.
+    """
+    require_admin()
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {PROFILE_MODES}")
+
+    result, report, dump = profile_call(run_search, query, engine, model, mode=mode, sort=sort, limit=limit)
+    return {
+        "result": result,
+        "profile": report,
+        "note": "LLM calls run on gateway threads and show up only as time waiting for their result",
+        "saved_to": save_profile(dump, mode, f"{engine}-{model}-{query}") if save else None
+    }
+
+
+def run_search(query: str, engine: str, model: str, filters: Optional[dict] = None,
+               full_text: bool = False, deadline_ms: Optional[int] = None) -> AppSearchResponse:
+    if deadline_ms is None and not SEARCH_POSTINGS_BUDGET:
+        budget = None
     else:
-        return run_query(query, engine_quran, engine_hadith, selected_model)
+        budget = search_budget(deadline_ms / 1000 if deadline_ms is not None else None,
+                               int(SEARCH_POSTINGS_BUDGET) if SEARCH_POSTINGS_BUDGET else None)
+    # The engine set stays pinned until the search returns, even if a reload swaps it meanwhile
+    with registry.acquire() as engines:
+        if budget is None:
+            return run_pipeline(engines, query, engine, model, llm_model, filters, full_text)
+        with budget as limits:
+            response = run_pipeline(engines, query, engine, model, llm_model, filters, full_text)
+        response.exact = limits.exact
+        return response
+
 
 if __name__ == "__main__":
     import uvicorn
-    engines = load_engines_fast()
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,245 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        escaped = [(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+        return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        bucket_idx = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bucket_idx] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', str(bound)))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'mustadil_request_seconds', 'End-to-end HTTP request latency.', ('path',))
+STAGE_LATENCY = REGISTRY.histogram(
+    'mustadil_stage_seconds', 'Latency of each search pipeline stage.', ('stage',))
+SEARCH_LATENCY = REGISTRY.histogram(
+    'mustadil_engine_search_seconds', 'Latency of a single engine.search call.', ('engine', 'corpus'))
+POSTINGS_TRAVERSED = REGISTRY.counter(
+    'mustadil_postings_traversed_total', 'Postings entries visited while scoring.', ('engine', 'corpus'))
+LLM_TOKENS = REGISTRY.counter(
+    'mustadil_llm_tokens_total', 'LLM tokens used, by model and kind (prompt/output).', ('model', 'kind'))
+CACHE_HITS = REGISTRY.counter(
+    'mustadil_cache_hits_total', 'Requests answered from a shared or cached result.', ('cache',))
+ANYTIME_SEARCHES = REGISTRY.counter(
+    'mustadil_anytime_searches_total',
+    'Deadline-bounded bm25 searches by outcome (regular/complete/truncated).', ('outcome', 'corpus'))
+
+
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Start collecting stage timings (in seconds) for the current request context."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def current_request_timings() -> Dict[str, float]:
+    """A copy of the stage timings collected so far for the current request."""
+    return dict(_request_timings.get() or {})
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage into STAGE_LATENCY and the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+class SearchBudget:
+    """A deadline (time.perf_counter() value) and/or per-search postings budget for one request's searches."""
+
+    def __init__(self, seconds: Optional[float] = None, postings: Optional[int] = None):
+        self.deadline = time.perf_counter() + seconds if seconds is not None else None
+        self.postings = postings
+        # Turns False once any search returns a best-so-far cut-off
+        self.exact = True
+
+
+_search_budget: ContextVar[Optional[SearchBudget]] = ContextVar('search_budget', default=None)
+
+
+@contextmanager
+def search_budget(seconds: Optional[float] = None, postings: Optional[int] = None):
+    """Bound every timed_search in this context by one shared deadline and a postings budget."""
+    budget = SearchBudget(seconds, postings)
+    token = _search_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _search_budget.reset(token)
+
+
+def timed_search(engine, query: str, top_k: int, corpus: str, doc_filter=None) -> list:
+    start = time.perf_counter()
+    budget = _search_budget.get()
+    if budget is not None and getattr(type(engine), 'supports_budget', False):
+        # Engines that take a deadline return their best-so-far top-k when it would be overrun.
+        # Checked on the class, so a deferred engine (startup.LazyEngine) is not built for it
+        results = engine.search(query, top_k=top_k, doc_filter=doc_filter,
+                                deadline=budget.deadline, postings_budget=budget.postings)
+        budget.exact = budget.exact and getattr(results, 'exact', True)
+    else:
+        results = engine.search(query, top_k=top_k, doc_filter=doc_filter)
+    # Deferred engines (startup.LazyEngine) report the class they stand in for
+    label = getattr(engine, 'engine_label', None) or type(engine).__name__
+    SEARCH_LATENCY.observe(time.perf_counter() - start, engine=label, corpus=corpus)
+    return results
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
@@ -0,0 +1,146 @@
+"""
+Near-duplicate clusters built at index time with MinHash / LSH over token
+shingles, so that repeated verses (e.g. فباي ءالاء ربكما تكذبان) and hadiths
+with a near-identical matn collapse to their best hit in a result list.
+
+Candidate pairs from the LSH bands are confirmed by the exact Jaccard
+similarity of their shingle sets. Hadiths that only share an isnad stay
+apart at the default threshold.
+
+Clusters are stored as {doc_id: cluster_id} for the documents that have a
+near duplicate. The cluster id is the doc id of the cluster's first
+document in index order.
+"""
+import json
+import os
+import zlib
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+import numpy as np
+from frozen_index import readonly
+from filters import doc_id_of
+
+SHINGLE_SIZE = 4
+NUM_PERM = 64
+BANDS = 16
+THRESHOLD = 0.7
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = np.iinfo(np.uint64).max
+
+
+def shingles(tokens: Sequence[str], size: int = SHINGLE_SIZE) -> Set[str]:
+    """Token k-grams; a document shorter than size is one shingle."""
+    if len(tokens) <= size:
+        return {' '.join(tokens)} if tokens else set()
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash_signatures(shingle_sets: List[Set[str]], num_perm: int = NUM_PERM, seed: int = 1) -> np.ndarray:
+    """One row of num_perm min-hashes per shingle set (all-max for an empty set)."""
+    rng = np.random.default_rng(seed)
+    # a < 2^31 and crc32 < 2^32, so a * h + b fits in uint64
+    a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+    signatures = np.full((len(shingle_sets), num_perm), _MAX_HASH, dtype=np.uint64)
+    for row, shingle_set in enumerate(shingle_sets):
+        if not shingle_set:
+            continue
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingle_set),
+                             dtype=np.uint64, count=len(shingle_set))
+        signatures[row] = ((np.outer(hashes, a) + b) % _MERSENNE_PRIME).min(axis=0)
+    return signatures
+
+
+def build_duplicate_clusters(index_data: list, threshold: float = THRESHOLD, shingle_size: int = SHINGLE_SIZE,
+                             num_perm: int = NUM_PERM, bands: int = BANDS) -> Dict[str, str]:
+    """Cluster one corpus's forward index; returns {doc_id: cluster_id} for clustered documents only."""
+    shingle_sets = [shingles(doc.get('tokens', []), shingle_size) for doc in index_data]
+    signatures = minhash_signatures(shingle_sets, num_perm)
+
+    parent = list(range(len(index_data)))
+
+    def find(row: int) -> int:
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    rows_per_band = num_perm // bands
+    checked = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        band_keys = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for row, shingle_set in enumerate(shingle_sets):
+            if shingle_set:
+                buckets[band_keys[row].tobytes()].append(row)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                if (first, other) in checked or find(first) == find(other):
+                    continue
+                checked.add((first, other))
+                a, b = shingle_sets[first], shingle_sets[other]
+                if len(a & b) >= threshold * len(a | b):
+                    # The lower row becomes the root, so the cluster id is its first document
+                    root_a, root_b = find(first), find(other)
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    sizes = defaultdict(int)
+    for row in range(len(index_data)):
+        sizes[find(row)] += 1
+    return {
+        doc_id_of(doc, row): doc_id_of(index_data[find(row)], find(row))
+        for row, doc in enumerate(index_data) if sizes[find(row)] > 1
+    }
+
+
+def save_duplicate_clusters(clusters: Dict[str, str], name: str, output_dir: str = 'indices'):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(f'{output_dir}/{name}_clusters.json', 'w', encoding='utf-8') as f:
+        json.dump(clusters, f, ensure_ascii=False)
+
+
+def load_duplicate_clusters(index_data: list, name: str, input_dir: str = 'indices') -> Dict[str, str]:
+    """Load the clusters built at index time, or build them if the file is missing (older indices)."""
+    path = f'{input_dir}/{name}_clusters.json'
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return build_duplicate_clusters(index_data)
+
+
+def cluster_array(clusters: Optional[Dict[str, str]], doc_ids: Sequence[str]) -> Optional[np.ndarray]:
+    """Read-only row -> cluster number for an engine's doc order; unclustered rows get a number of their own."""
+    if clusters is None:
+        return None
+    numbers = {}
+    out = np.empty(len(doc_ids), dtype=np.int64)
+    for row, doc_id in enumerate(doc_ids):
+        key = clusters.get(doc_id)
+        out[row] = numbers.setdefault(key, len(doc_ids) + len(numbers)) if key is not None else row
+    return readonly(out)
+
+
+def collapse_duplicates(ranked: Iterable, key: Callable, top_k: Optional[int] = None) -> list:
+    """Keep the first (best) item of each cluster key from an already ranked sequence."""
+    seen = set()
+    kept = []
+    for item in ranked:
+        cluster = key(item)
+        if cluster in seen:
+            continue
+        seen.add(cluster)
+        kept.append(item)
+        if top_k is not None and len(kept) >= top_k:
+            break
+    return kept
+
+
+def result_cluster(res: dict):
+    """Cluster key of a search result: its cluster id, or its doc id when it has no near duplicate."""
+    return res.get('cluster_id') or res['doc_id']
+
+
+def collapse_enabled() -> bool:
+    return os.getenv("MUSTADIL_COLLAPSE_DUPLICATES", "1") != "0"
@@ -0,0 +1,166 @@
+"""
+On-demand profiling of the search pipeline.
+
+Usage (single engine over a query file, one query per line):
+    python profiling.py --engine bm25 --corpus quran --queries queries.txt
+    python profiling.py --engine vsm --corpus hadith --queries queries.txt --mode sampling --output vsm.folded
+"""
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Tuple
+from frozen_index import serial_scoring
+
+PROFILE_MODES = ("cprofile", "sampling")
+PROFILES_DIR = os.getenv("MUSTADIL_PROFILES_DIR", "profiles")
+
+# One profiled call at a time: profilers are per process, and concurrent runs would mix their stacks
+_profile_lock = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("MUSTADIL_PROFILING", "") == "1"
+
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread at a fixed interval and aggregates
+    the stacks in collapsed ("folded") form, ready for flamegraph tools.
+    """
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target_thread = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._target_thread = threading.get_ident()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def report(self, limit: int = 40) -> str:
+        total = sum(self.stacks.values()) or 1
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        lines = [f"{total} samples every {self.interval * 1000:.1f} ms", "  self%  samples  frame"]
+        for leaf, count in leaves.most_common(limit):
+            lines.append(f"{100 * count / total:6.1f}% {count:8d}  {leaf}")
+        return '\n'.join(lines)
+
+
+def profile_call(fn: Callable, *args, mode: str = "cprofile", sort: str = "cumulative",
+                 limit: int = 40, **kwargs) -> Tuple[Any, str, Any]:
+    """
+    Run fn(*args, **kwargs) under the chosen profiler.
+    Returns (result, human-readable report, raw dump) where the dump is the
+    cProfile.Profile (cprofile) or the folded stacks text (sampling).
+
+    Both profilers only see the calling thread, so scoring runs on it instead
+    of frozen_index's thread pool, and calls are serialized.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+
+    with _profile_lock, serial_scoring():
+        if mode == "sampling":
+            profiler = SamplingProfiler()
+            profiler.start()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                profiler.stop()
+            return result, profiler.report(limit), profiler.folded()
+
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, *args, **kwargs)
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return result, out.getvalue(), profiler
+
+
+def save_profile(dump, mode: str, label: str, output_dir: str = PROFILES_DIR) -> str:
+    """Store a profile dump; .prof files open with snakeviz/pstats, .folded with flamegraph.pl."""
+    os.makedirs(output_dir, exist_ok=True)
+    safe_label = ''.join(c if c.isalnum() else '_' for c in label)[:40]
+    extension = "prof" if mode == "cprofile" else "folded"
+    path = os.path.join(output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}.{extension}")
+    if mode == "cprofile":
+        dump.dump_stats(path)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(dump)
+    return path
+
+
+def _search_queries(engine, queries, top_k: int, repeat: int):
+    for _ in range(repeat):
+        for q in queries:
+            engine.search(q, top_k=top_k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile one engine's search over a query file.")
+    parser.add_argument("--engine", default="bm25", help="Engine key, e.g. bm25, vsm_lib, hybrid")
+    parser.add_argument("--corpus", default="quran", choices=["quran", "hadith"])
+    parser.add_argument("--queries", required=True, help="Text file with one query per line")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--mode", default="cprofile", choices=PROFILE_MODES)
+    parser.add_argument("--sort", default="cumulative")
+    parser.add_argument("--limit", type=int, default=40)
+    parser.add_argument("--output", help="Write the raw profile (.prof or folded stacks) here")
+    args = parser.parse_args()
+
+    from load_engines import load_engines_fast
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    engines = load_engines_fast()
+    engine = engines[f"{args.engine}_{args.corpus}"]
+
+    _, report, dump = profile_call(
+        _search_queries, engine, queries, args.top_k, args.repeat,
+        mode=args.mode, sort=args.sort, limit=args.limit
+    )
+    print(report)
+
+    if args.output:
+        if args.mode == "cprofile":
+            dump.dump_stats(args.output)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(dump)
+        print(f"Profile written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Append-only JSONL log of /search traffic, written off the request path.
+
+Set MUSTADIL_QUERY_LOG=<path> to enable it. Requests only put a small dict
+on a bounded queue; a writer thread serializes and appends the entries.
+When the queue is full, entries are dropped (and counted) rather than
+slowing requests down. Replay a log with replay.py.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+QUERY_LOG_ENTRIES = REGISTRY.counter(
+    'mustadil_query_log_entries_total', 'Query log entries by outcome (written/dropped).', ('outcome',))
+
+_STOP = object()
+
+
+class QueryLog:
+    def __init__(self, path: str, max_queue: int = 10_000, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="query-log", daemon=True)
+        self._writer.start()
+
+    def record(self, entry: dict):
+        """Queue one entry; never blocks the caller."""
+        entry.setdefault('ts', time.time())
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            QUERY_LOG_ENTRIES.inc(outcome="dropped")
+
+    def _write_loop(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                try:
+                    entry = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    f.flush()
+                    continue
+                if entry is _STOP:
+                    break
+                try:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+                    QUERY_LOG_ENTRIES.inc(outcome="written")
+                except (TypeError, ValueError):
+                    logger.exception("Unserializable query log entry")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self, timeout: float = 5.0):
+        """Write out what is queued and stop the writer."""
+        self._queue.put(_STOP)
+        self._writer.join(timeout)
+
+
+def query_log_from_env() -> Optional[QueryLog]:
+    path = os.getenv("MUSTADIL_QUERY_LOG")
+    return QueryLog(path) if path else None
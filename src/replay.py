@@ -0,0 +1,162 @@
+"""
+Replay a query log (MUSTADIL_QUERY_LOG) as load.
+
+Usage:
+    python replay.py queries.jsonl --url http://localhost:8000 --rate 10 --concurrency 8
+    python replay.py queries.jsonl --direct --concurrency 4    # engines in-process, no server or LLM
+    python replay.py queries.jsonl --direct --json replay.json --limit 500
+
+--url re-issues each logged /search request against a running server.
+--direct runs each entry's logged generated queries (or, if none were
+generated, the question itself) through the engines. This is the
+retrieval load without the LLM calls.
+
+With --rate, requests are sent on a fixed schedule (open loop).
+Latency is measured from each request's scheduled start, so time spent
+queued behind --concurrency counts.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote
+from benchmark import latency_summary
+
+# Logged filter spec fields -> /search query parameters
+FILTER_PARAMS = {
+    'quran': {'chapter': 'surah', 'verse_from': 'verse_from', 'verse_to': 'verse_to'},
+    'hadith': {'book': 'book', 'chapter_id': 'chapter_id'},
+}
+
+
+def read_log(path: str, limit: Optional[int] = None) -> List[dict]:
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entries.append(json.loads(line))
+            if limit and len(entries) >= limit:
+                break
+    return entries
+
+
+def http_sender(base_url: str, timeout: float) -> Callable[[dict], None]:
+    import httpx
+    client = httpx.Client(base_url=base_url.rstrip('/'), timeout=timeout)
+
+    def send(entry: dict):
+        params = {'full_text': str(entry.get('full_text', False)).lower()}
+        for corpus, spec in (entry.get('filters') or {}).items():
+            for field, param in FILTER_PARAMS.get(corpus, {}).items():
+                if spec.get(field) is not None:
+                    params[param] = spec[field]
+        path = f"/search/{entry.get('engine', 'bm25')}/{entry.get('model', 'm1')}/{quote(entry['question'], safe='')}"
+        client.get(path, params=params).raise_for_status()
+
+    return send
+
+
+def direct_sender(top_k: int) -> Callable[[dict], None]:
+    from load_engines import load_engines_fast
+    engines = load_engines_fast()
+
+    def send(entry: dict):
+        engine = entry.get('engine', 'bm25')
+        queries = entry.get('generated_queries') or [
+            {'type': corpus, 'query': entry['question']} for corpus in ('quran', 'hadith')]
+        for q in queries:
+            corpus = q['type']
+            spec = (entry.get('filters') or {}).get(corpus)
+            doc_filter = engines[f'{corpus}_filters'].resolve(spec) if spec else None
+            search_engine = engines.get(f'{engine}_{corpus}', engines[f'bm25_{corpus}'])
+            search_engine.search(q['query'], top_k=top_k, doc_filter=doc_filter)
+
+    return send
+
+
+def replay(entries: List[dict], send: Callable[[dict], None], rate: Optional[float],
+           concurrency: int) -> Dict[str, object]:
+    latencies = []
+    by_route = {}
+    errors = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def run(i: int, entry: dict):
+        scheduled = start + i / rate if rate else time.perf_counter()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            send(entry)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            if error is None:
+                latencies.append(elapsed)
+                by_route.setdefault(f"{entry.get('engine', 'bm25')}/{entry.get('model', 'm1')}", []).append(elapsed)
+            else:
+                errors.append(error)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, entry in enumerate(entries):
+            pool.submit(run, i, entry)
+    wall_time = time.perf_counter() - start
+
+    return {
+        "overall": latency_summary(latencies, wall_time),
+        "by_route": {route: latency_summary(values, wall_time) for route, values in sorted(by_route.items())},
+        "errors": len(errors),
+        "sample_errors": errors[:5],
+        "wall_time_s": wall_time,
+    }
+
+
+def print_report(report: Dict[str, object]):
+    header = f"{'route':<20}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'QPS':>8}"
+    print(header)
+    print('-' * len(header))
+    rows = [("overall", report["overall"])] + list(report["by_route"].items())
+    for route, s in rows:
+        print(f"{route:<20}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['qps']:>8.1f}")
+    print(f"\nerrors: {report['errors']}   wall time: {report['wall_time_s']:.1f}s")
+    for error in report["sample_errors"]:
+        print(f"  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a captured query log")
+    parser.add_argument("log", help="JSONL query log written with MUSTADIL_QUERY_LOG")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running server")
+    target.add_argument("--direct", action="store_true", help="Search the engines in-process")
+    parser.add_argument("--rate", type=float, help="Requests per second (default: as fast as --concurrency allows)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--limit", type=int, help="Replay at most this many entries")
+    parser.add_argument("--top-k", type=int, default=5, help="With --direct, results per generated query")
+    parser.add_argument("--timeout", type=float, default=60.0, help="With --url, per-request timeout (s)")
+    parser.add_argument("--json", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    entries = read_log(args.log, args.limit)
+    if not entries:
+        print(f"No entries in {args.log}")
+        sys.exit(1)
+    send = direct_sender(args.top_k) if args.direct else http_sender(args.url, args.timeout)
+
+    report = replay(entries, send, args.rate, args.concurrency)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
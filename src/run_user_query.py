@@ -1,109 +1,291 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from schemas import AppSearchResponse, SearchResultItem, QuranMetadata, HadithMetadata
 from gemini_llm import SearchModelOne, SearchModelTwo
+from fusion import FUSION_METHODS
+from metrics import stage, timed_search
+from filters import DocFilter, resolve_doc_filters
+from boolean_query import is_boolean_query
+from snippets import make_snippet, match_positions
+from near_duplicates import collapse_duplicates, result_cluster
+from english_text import detect_language
+from startup import is_unbuilt
 
-def run_query(user_question: str, engine_quran, engine_hadith, model: SearchModelOne) -> AppSearchResponse:
-    queries = model.generate_queries(user_question)
-    
+# Maximum number of unique candidates per source sent to the validator
+CANDIDATE_BUDGET = {"quran": 8, "hadith": 8}
 
-    query_results_map = []
-    for q in queries:
-        if q['type'] == "quran":
-            engine = engine_quran
-        else:
-            engine = engine_hadith
-
-        raw_results = engine.search(q['query'], top_k=5)
-        query_results_map.append({
-            'query': q['query'],
-            'type': q['type'],
-            'results': raw_results
+# Results per source when the LLM is unavailable and the question is searched directly
+FALLBACK_TOP_K = 5
+
+# English questions are searched directly against the English fields of this engine
+ENGLISH_ENGINE = "bm25f"
+
+
+def build_result_item(res: Dict[str, Any], is_relevant: Optional[bool], observation: Optional[str],
+                      full_text: bool = False) -> SearchResultItem:
+    # Fields come straight from our own index, so the models are built without validation
+    meta_raw = res['metadata']
+    if 'chapter' in meta_raw:
+        meta = QuranMetadata.model_construct(chapter=meta_raw['chapter'], verse=meta_raw['verse'])
+    else:
+        meta = HadithMetadata.model_construct(
+            book=meta_raw.get('book', ''),
+            hadith_number=meta_raw.get('hadith_number', 0),
+            hadith_id=meta_raw.get('hadith_id')
+        )
+    positions = res.get('positions')
+    if positions is None:
+        positions = match_positions(meta_raw.get('tokens', []), res.get('matched_tokens', []))
+    snippet = make_snippet(res['text'], meta_raw.get('tokens', []), positions)
+    return SearchResultItem.model_construct(
+        doc_id=res.get('doc_id'),
+        text=res['text'] if full_text else None,
+        snippet=snippet['snippet'],
+        highlights=snippet['highlights'],
+        metadata=meta,
+        score=res.get('score'),
+        is_relevant=is_relevant,
+        observation=observation
+    )
+
+
+def _first_seen(res: Dict[str, Any], seen: set) -> bool:
+    """True the first time a result's text or near-duplicate cluster comes up; records both."""
+    keys = (('text', res['text']), ('cluster', result_cluster(res)))
+    if any(key in seen for key in keys):
+        return False
+    seen.update(keys)
+    return True
+
+
+def _is_excluded(doc_filters: Optional[Dict[str, DocFilter]], corpus: str) -> bool:
+    doc_filter = (doc_filters or {}).get(corpus)
+    return doc_filter is not None and len(doc_filter) == 0
+
+
+def run_direct_query(user_question: str, engine_quran, engine_hadith, top_k: int = FALLBACK_TOP_K,
+                     doc_filters: Optional[Dict[str, DocFilter]] = None, full_text: bool = False,
+                     observation: str = "Direct search (no LLM)", degraded: bool = False,
+                     fallback_quran=None, fallback_hadith=None) -> AppSearchResponse:
+    """
+    No-LLM fast path: search the user question directly on both corpora.
+    Used when query generation returns nothing (missing API key, LLM errors),
+    which marks the response degraded, and for boolean and English questions.
+    A fallback (LSA) engine that is already built is RRF-fused with the
+    lexical results; one that is not yet built is skipped rather than waited on.
+    """
+    raw_results = []
+    with stage("direct_search"):
+        for corpus, engine, fallback in (("quran", engine_quran, fallback_quran),
+                                         ("hadith", engine_hadith, fallback_hadith)):
+            if _is_excluded(doc_filters, corpus):
+                continue
+            doc_filter = (doc_filters or {}).get(corpus)
+            results = timed_search(engine, user_question, top_k=top_k, corpus=corpus, doc_filter=doc_filter)
+            if fallback is not None and fallback is not engine and not is_unbuilt(fallback):
+                semantic = timed_search(fallback, user_question, top_k=top_k, corpus=corpus, doc_filter=doc_filter)
+                results = collapse_duplicates(FUSION_METHODS['rrf']([results, semantic]), result_cluster, top_k)
+            raw_results.extend(results)
+
+    with stage("build_response"):
+        final_results = [
+            build_result_item(res, is_relevant=None, observation=observation, full_text=full_text)
+            for res in raw_results
+        ]
+        return AppSearchResponse(
+            user_question=user_question,
+            generated_queries=[],
+            results=final_results,
+            degraded=degraded
+        )
+
+
+def fuse_query_results(query_results_map: List[dict], method: str = "rrf",
+                       budget: Dict[str, int] = CANDIDATE_BUDGET) -> List[dict]:
+    """
+    Fuse the per-query result lists of each source by doc_id, collapse
+    near-duplicate clusters that different queries surfaced, and keep only the
+    top `budget[source]` unique candidates. Returns one entry per source in
+    the same shape as `query_results_map`.
+    """
+    fuse = FUSION_METHODS[method]
+    fused_map = []
+    for source in ("quran", "hadith"):
+        items = [item for item in query_results_map if item['type'] == source]
+        if not items:
+            continue
+        fused = collapse_duplicates(fuse([item['results'] for item in items]), result_cluster,
+                                    budget.get(source, 5))
+        fused_map.append({
+            'query': ' | '.join(item['query'] for item in items),
+            'type': source,
+            'results': fused
         })
+    return fused_map
+
+
+def run_query(user_question: str, engine_quran, engine_hadith, model: SearchModelOne,
+              fallback_quran=None, fallback_hadith=None,
+              doc_filters: Optional[Dict[str, DocFilter]] = None, full_text: bool = False) -> AppSearchResponse:
+    """
+    doc_filters maps 'quran' / 'hadith' to a resolved DocFilter applied inside
+    scoring; an empty filter excludes that corpus. Results carry a snippet with
+    highlights; the full text is included only when full_text is set.
+    """
+    doc_filters = doc_filters or {}
+    if is_boolean_query(user_question):
+        # Explicit AND/OR/NOT syntax is run as written instead of being rephrased by the LLM
+        return run_direct_query(user_question, engine_quran, engine_hadith,
+                                doc_filters=doc_filters, full_text=full_text)
+    if model.backend is not None and not model.available():
+        # LLM circuit breaker is open: answer lexically instead of waiting on it
+        return run_direct_query(user_question, engine_quran, engine_hadith,
+                                doc_filters=doc_filters, full_text=full_text, degraded=True)
+
+    with stage("generate_queries"):
+        queries = model.generate_queries(user_question)
+    if not queries:
+        return run_direct_query(user_question, engine_quran, engine_hadith, doc_filters=doc_filters,
+                                full_text=full_text, degraded=True,
+                                fallback_quran=fallback_quran, fallback_hadith=fallback_hadith)
     
+
+    query_results_map = []
+    with stage("search"):
+        for q in queries:
+            if _is_excluded(doc_filters, q['type']):
+                continue
+            if q['type'] == "quran":
+                engine = engine_quran
+            else:
+                engine = engine_hadith
+
+            raw_results = timed_search(engine, q['query'], top_k=5, corpus=q['type'],
+                                       doc_filter=doc_filters.get(q['type']))
+            query_results_map.append({
+                'query': q['query'],
+                'type': q['type'],
+                'results': raw_results
+            })
     
-    validations_by_query = model.filter_results_batch(user_question, query_results_map)
+    with stage("fusion"):
+        query_results_map = fuse_query_results(query_results_map)
     
+    with stage("validation"):
+        validations_by_query = model.filter_results_batch(user_question, query_results_map)
+    # None: the validator failed (errors, open breaker); the candidates are still returned
+    validated = validations_by_query is not None
     
-    final_results = []
-    seen_texts = set()
     
-    for q_idx, item in enumerate(query_results_map):
-        raw_results = item['results']
-        validations = validations_by_query.get(q_idx, [])
+    with stage("build_response"):
+        final_results = []
+        seen = set()
         
-        for val in validations:
-            val_index = val['index']
-            if val_index < 0 or val_index >= len(raw_results):
+        for q_idx, item in enumerate(query_results_map):
+            raw_results = item['results']
+            if not validated:
+                # Validation failed or was skipped by its open breaker: return the fused candidates unvalidated
+                for res in raw_results:
+                    if _first_seen(res, seen):
+                        final_results.append(build_result_item(res, is_relevant=None, observation="Not validated (LLM unavailable)",
+                                                               full_text=full_text))
                 continue
-            if val['is_relevant']:
-                res = raw_results[val_index]
-                if res['text'] in seen_texts:
+            validations = validations_by_query.get(q_idx, [])
+            
+            for val in validations:
+                val_index = val['index']
+                if val_index < 0 or val_index >= len(raw_results):
                     continue
-                seen_texts.add(res['text'])
-                meta_raw = res['metadata']
-                if 'chapter' in meta_raw:
-                    meta = QuranMetadata(chapter=meta_raw['chapter'], verse=meta_raw['verse'])
-                else:
-                    meta = HadithMetadata(
-                        book=meta_raw.get('book', ''),
-                        hadith_number=meta_raw.get('hadith_number', 0),
-                        hadith_id=meta_raw.get('hadith_id')
-                    )
-                item = SearchResultItem(
-                    text=res['text'],
-                    metadata=meta,
-                    score=res.get('score'),
-                    is_relevant=True,
-                    observation=val['observation']
-                )
-                final_results.append(item)
-
-    return AppSearchResponse(
-        user_question=user_question,
-        generated_queries=queries,
-        results=final_results
-    )
+                if val['is_relevant']:
+                    res = raw_results[val_index]
+                    if not _first_seen(res, seen):
+                        continue
+                    final_results.append(build_result_item(res, is_relevant=True, observation=val['observation'],
+                                                           full_text=full_text))
 
+        return AppSearchResponse(
+            user_question=user_question,
+            generated_queries=queries,
+            results=final_results,
+            degraded=not validated
+        )
 
-def run_query_model_two(user_question: str, engine_quran, engine_hadith, model: SearchModelTwo) -> AppSearchResponse:
-    queries = model.generate_queries(user_question)
-    final_results = []
-    seen_texts = set()
 
-    for q in queries:
-        if q['type'] == "quran":
-            engine = engine_quran
-        else:
-            engine = engine_hadith
+def run_query_model_two(user_question: str, engine_quran, engine_hadith, model: SearchModelTwo,
+                        fallback_quran=None, fallback_hadith=None,
+                        doc_filters: Optional[Dict[str, DocFilter]] = None, full_text: bool = False) -> AppSearchResponse:
+    doc_filters = doc_filters or {}
+    if is_boolean_query(user_question):
+        return run_direct_query(user_question, engine_quran, engine_hadith,
+                                doc_filters=doc_filters, full_text=full_text)
+    if model.backend is not None and not model.available():
+        return run_direct_query(user_question, engine_quran, engine_hadith,
+                                doc_filters=doc_filters, full_text=full_text, degraded=True)
 
-        raw_results = engine.search(q['query'],top_k=2)
-        
-        for res in raw_results:
-            if res['text'] in seen_texts:
+    with stage("generate_queries"):
+        queries = model.generate_queries(user_question)
+    if not queries:
+        return run_direct_query(user_question, engine_quran, engine_hadith, doc_filters=doc_filters,
+                                full_text=full_text, degraded=True,
+                                fallback_quran=fallback_quran, fallback_hadith=fallback_hadith)
+
+    all_results = []
+    with stage("search"):
+        for q in queries:
+            if _is_excluded(doc_filters, q['type']):
                 continue
-            seen_texts.add(res['text'])
-            
-            meta_raw = res['metadata']
-            if 'chapter' in meta_raw:
-                meta = QuranMetadata(chapter=meta_raw['chapter'], verse=meta_raw['verse'])
+            if q['type'] == "quran":
+                engine = engine_quran
             else:
-                meta = HadithMetadata(
-                    book=meta_raw.get('book', ''),
-                    hadith_number=meta_raw.get('hadith_number', 0),
-                    hadith_id=meta_raw.get('hadith_id')
-                )
-            
-            item = SearchResultItem(
-                text=res['text'],
-                metadata=meta,
-                score=res.get('score'),
-                is_relevant=True,
-                observation="Generated by SearchModelTwo"
-            )
-            final_results.append(item)
-
-    return AppSearchResponse(
-        user_question=user_question,
-        generated_queries=queries,
-        results=final_results
-    )
\ No newline at end of file
+                engine = engine_hadith
+
+            all_results.extend(timed_search(engine, q['query'], top_k=2, corpus=q['type'],
+                                            doc_filter=doc_filters.get(q['type'])))
+
+    with stage("build_response"):
+        final_results = []
+        seen = set()
+        for res in all_results:
+            if not _first_seen(res, seen):
+                continue
+            final_results.append(build_result_item(res, is_relevant=True, observation="Generated by SearchModelTwo",
+                                                   full_text=full_text))
+
+        return AppSearchResponse(
+            user_question=user_question,
+            generated_queries=queries,
+            results=final_results
+        )
+
+
+def run_pipeline(engines: dict, user_question: str, engine: str, model: str, llm_models: dict,
+                 filters: Optional[dict] = None, full_text: bool = False) -> AppSearchResponse:
+    """
+    One /search request against a loaded engine set: pick the engines for
+    `engine` (bm25 if unknown), resolve filters and run model m1 or m2.
+    """
+    engine_quran = engines.get(f'{engine}_quran', engines.get('bm25_quran'))
+    engine_hadith = engines.get(f'{engine}_hadith', engines.get('bm25_hadith'))
+    if is_boolean_query(user_question) and not hasattr(type(engine_quran), 'search_boolean'):
+        # Only the BM25 engines understand AND/OR/NOT; checked on the class so a deferred engine is not built
+        engine_quran, engine_hadith = engines['bm25_quran'], engines['bm25_hadith']
+    
+    selected_model = llm_models.get(model, llm_models["m1"])
+    
+    fallback_quran = engines.get('lsa_quran')
+    fallback_hadith = engines.get('lsa_hadith')
+    
+    doc_filters = resolve_doc_filters(engines, filters)
+    
+    if (not is_boolean_query(user_question) and detect_language(user_question) == 'en'
+            and f'{ENGLISH_ENGINE}_hadith' in engines):
+        # Only the hadith corpus has English text; searching it directly saves the query-generation round-trip
+        return run_direct_query(user_question, engines[f'{ENGLISH_ENGINE}_quran'], engines[f'{ENGLISH_ENGINE}_hadith'],
+                                doc_filters=doc_filters, full_text=full_text,
+                                observation="Direct search (English question)")
+    
+    if model == "m2":
+        return run_query_model_two(user_question, engine_quran, engine_hadith, selected_model,
+                                   fallback_quran, fallback_hadith, doc_filters, full_text)
+    else:
+        return run_query(user_question, engine_quran, engine_hadith, selected_model,
+                         fallback_quran, fallback_hadith, doc_filters, full_text)
@@ -13,7 +13,10 @@ class HadithMetadata(BaseModel):
     model_config = {"extra": "allow"}
 
 class SearchResultItem(BaseModel):
-    text: str
+    doc_id: Optional[str] = None  # "chapter_verse" for the Quran, hadith_id for hadith
+    text: Optional[str] = None  # full text, only when requested with full_text=true
+    snippet: Optional[str] = None
+    highlights: Optional[List[List[int]]] = None  # [start, end) offsets into snippet
     metadata: Union[QuranMetadata, HadithMetadata]
     score: Optional[float]
     is_relevant: Optional[bool]
@@ -23,3 +26,5 @@ class AppSearchResponse(BaseModel):
     user_question: str 
     generated_queries: Optional[List[dict]]
     results: List[SearchResultItem]
+    exact: bool = True  # False when a search hit the request deadline and returned its best-so-far top-k
+    degraded: bool = False  # True when the LLM was unavailable: direct-search or unvalidated results
@@ -0,0 +1,41 @@
+"""
+JSON encoding of /search responses.
+
+Endpoints return the encoded bytes directly, so FastAPI neither re-validates
+the response model nor runs it through jsonable_encoder. The encoding is
+done by pydantic-core's serializer, with an optional field projection
+(?fields=doc_id,score,snippet) applied to each result.
+"""
+from typing import Optional, Set
+from fastapi.responses import Response
+from schemas import AppSearchResponse, SearchResultItem
+
+RESULT_FIELDS = tuple(SearchResultItem.model_fields)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """The projected result fields of a comma-separated list; None keeps every field."""
+    if not fields:
+        return None
+    selected = {name.strip() for name in fields.split(',') if name.strip()}
+    unknown = selected - set(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown result fields: {', '.join(sorted(unknown))} (available: {', '.join(RESULT_FIELDS)})")
+    return selected
+
+
+def encode_response(response: AppSearchResponse, fields: Optional[Set[str]] = None) -> bytes:
+    include = None
+    if fields is not None:
+        include = {
+            'user_question': True,
+            'generated_queries': True,
+            'results': {'__all__': fields},
+            'exact': True,
+            'degraded': True,
+        }
+    return response.model_dump_json(include=include).encode('utf-8')
+
+
+def json_response(response: AppSearchResponse, fields: Optional[Set[str]] = None) -> Response:
+    return Response(content=encode_response(response, fields), media_type="application/json")
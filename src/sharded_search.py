@@ -0,0 +1,151 @@
+"""
+Scatter-gather BM25 over index shards served by local worker processes.
+
+The corpus is partitioned by book or by doc-id range. Every shard keeps the
+full vocabulary with corpus-global df, and its engine uses the global N and
+avg_dl, so a document gets exactly the score it would get from the unsharded
+BM25SearchEngine. The coordinator merges the per-shard top-k.
+
+Enable with MUSTADIL_HADITH_SHARDS / MUSTADIL_QURAN_SHARDS set to "book" or a
+shard count; the engine is served as "bm25_sharded".
+"""
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+import numpy as np
+from filters import DocFilter
+from near_duplicates import collapse_duplicates, result_cluster
+
+# Set inside each worker process by _init_shard
+_shard_engine = None
+_shard_ordinals: Dict[str, int] = {}
+
+
+def partition_doc_ids(doc_metadata: Dict[str, dict], spec: str) -> List[List[str]]:
+    """Doc ids per shard: spec "book" groups by the record's book, a number splits into that many ranges."""
+    doc_ids = list(doc_metadata)
+    if spec == "book":
+        groups = {}
+        for doc_id in doc_ids:
+            groups.setdefault(doc_metadata[doc_id].get('book', ''), []).append(doc_id)
+        return list(groups.values())
+    n_shards = max(1, min(int(spec), len(doc_ids)))
+    size = -(-len(doc_ids) // n_shards)
+    return [doc_ids[i:i + size] for i in range(0, len(doc_ids), size)]
+
+
+def split_postings(index: Dict[str, dict], shard_of: Dict[str, int], n_shards: int) -> List[Dict[str, dict]]:
+    """
+    Split an inverted (or stem) index into per-shard indices in one pass.
+    Every term stays in every shard, with its global df, so term lookups and
+    idf are the same on each shard.
+    """
+    shards = [{} for _ in range(n_shards)]
+    for term, entry in index.items():
+        parts = [{} for _ in range(n_shards)]
+        for doc_id, value in entry['postings'].items():
+            parts[shard_of[doc_id]][doc_id] = value
+        for shard, postings in zip(shards, parts):
+            shard[term] = {'df': entry['df'], 'postings': postings}
+    return shards
+
+
+def _init_shard(name: str, inverted_index: dict, doc_metadata: dict, total_docs: int, avg_dl: float,
+                terms: Optional[tuple], stem_index: Optional[dict], duplicate_clusters: Optional[dict]):
+    global _shard_engine, _shard_ordinals
+    from preprocessing import SafeIslamicArabicProcessor
+    from bm25_search import BM25SearchEngine
+    from term_dictionary import TermDictionary
+    from stemming import LightStemmer
+
+    processor = SafeIslamicArabicProcessor()
+    engine = BM25SearchEngine(
+        name=name,
+        inverted_index=inverted_index,
+        doc_metadata=doc_metadata,
+        processor=processor,
+        term_dictionary=TermDictionary(*terms) if terms else None,
+        stem_index=stem_index,
+        stemmer=LightStemmer(processor) if stem_index is not None else None,
+        duplicate_clusters=duplicate_clusters,
+    )
+    # Corpus-global statistics keep scores comparable across shards
+    engine.N = total_docs
+    engine.avg_dl = avg_dl
+    _shard_engine = engine
+    _shard_ordinals = {doc_id: i for i, doc_id in enumerate(doc_metadata)}
+
+
+def _search_shard(query: str, top_k: int, doc_ids: Optional[frozenset]) -> List[Dict[str, Any]]:
+    doc_filter = None
+    if doc_ids is not None:
+        local = [doc_id for doc_id in doc_ids if doc_id in _shard_ordinals]
+        if not local:
+            return []
+        rows = np.array(sorted(_shard_ordinals[doc_id] for doc_id in local), dtype=np.int64)
+        doc_filter = DocFilter(rows, frozenset(local))
+    results = _shard_engine.search(query, top_k=top_k, doc_filter=doc_filter)
+    # The coordinator re-attaches text and metadata; only ids, scores and positions cross the pipe
+    for res in results:
+        del res['text'], res['metadata']
+    return results
+
+
+class ShardedSearchEngine:
+    """Coordinator: scatters each search to the shard processes and merges their top-k."""
+
+    def __init__(self, name: str, inverted_index: Dict[str, Any], doc_metadata: Dict[str, Any], spec: str,
+                 term_dictionary=None, stem_index: Dict[str, Any] = None, replicas: int = 1,
+                 duplicate_clusters: Dict[str, str] = None):
+        self.name = name
+        self.doc_metadata = doc_metadata
+        self.collapse = duplicate_clusters is not None
+        shard_doc_ids = partition_doc_ids(doc_metadata, spec)
+        shard_of = {doc_id: i for i, ids in enumerate(shard_doc_ids) for doc_id in ids}
+        n_shards = len(shard_doc_ids)
+
+        total_docs = len(doc_metadata)
+        avg_dl = sum(len(d.get('tokens', [])) for d in doc_metadata.values()) / total_docs
+        shard_indices = split_postings(inverted_index, shard_of, n_shards)
+        shard_stems = split_postings(stem_index, shard_of, n_shards) if stem_index is not None else [None] * n_shards
+        terms = (term_dictionary.terms, term_dictionary.dfs) if term_dictionary is not None else None
+
+        # spawn: workers must not inherit the server's threads and locks
+        context = multiprocessing.get_context("spawn")
+        self.shards = []
+        for ids, shard_index, shard_stem in zip(shard_doc_ids, shard_indices, shard_stems):
+            shard_clusters = {d: duplicate_clusters[d] for d in ids if d in duplicate_clusters} \
+                if duplicate_clusters is not None else None
+            self.shards.append(ProcessPoolExecutor(
+                max_workers=replicas,
+                mp_context=context,
+                initializer=_init_shard,
+                initargs=(name, shard_index, {d: doc_metadata[d] for d in ids}, total_docs, avg_dl,
+                          terms, shard_stem, shard_clusters),
+            ))
+
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
+        doc_ids = doc_filter.doc_ids if doc_filter is not None else None
+        futures = [shard.submit(_search_shard, query, top_k, doc_ids) for shard in self.shards]
+        results = [res for future in futures for res in future.result()]
+        # Same ordering as BM25SearchEngine: matched query tokens first, then score
+        rank_key = lambda r: (len(r.get('matched_tokens', [])), r['score'])
+        if self.collapse:
+            # A cluster can span shards, so each shard's best hit is collapsed again here
+            top = collapse_duplicates(sorted(results, key=rank_key, reverse=True), result_cluster, top_k)
+        else:
+            top = heapq.nlargest(top_k, results, key=rank_key)
+        for res in top:
+            doc_info = self.doc_metadata[res['doc_id']]
+            res['text'] = doc_info.get('arabic_original', '')
+            res['metadata'] = doc_info
+        return top
+
+    def search_boolean(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
+        # Each shard's BM25SearchEngine recognises the boolean syntax itself
+        return self.search(query, top_k=top_k, doc_filter=doc_filter)
+
+    def close(self):
+        for shard in self.shards:
+            shard.shutdown(wait=False, cancel_futures=True)
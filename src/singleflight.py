@@ -0,0 +1,55 @@
+import threading
+from typing import Any, Callable, Hashable, Tuple
+from metrics import CACHE_HITS, REGISTRY, stage
+
+INFLIGHT_CALLS = REGISTRY.gauge(
+    'mustadil_singleflight_inflight', 'Distinct pipeline computations currently in flight.')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, later callers block until it finishes and share its result
+    (or its exception). Nothing is cached once the call completes.
+    """
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns (result, shared) where shared is True if another caller computed it."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            with stage("coalesced_wait"):
+                call.done.wait()
+            CACHE_HITS.inc(cache=self.name)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        INFLIGHT_CALLS.inc()
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            INFLIGHT_CALLS.dec()
+        return call.result, False
@@ -0,0 +1,135 @@
+"""
+Snippets with highlights for the returned top-k results.
+
+Token positions (as stored in the positional postings) are mapped back to
+character spans of the original diacritized text by replaying the
+preprocessing pipeline character by character, so highlight offsets point
+into the text the user actually sees.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from preprocessing import SafeIslamicArabicProcessor
+
+SNIPPET_TOKENS = 24
+# Tokens of context kept before the first match of the chosen cluster
+SNIPPET_LEAD = 4
+ELLIPSIS = '…'
+
+# Same character classes as SafeIslamicArabicProcessor.remove_diacritics / tokenize
+_DIACRITIC_RE = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]')
+_WORD_CHAR_RE = re.compile(r'[\u0621-\u064A]')
+
+_processor = SafeIslamicArabicProcessor()
+
+
+@lru_cache(maxsize=None)
+def _fold(ch: str) -> Tuple[bool, Tuple[Tuple[str, bool], ...]]:
+    """
+    What one original character becomes after preprocessing: whether it
+    leaves nothing at all (diacritics), and its normalized characters, each
+    flagged as a word character or not. Texts use a small alphabet, so this
+    is computed once per distinct character.
+    """
+    kept = [] if _DIACRITIC_RE.match(ch) else [
+        c for c in unicodedata.normalize('NFKD', ch) if not unicodedata.combining(c)]
+    parts = []
+    for c in kept:
+        c = _processor.normalize(c)
+        if c:
+            parts.append((c, bool(_WORD_CHAR_RE.match(c))))
+    return not kept, tuple(parts)
+
+
+def word_spans(original: str) -> List[Tuple[str, int, int]]:
+    """(normalized word, start, end) for each word of original, with offsets into original."""
+    words = []
+    current = []
+    start = end = 0
+    for i, ch in enumerate(original):
+        dropped, parts = _fold(ch)
+        for c, is_word in parts:
+            if is_word:
+                if not current:
+                    start = i
+                current.append(c)
+                end = i + 1
+            elif current:
+                words.append((''.join(current), start, end))
+                current = []
+        if current and dropped:
+            # Diacritics and tatweel stay inside the highlighted word
+            end = i + 1
+    if current:
+        words.append((''.join(current), start, end))
+    return words
+
+
+def token_spans(original: str, tokens: List[str]) -> Optional[List[Tuple[int, int]]]:
+    """
+    Character span in original of every token (protected phrases span several
+    words). None if the words cannot be aligned with the stored tokens.
+    """
+    words = word_spans(original)
+    spans = []
+    w = 0
+    for token in tokens:
+        parts = token.split(' ')
+        chunk = words[w:w + len(parts)]
+        if [word for word, _, _ in chunk] != parts:
+            return None
+        spans.append((chunk[0][1], chunk[-1][2]))
+        w += len(parts)
+    return spans
+
+
+def best_window(positions: List[int], tokens: List[str], size: int = SNIPPET_TOKENS) -> Tuple[int, int]:
+    """[start, end) token window covering the most distinct matched terms, then the most matches."""
+    n = len(tokens)
+    if n <= size or not positions:
+        return 0, min(n, size)
+    best_key, best_first = None, positions[0]
+    hi = 0
+    for lo, first in enumerate(positions):
+        while hi < len(positions) and positions[hi] < first + size - SNIPPET_LEAD:
+            hi += 1
+        window = positions[lo:hi]
+        key = (len({tokens[p] for p in window}), len(window))
+        if best_key is None or key > best_key:
+            best_key, best_first = key, first
+    start = max(0, min(best_first - SNIPPET_LEAD, n - size))
+    return start, start + size
+
+
+def make_snippet(original: str, tokens: List[str], positions: List[int],
+                 size: int = SNIPPET_TOKENS) -> Dict[str, object]:
+    """
+    {'snippet': str, 'highlights': [[start, end], ...]} with offsets into the snippet.
+    Falls back to the leading words without highlights if alignment fails.
+    """
+    spans = token_spans(original, tokens)
+    if spans is None or not spans:
+        words = original.split()
+        snippet = ' '.join(words[:size]) + (f' {ELLIPSIS}' if len(words) > size else '')
+        return {'snippet': snippet, 'highlights': []}
+
+    positions = sorted(p for p in set(positions) if 0 <= p < len(spans))
+    start, end = best_window(positions, tokens, size)
+    char_start, char_end = spans[start][0], spans[end - 1][1]
+    prefix = f'{ELLIPSIS} ' if start > 0 else ''
+    suffix = f' {ELLIPSIS}' if end < len(spans) else ''
+    if not prefix:
+        char_start = 0
+    if not suffix:
+        char_end = len(original)
+
+    shift = len(prefix) - char_start
+    highlights = [[spans[p][0] + shift, spans[p][1] + shift] for p in positions if start <= p < end]
+    return {'snippet': prefix + original[char_start:char_end] + suffix, 'highlights': highlights}
+
+
+def match_positions(doc_tokens: List[str], terms) -> List[int]:
+    """Positions of terms in a document, for engines whose results carry no positions."""
+    terms = set(terms)
+    return [i for i, token in enumerate(doc_tokens) if token in terms]
@@ -0,0 +1,194 @@
+"""
+Cold-start support: per-phase startup timings, engines built on first use,
+and a budget check for the whole cold start.
+
+Usage:
+    python startup.py                 # import times per module, index load and engine build times
+                                      # exit non-zero if import + load + warm-up exceeds the budget
+    python startup.py --budget 4      # with another budget than MUSTADIL_STARTUP_BUDGET / 6s
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds allowed for import + index load + warm-up; tests/test_startup.py enforces it
+DEFAULT_STARTUP_BUDGET = 6.0
+# Modules the default engines must not import at startup (only deferred engines use them)
+HEAVY_MODULES = ('sklearn', 'scipy', 'pandas', 'rank_bm25', 'google.genai')
+
+
+def startup_budget() -> float:
+    return float(os.getenv("MUSTADIL_STARTUP_BUDGET", "0")) or DEFAULT_STARTUP_BUDGET
+
+
+class StartupReport:
+    """Seconds spent per (phase, name), e.g. ('index_load', 'quran_index.json')."""
+
+    def __init__(self):
+        self.entries: List[Tuple[str, str, float]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, phase: str, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.entries.append((phase, name, time.perf_counter() - start))
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        phases = {}
+        with self._lock:
+            for phase, name, seconds in self.entries:
+                timings = phases.setdefault(phase, {})
+                timings[name] = timings.get(name, 0.0) + seconds
+        return {phase: {name: round(s, 4) for name, s in timings.items()} for phase, timings in phases.items()}
+
+
+class LazyEngine:
+    """
+    Stands in for an engine whose module pulls in heavy libraries (scikit-learn,
+    rank_bm25). The module is imported and the engine built on first attribute
+    access; until then the process does not pay for either.
+    """
+
+    def __init__(self, key: str, module: str, class_name: str, kwargs: dict,
+                 report: Optional[StartupReport] = None):
+        self.key = key
+        self.module = module
+        self.engine_label = class_name
+        self._kwargs = kwargs
+        self._report = report or StartupReport()
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._engine is not None
+
+    def get(self):
+        engine = self._engine
+        if engine is None:
+            with self._lock:
+                if self._engine is None:
+                    with self._report.timed('import', self.module):
+                        cls = getattr(importlib.import_module(self.module), self.engine_label)
+                    with self._report.timed('engine_build', self.key):
+                        self._engine = cls(**self._kwargs)
+                    logger.info("Built deferred engine %s", self.key)
+                engine = self._engine
+        return engine
+
+    def __getattr__(self, name):
+        # Only reached for attributes LazyEngine itself does not define
+        return getattr(self.get(), name)
+
+
+def is_unbuilt(engine) -> bool:
+    """True for a deferred engine nobody has used yet (warm-up and shutdown skip it)."""
+    return isinstance(engine, LazyEngine) and not engine.loaded
+
+
+def parse_importtime(stderr: str, root: str = 'main') -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Total seconds to import root and the cumulative import time of each module
+    it imports directly, from `python -X importtime` output.
+    """
+    direct = []
+    total = 0.0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        seconds = int(cumulative) / 1e6
+        if depth == 1:
+            direct.append((name.strip(), seconds))
+        elif depth == 0 and name.strip() == root:
+            total = seconds
+            break
+        elif depth == 0:
+            direct = []
+    return total, sorted(direct, key=lambda x: x[1], reverse=True)
+
+
+def _cold_start_child():
+    """Runs in a fresh interpreter: import the app and load the engines as the startup event does."""
+    start = time.perf_counter()
+    import main
+    import_s = time.perf_counter() - start
+    main.registry.load()
+    load_s = time.perf_counter() - start - import_s
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(json.dumps({
+        'import_s': import_s,
+        'load_s': load_s,
+        'report': main.registry.current()['load_report'].as_dict(),
+        'heavy_modules_loaded': heavy,
+    }))
+
+
+def measure_cold_start(env: Optional[Dict[str, str]] = None) -> dict:
+    """
+    Import the app and load the engines in a fresh interpreter. Returns the
+    child's timings plus 'cold_start_s' and 'imports' (slowest direct imports of main).
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Cold start failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['cold_start_s'] = result['import_s'] + result['load_s']
+    result['imports'] = parse_importtime(proc.stderr)[1]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the service's cold start")
+    parser.add_argument("--budget", type=float, default=startup_budget(),
+                        help="Fail if import + index load + warm-up takes longer (seconds)")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _cold_start_child()
+        return
+
+    try:
+        result = measure_cold_start()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    imports = result['imports']
+
+    print(f"import main: {result['import_s']:.2f}s")
+    for name, seconds in imports[:args.top]:
+        print(f"  {name:<28} {seconds * 1000:8.1f} ms")
+    for phase, timings in result['report'].items():
+        print(f"{phase}: {sum(timings.values()):.2f}s")
+        for name, seconds in sorted(timings.items(), key=lambda x: x[1], reverse=True):
+            print(f"  {name:<28} {seconds * 1000:8.1f} ms")
+    cold_start = result['cold_start_s']
+    print(f"cold start: {cold_start:.2f}s (import {result['import_s']:.2f}s + load and warm-up {result['load_s']:.2f}s)")
+    if result['heavy_modules_loaded']:
+        print(f"heavy modules imported at startup: {', '.join(result['heavy_modules_loaded'])}")
+
+    if cold_start > args.budget:
+        print(f"\nCold start {cold_start:.2f}s exceeds the {args.budget:.2f}s budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
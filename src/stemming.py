@@ -0,0 +1,84 @@
+"""
+Light Arabic stemmer (Light10-style affix stripping plus weak-letter and
+verb/participle prefix removal) and the stem postings built from it at
+index time, so that e.g. صلاة / يصلون / المصلين share the stem صل.
+
+Protected terms and phrases of SafeIslamicArabicProcessor are never stemmed.
+"""
+import json
+import os
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict
+from preprocessing import SafeIslamicArabicProcessor
+
+ARTICLES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'وا', 'ين', 'يه', 'ية', 'ه', 'ة', 'ي')
+WEAK_LETTERS = 'اوي'
+# Imperfect-verb / participle prefixes, only stripped from affixed words
+DERIVATION_PREFIXES = 'يتم'
+
+
+class LightStemmer:
+    def __init__(self, processor: SafeIslamicArabicProcessor):
+        # Protected terms in the same normalized form as the indexed tokens
+        self.protected = {
+            processor.normalize(processor.remove_diacritics(term))
+            for term in processor.protected_terms
+        }
+        self.stem = lru_cache(maxsize=100_000)(self._stem)
+
+    def _stem(self, token: str) -> str:
+        if ' ' in token or token in self.protected or len(token) <= 2:
+            return token
+        t = token
+        if t[0] == 'و' and len(t) >= 4:
+            t = t[1:]
+            if t in self.protected:
+                return t
+        affixed = False
+        for prefix in ARTICLES:
+            if t.startswith(prefix) and len(t) - len(prefix) >= 2:
+                t = t[len(prefix):]
+                affixed = True
+                break
+        for suffix in SUFFIXES:
+            if t.endswith(suffix) and len(t) - len(suffix) >= 2:
+                t = t[:-len(suffix)]
+                affixed = True
+        if len(t) >= 3 and t[-1] in WEAK_LETTERS:
+            t = t[:-1]
+        if affixed and len(t) >= 3 and t[0] in DERIVATION_PREFIXES:
+            t = t[1:]
+        return t
+
+
+def build_stem_index(inverted_index: Dict[str, dict], stemmer: LightStemmer) -> dict:
+    """
+    Stem postings derived from a surface inverted index:
+    {stem: {'df': n, 'postings': {doc_id: tf summed over the stem's surface terms}}}
+    """
+    postings = defaultdict(lambda: defaultdict(int))
+    for term, entry in inverted_index.items():
+        stem_postings = postings[stemmer.stem(term)]
+        for doc_id, positions in entry['postings'].items():
+            stem_postings[doc_id] += len(positions)
+    return {
+        stem: {'df': len(docs), 'postings': dict(docs)}
+        for stem, docs in postings.items()
+    }
+
+
+def save_stem_index(stem_index: dict, name: str, output_dir: str = 'indices'):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(f'{output_dir}/{name}_stem_index.json', 'w', encoding='utf-8') as f:
+        json.dump(stem_index, f, ensure_ascii=False)
+
+
+def load_stem_index(inverted_index: Dict[str, dict], stemmer: LightStemmer, name: str,
+                    input_dir: str = 'indices') -> dict:
+    path = f'{input_dir}/{name}_stem_index.json'
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return build_stem_index(inverted_index, stemmer)
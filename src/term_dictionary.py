@@ -0,0 +1,185 @@
+"""
+Term dictionary over an inverted index's vocabulary: a sorted term array for
+prefix enumeration (autocomplete), a single-deletion index for one-edit typo
+lookup, and a character trie walked for two-edit lookups.
+
+Written by build_indices.py as indices/{name}_terms.json.
+"""
+import heapq
+import json
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+# Edit distance allowed for a token of a given length
+FUZZY_MIN_LENGTH = 3
+_END = '$'
+
+
+def max_edit_distance(token: str) -> int:
+    if len(token) < FUZZY_MIN_LENGTH:
+        return 0
+    return 1 if len(token) <= 5 else 2
+
+
+def build_term_dictionary(inverted_index: Dict[str, dict]) -> dict:
+    terms = sorted(inverted_index)
+    return {'terms': terms, 'df': [inverted_index[t]['df'] for t in terms]}
+
+
+def save_term_dictionary(data: dict, name: str, output_dir: str = 'indices'):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(f'{output_dir}/{name}_terms.json', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def load_term_dictionary(inverted_index: Dict[str, dict], name: str, input_dir: str = 'indices') -> 'TermDictionary':
+    path = f'{input_dir}/{name}_terms.json'
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    else:
+        data = build_term_dictionary(inverted_index)
+    return TermDictionary(data['terms'], data['df'])
+
+
+def _bounded_distance(a: str, b: str, bound: int) -> int:
+    """Levenshtein distance of a and b, or bound + 1 once it is known to exceed bound."""
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i]
+        for j, cb in enumerate(b, 1):
+            row.append(min(row[j - 1] + 1, prev[j] + 1, prev[j - 1] + (ca != cb)))
+        if min(row) > bound:
+            return bound + 1
+        prev = row
+    return min(prev[-1], bound + 1)
+
+
+class TermDictionary:
+    def __init__(self, terms: List[str], dfs: List[int]):
+        self.terms = terms
+        self.dfs = dfs
+        self._trie = None
+        self._deletes = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __contains__(self, term: str) -> bool:
+        i = bisect_left(self.terms, term)
+        return i < len(self.terms) and self.terms[i] == term
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """[lo, hi) positions of the terms starting with prefix."""
+        lo = bisect_left(self.terms, prefix)
+        hi = bisect_left(self.terms, prefix + '\U0010ffff', lo)
+        return lo, hi
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Most frequent (by df) terms starting with prefix."""
+        if not prefix:
+            return []
+        lo, hi = self.prefix_range(prefix)
+        best = heapq.nlargest(limit, range(lo, hi), key=self.dfs.__getitem__)
+        return [(self.terms[i], self.dfs[i]) for i in best]
+
+    def _get_trie(self) -> dict:
+        # Built on first fuzzy lookup; autocomplete only needs the sorted array
+        if self._trie is None:
+            with self._lock:
+                if self._trie is None:
+                    root = {}
+                    for i, term in enumerate(self.terms):
+                        node = root
+                        for ch in term:
+                            node = node.setdefault(ch, {})
+                        node[_END] = i
+                    self._trie = root
+        return self._trie
+
+    def _get_deletes(self) -> Dict[str, List[int]]:
+        # Every term under itself and each single-character deletion of it
+        if self._deletes is None:
+            with self._lock:
+                if self._deletes is None:
+                    deletes = {}
+                    for i, term in enumerate(self.terms):
+                        for key in {term} | {term[:j] + term[j + 1:] for j in range(len(term))}:
+                            deletes.setdefault(key, []).append(i)
+                    self._deletes = deletes
+        return self._deletes
+
+    def _within_one_edit(self, token: str) -> List[Tuple[str, int, int]]:
+        deletes = self._get_deletes()
+        candidates = set()
+        for key in {token} | {token[:j] + token[j + 1:] for j in range(len(token))}:
+            candidates.update(deletes.get(key, ()))
+        matches = []
+        for idx in candidates:
+            distance = _bounded_distance(token, self.terms[idx], 1)
+            if distance <= 1:
+                matches.append((self.terms[idx], distance, self.dfs[idx]))
+        return matches
+
+    def fuzzy(self, token: str, max_distance: Optional[int] = None, limit: int = 3,
+              prefix_length: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """
+        (term, distance, df) within max_distance edits of token, closest and
+        most frequent first. The first prefix_length characters must match
+        One-edit matches come from the deletion index. Two-edit lookups, needed
+        only while fewer than `limit` closer matches exist, walk the trie below
+        an exact prefix of prefix_length characters (default: max_distance)
+        with one banded Levenshtein row per node, pruning branches whose row
+        minimum already exceeds the bound.
+        """
+        if max_distance is None:
+            max_distance = max_edit_distance(token)
+        if max_distance <= 0:
+            return []
+        # One edit: a handful of dictionary probes
+        matches = self._within_one_edit(token)
+        if max_distance == 1 or len(matches) >= limit:
+            matches.sort(key=lambda m: (m[1], -m[2]))
+            return matches[:limit]
+        if prefix_length is None:
+            prefix_length = max_distance
+
+        node = self._get_trie()
+        for ch in token[:prefix_length]:
+            node = node.get(ch)
+            if node is None:
+                return []
+
+        n = len(token)
+        too_far = max_distance + 1
+        # Row of the DP matrix after consuming the exact prefix
+        first_row = [abs(prefix_length - col) if abs(prefix_length - col) <= max_distance else too_far
+                     for col in range(n + 1)]
+        seen = {m[0] for m in matches}
+        stack = [(child, ch, first_row, prefix_length + 1) for ch, child in node.items() if ch != _END]
+        if _END in node and first_row[-1] <= max_distance and self.terms[node[_END]] not in seen:
+            matches.append((self.terms[node[_END]], first_row[-1], self.dfs[node[_END]]))
+        while stack:
+            node, ch, prev_row, depth = stack.pop()
+            row = [depth if depth <= max_distance else too_far] + [too_far] * n
+            # Cells further than max_distance from the diagonal can never be within the bound
+            for col in range(max(1, depth - max_distance), min(n, depth + max_distance) + 1):
+                cost = min(
+                    row[col - 1] + 1,
+                    prev_row[col] + 1,
+                    prev_row[col - 1] + (token[col - 1] != ch),
+                )
+                row[col] = cost if cost <= max_distance else too_far
+            if _END in node and row[-1] <= max_distance and self.terms[node[_END]] not in seen:
+                idx = node[_END]
+                matches.append((self.terms[idx], row[-1], self.dfs[idx]))
+            if min(row) <= max_distance:
+                stack.extend((child, next_ch, row, depth + 1) for next_ch, child in node.items() if next_ch != _END)
+
+        matches.sort(key=lambda m: (m[1], -m[2]))
+        return matches[:limit]
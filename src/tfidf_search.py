@@ -1,14 +1,29 @@
 import math
 from typing import List, Tuple, Dict, Any
+import numpy as np
 from preprocessing import SafeIslamicArabicProcessor
+from metrics import POSTINGS_TRAVERSED
+from filters import DocFilter, doc_id_of
+from frozen_index import FrozenPostings, accumulate, doc_filter_mask, readonly, shared_postings, top_k_rows
+from near_duplicates import cluster_array
 
 
 class TFIDFSearchEngine:
-    def __init__(self, inverted_index: dict, documents: list, total_docs: int, processor: SafeIslamicArabicProcessor):
+    def __init__(self, inverted_index: dict, documents: list, total_docs: int, processor: SafeIslamicArabicProcessor,
+                 name: str = "", duplicate_clusters: Dict[str, str] = None, postings: FrozenPostings = None):
+        self.name = name
         self.inverted_index = inverted_index
         self.documents = documents
         self.total_docs = total_docs
         self.processor = processor
+
+        # Read-only postings arrays over the documents list, replacing a scan of
+        # the whole list for every posting
+        self.doc_ids = tuple(doc_id_of(doc, idx) for idx, doc in enumerate(documents))
+        self.doc_lens = readonly(np.array([len(doc['tokens']) for doc in documents], dtype=np.float64))
+        self.postings = shared_postings(inverted_index, self.doc_ids, postings)
+        self.duplicate_clusters = duplicate_clusters
+        self.cluster_of = cluster_array(duplicate_clusters, self.doc_ids)
     
     def calculate_tf(self, term_freq: int, doc_length: int) -> float:
         if doc_length == 0:
@@ -23,58 +38,40 @@ class TFIDFSearchEngine:
     def calculate_tfidf(self, tf: float, idf: float) -> float:
         return tf * idf
     
-    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
         query_result = self.processor.preprocess(query)
         query_terms = query_result['tokens']
         
         if not query_terms:
             return []
         
-        doc_scores = {}
-        
+        # Repeated query terms add their idf again, as they add their score
+        idfs = {}
         for term in query_terms:
-            if term not in self.inverted_index:
-                continue
-            
-            term_data = self.inverted_index[term]
-            df = term_data['df']
-            idf = self.calculate_idf(df)
-            
-            for doc_id, positions in term_data['postings'].items():
-                doc = None
-                for d in self.documents:
-                    if hasattr(d, 'get'):
-                        if 'chapter' in d and 'verse' in d:
-                            if doc_id == f"{d['chapter']}_{d['verse']}":
-                                doc = d
-                                break
-                        elif 'hadith_id' in d:
-                            if doc_id == str(d['hadith_id']):
-                                doc = d
-                                break
-                
-                if doc is None:
-                    continue
-                
-                term_freq = len(positions)
-                doc_length = len(doc['tokens'])
-                tf = self.calculate_tf(term_freq, doc_length)
-                
-                tfidf = self.calculate_tfidf(tf, idf)
-                
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'score': 0.0, 'doc': doc}
-                doc_scores[doc_id]['score'] += tfidf
-        
-        ranked_docs = sorted(doc_scores.items(), key=lambda x: x[1]['score'], reverse=True)[:top_k]
-        
+            if term in self.postings:
+                idfs[term] = idfs.get(term, 0.0) + self.calculate_idf(self.postings.df_of(term))
+        terms = [(*self.postings.get(term), idf) for term, idf in idfs.items()]
+
+        POSTINGS_TRAVERSED.inc(sum(len(rows) for rows, _, _ in terms), engine=type(self).__name__,
+                               corpus=self.name.lower())
+        scores, matched = accumulate(len(self.doc_ids), terms, self._tfidf_contribution,
+                                     doc_filter_mask(doc_filter, len(self.doc_ids)))
+        scores = scores[0]
+
         results = []
-        for doc_id, data in ranked_docs:
-            doc = data['doc']
+        for row in top_k_rows(scores, matched, top_k, cluster_of=self.cluster_of):
+            doc = self.documents[row]
             results.append({
-                'doc_id': doc_id,
-                'score': float(data['score']),
+                'doc_id': self.doc_ids[row],
+                'score': float(scores[row]),
                 'text': doc.get('arabic_original', ''),
-                'metadata': doc
+                'metadata': doc,
+                'cluster_id': (self.duplicate_clusters or {}).get(self.doc_ids[row])
             })
         return results
+
+    def _tfidf_contribution(self, rows: np.ndarray, term_freqs: np.ndarray, idf: float) -> np.ndarray:
+        doc_lengths = self.doc_lens[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tf = np.where(doc_lengths > 0, term_freqs / doc_lengths, 0.0)
+        return self.calculate_tfidf(tf, idf)
@@ -3,6 +3,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from typing import List, Tuple, Dict, Any
 from preprocessing import SafeIslamicArabicProcessor
+from filters import DocFilter
 
 
 class TFIDFSearchEngineLib:
@@ -21,7 +22,7 @@ class TFIDFSearchEngineLib:
         
         self.doc_vectors = self.vectorizer.fit_transform(self.doc_texts)
     
-    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict[str, Any]]:
         query_result = self.processor.preprocess(query)
         query_text = ' '.join(query_result['tokens'])
         
@@ -30,9 +31,16 @@ class TFIDFSearchEngineLib:
         
         query_vector = self.vectorizer.transform([query_text])
         
-        scores = (self.doc_vectors * query_vector.T).toarray().flatten()
+        if doc_filter is None:
+            rows = np.arange(self.total_docs)
+            scores = (self.doc_vectors * query_vector.T).toarray().flatten()
+        else:
+            # Score only the filtered rows, indexed back to row ids below
+            rows = doc_filter.rows
+            scores = np.zeros(self.total_docs)
+            scores[rows] = (self.doc_vectors[rows] * query_vector.T).toarray().flatten()
         
-        top_indices = np.argsort(scores)[::-1][:top_k]
+        top_indices = rows[np.argsort(scores[rows])[::-1][:top_k]]
         
         results = []
         for idx in top_indices:
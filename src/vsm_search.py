@@ -1,39 +1,39 @@
 import math
 from collections import defaultdict
 from typing import List, Dict
+import numpy as np
 from preprocessing import SafeIslamicArabicProcessor
+from metrics import POSTINGS_TRAVERSED
+from filters import DocFilter
+from frozen_index import FrozenPostings, accumulate, doc_filter_mask, readonly, shared_postings, top_k_rows
+from near_duplicates import cluster_array
 
 
 class VectorSpaceModel:
-    def __init__(self, name: str, inverted_index: dict, doc_metadata: dict, processor: SafeIslamicArabicProcessor):
+    def __init__(self, name: str, inverted_index: dict, doc_metadata: dict, processor: SafeIslamicArabicProcessor,
+                 duplicate_clusters: Dict[str, str] = None, postings: FrozenPostings = None):
         self.name = name
         self.inverted_index = inverted_index
         self.doc_metadata = doc_metadata
         self.processor = processor
         self.N = len(doc_metadata)
         
-        self.idf = {}
-        for term, data in self.inverted_index.items():
-            df = data['df']
-            self.idf[term] = math.log10(self.N / df) if df > 0 else 0
-            
-        self.doc_vectors = defaultdict(lambda: defaultdict(float))
-        self.doc_norms = defaultdict(float)
-        self._build_index()
+        # Read-only arrays: one tf-idf weight per postings entry, one norm per doc row
+        self.doc_ids = tuple(doc_metadata)
+        self.postings = shared_postings(inverted_index, self.doc_ids, postings)
+        df = self.postings.df.astype(np.float64)
+        self.idf = readonly(np.where(df > 0, np.log10(self.N / np.maximum(df, 1)), 0.0))
+        weights = self.postings.tfs * self.postings.entry_weights(self.idf)
+        self.doc_norms = readonly(np.sqrt(np.bincount(self.postings.rows, weights=weights ** 2,
+                                                      minlength=len(self.doc_ids))))
+        self.duplicate_clusters = duplicate_clusters
+        self.cluster_of = cluster_array(duplicate_clusters, self.doc_ids)
 
-    def _build_index(self):
-        for term, data in self.inverted_index.items():
-            curr_idf = self.idf[term]
-            for doc_id, positions in data['postings'].items():
-                tf = len(positions)
-                tfidf = tf * curr_idf
-                self.doc_vectors[doc_id][term] = tfidf
-                self.doc_norms[doc_id] += tfidf ** 2
-        
-        for doc_id in self.doc_norms:
-            self.doc_norms[doc_id] = math.sqrt(self.doc_norms[doc_id])
+    @staticmethod
+    def _dot_contribution(rows: np.ndarray, tfs: np.ndarray, weight: float) -> np.ndarray:
+        return weight * tfs.astype(np.float64)
 
-    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict]:
         query_tokens = self.processor.preprocess(query)['tokens']
         if not query_tokens: 
             return []
@@ -42,34 +42,38 @@ class VectorSpaceModel:
         for t in query_tokens: 
             query_tf[t] += 1
         
-        query_vector = {}
+        # Each term contributes q_tfidf * (tf * idf) to a document's dot product
+        terms = []
         query_norm_sq = 0
         for term, tf in query_tf.items():
-            curr_idf = self.idf.get(term, 0)
+            term_id = self.postings.term_ids.get(term)
+            curr_idf = float(self.idf[term_id]) if term_id is not None else 0
             tfidf = tf * curr_idf
-            query_vector[term] = tfidf
             query_norm_sq += tfidf ** 2
+            if term_id is not None:
+                rows, tfs = self.postings.get(term)
+                terms.append((rows, tfs, tfidf * curr_idf))
             
         query_norm = math.sqrt(query_norm_sq)
         if query_norm == 0: 
             return []
         
-        scores = defaultdict(float)
-        for term, q_tfidf in query_vector.items():
-            if term in self.inverted_index:
-                for doc_id in self.inverted_index[term]['postings']:
-                    d_tfidf = self.doc_vectors[doc_id][term]
-                    scores[doc_id] += q_tfidf * d_tfidf
+        POSTINGS_TRAVERSED.inc(sum(len(rows) for rows, _, _ in terms), engine=type(self).__name__,
+                               corpus=self.name.lower())
+        dots, matched = accumulate(len(self.doc_ids), terms, self._dot_contribution,
+                                   doc_filter_mask(doc_filter, len(self.doc_ids)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = dots[0] / (query_norm * self.doc_norms)
         
         results = []
-        for doc_id, dot_product in scores.items():
-            cosine_sim = dot_product / (query_norm * self.doc_norms[doc_id])
-            
+        for row in top_k_rows(scores, matched, top_k, cluster_of=self.cluster_of):
+            doc_id = self.doc_ids[row]
             results.append({
                 'doc_id': doc_id,
-                'score': cosine_sim,
+                'score': float(scores[row]),
                 'text': self.doc_metadata[doc_id].get('arabic_original', ''),
-                'metadata': self.doc_metadata[doc_id]
+                'metadata': self.doc_metadata[doc_id],
+                'cluster_id': (self.duplicate_clusters or {}).get(doc_id)
             })
             
-        return sorted(results, key=lambda x: x['score'], reverse=True)[:top_k]
+        return results
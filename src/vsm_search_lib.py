@@ -3,6 +3,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from typing import List, Dict
 from preprocessing import SafeIslamicArabicProcessor
+from filters import DocFilter
 
 
 class VectorSpaceModelLib:
@@ -37,7 +38,7 @@ class VectorSpaceModelLib:
         
         self.doc_vectors = self.vectorizer.fit_transform(doc_texts)
     
-    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+    def search(self, query: str, top_k: int = 10, doc_filter: DocFilter = None) -> List[Dict]:
         query_result = self.processor.preprocess(query)
         query_tokens = query_result['tokens']
         
@@ -47,9 +48,15 @@ class VectorSpaceModelLib:
         query_text = ' '.join(query_tokens)
         query_vector = self.vectorizer.transform([query_text])
         
-        similarities = cosine_similarity(query_vector, self.doc_vectors).flatten()
+        if doc_filter is None:
+            rows = np.arange(len(self.documents))
+            similarities = cosine_similarity(query_vector, self.doc_vectors).flatten()
+        else:
+            rows = doc_filter.rows
+            similarities = np.zeros(len(self.documents))
+            similarities[rows] = cosine_similarity(query_vector, self.doc_vectors[rows]).flatten()
         
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        top_indices = rows[np.argsort(similarities[rows])[::-1][:top_k]]
         
         results = []
         for idx in top_indices:
@@ -0,0 +1,125 @@
+import json
+import os
+import pytest
+
+INDICES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'indices')
+
+# A small corpus in the raw formats build_indices.py reads: a few Quran verses
+# (two repeated refrains, several forms of صلاة / صبر) and hadiths in three
+# books with English text, one of them repeated verbatim
+QURAN = [
+    (1, 1, "بسم الله الرحمن الرحيم"),
+    (1, 2, "الحمد لله رب العالمين"),
+    (1, 3, "الرحمن الرحيم"),
+    (1, 4, "مالك يوم الدين"),
+    (1, 5, "اياك نعبد واياك نستعين"),
+    (2, 2, "ذلك الكتاب لا ريب فيه هدى للمتقين"),
+    (2, 3, "الذين يؤمنون بالغيب ويقيمون الصلاة ومما رزقناهم ينفقون"),
+    (2, 43, "واقيموا الصلاة واتوا الزكاة واركعوا مع الراكعين"),
+    (2, 45, "واستعينوا بالصبر والصلاة وانها لكبيرة الا على الخاشعين"),
+    (2, 153, "يا ايها الذين امنوا استعينوا بالصبر والصلاة ان الله مع الصابرين"),
+    (2, 155, "ولنبلونكم بشيء من الخوف والجوع ونقص من الاموال والانفس والثمرات وبشر الصابرين"),
+    (2, 183, "يا ايها الذين امنوا كتب عليكم الصيام كما كتب على الذين من قبلكم لعلكم تتقون"),
+    (55, 13, "فباي الاء ربكما تكذبان"),
+    (55, 16, "فباي الاء ربكما تكذبان"),
+    (55, 18, "فباي الاء ربكما تكذبان"),
+    (103, 1, "والعصر"),
+    (103, 2, "ان الانسان لفي خسر"),
+    (103, 3, "الا الذين امنوا وعملوا الصالحات وتواصوا بالحق وتواصوا بالصبر"),
+    (107, 4, "فويل للمصلين"),
+    (107, 5, "الذين هم عن صلاتهم ساهون"),
+]
+
+HADITH = {
+    'bukhari': [
+        (1, 1, "انما الاعمال بالنيات وانما لكل امرئ ما نوى",
+         "Actions are judged by intentions, and every person will get what they intended.", "Umar bin Al-Khattab"),
+        (2, 1, "بني الاسلام على خمس شهادة ان لا اله الا الله واقام الصلاة وايتاء الزكاة والحج وصوم رمضان",
+         "Islam is built on five: testimony, prayer, zakat, pilgrimage and fasting Ramadan.", "Ibn Umar"),
+        (3, 2, "من صام رمضان ايمانا واحتسابا غفر له ما تقدم من ذنبه",
+         "Whoever fasts Ramadan out of faith and hope of reward will be forgiven his past sins.", "Abu Huraira"),
+        (4, 2, "الصلاة على وقتها ثم بر الوالدين ثم الجهاد في سبيل الله",
+         "Prayer at its proper time, then kindness to parents, then striving in the way of Allah.", "Ibn Masud"),
+        (5, 2, "من صام رمضان ايمانا واحتسابا غفر له ما تقدم من ذنبه",
+         "Whoever fasts Ramadan out of faith and hope of reward will be forgiven his past sins.", "Abu Huraira"),
+    ],
+    'muslim': [
+        (6, 1, "الطهور شطر الايمان والصبر ضياء والصلاة نور",
+         "Purity is half of faith, patience is illumination and prayer is light.", "Abu Malik al-Ashari"),
+        (7, 1, "الدين النصيحة لله ولكتابه ولرسوله",
+         "Religion is sincerity to Allah, His Book and His Messenger.", "Tamim ad-Dari"),
+        (8, 3, "لا يؤمن احدكم حتى يحب لاخيه ما يحب لنفسه",
+         "None of you truly believes until he loves for his brother what he loves for himself.", "Anas"),
+        (9, 3, "ان الله لا ينظر الى صوركم واموالكم ولكن ينظر الى قلوبكم واعمالكم",
+         "Allah does not look at your appearance or wealth but at your hearts and deeds.", "Abu Huraira"),
+    ],
+    'malik': [
+        (10, 1, "من حسن اسلام المرء تركه ما لا يعنيه",
+         "Part of the excellence of a person's Islam is leaving what does not concern him.", "Ali ibn Husayn"),
+        (11, 1, "الزكاة حق المال والصبر على البلاء",
+         "Zakat is the right of wealth, and patience in affliction.", "Abu Bakr"),
+    ],
+}
+
+
+def write_tiny_corpus(root: str):
+    os.makedirs(os.path.join(root, 'qoran'), exist_ok=True)
+    os.makedirs(os.path.join(root, 'hadith'), exist_ok=True)
+    with open(os.path.join(root, 'qoran', 'quran.json'), 'w', encoding='utf-8') as f:
+        json.dump([{'chapter': c, 'verse': v, 'text': t} for c, v, t in QURAN], f, ensure_ascii=False)
+    for book, hadiths in HADITH.items():
+        with open(os.path.join(root, 'hadith', f'{book}.json'), 'w', encoding='utf-8') as f:
+            json.dump({'hadiths': [
+                {'id': hadith_id, 'idInBook': hadith_id, 'chapterId': chapter_id, 'arabic': arabic,
+                 'english': {'text': english, 'narrator': narrator}}
+                for hadith_id, chapter_id, arabic, english, narrator in hadiths
+            ]}, f, ensure_ascii=False)
+
+
+@pytest.fixture(scope='session')
+def tiny_indices_dir(tmp_path_factory):
+    """Every index file build_indices.py writes, built from the small corpus above."""
+    from build_indices import build_indices
+    root = str(tmp_path_factory.mktemp('corpus'))
+    write_tiny_corpus(root)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        build_indices('indices')
+    finally:
+        os.chdir(cwd)
+    return os.path.join(root, 'indices')
+
+
+@pytest.fixture(scope='session')
+def tiny_engines(tiny_indices_dir):
+    from load_engines import load_engines_fast
+    return load_engines_fast(tiny_indices_dir)
+
+
+@pytest.fixture(scope='session')
+def indices_dir():
+    """The built indices; tests that need them are skipped until src/build_indices.py has run."""
+    if not os.path.exists(os.path.join(INDICES_DIR, 'hadith_index.json')):
+        pytest.skip("indices not built (run python build_indices.py from src/)")
+    return INDICES_DIR
+
+
+@pytest.fixture(scope='session')
+def engines(indices_dir):
+    from load_engines import load_engines_fast
+    return load_engines_fast(indices_dir)
+
+
+@pytest.fixture(scope='session')
+def app_client(tiny_indices_dir):
+    """The FastAPI app serving the small corpus, with both models on a zero-latency fake LLM."""
+    from fastapi.testclient import TestClient
+    from gemini_llm import SearchModelOne, SearchModelTwo
+    from llm_backends import FakeBackend
+    import main
+    main.registry.indices_dir = tiny_indices_dir
+    main.llm_model['m1'] = SearchModelOne(backend=FakeBackend(latency=0))
+    main.llm_model['m2'] = SearchModelTwo(backend=FakeBackend(latency=0))
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,105 @@
+import json
+import sys
+import pytest
+import batch
+import gemini_llm
+from batch import completed_ids, read_questions
+
+QUESTIONS = [
+    '{"id": "a", "question": "الصبر على البلاء"}',
+    '{"id": "b", "question": "الصلاة", "surah": 2}',
+    '{"id": "c", "question": "الزكاة", "surah": "two"}',
+    '{"id": "d", "question": "الصيام", "verse_from": 3}',
+    '{"id": "e", "question": "رمضان", "book": "Sahih al-Bukhari", "full_text": "yes"}',
+    '"الطهور شطر الايمان"',
+    '{"question": "unterminated',
+]
+
+
+@pytest.fixture
+def questions(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text('\n'.join(QUESTIONS) + '\n\n', encoding='utf-8')
+    return str(path)
+
+
+def test_rows_are_normalized_and_bad_rows_carry_an_error(questions):
+    rows = {row['id']: row for row in read_questions(questions)}
+    assert list(rows) == ['a', 'b', 'c', 'd', 'e', '6', '7']
+    assert rows['b']['surah'] == 2 and 'error' not in rows['b']
+    assert rows['c']['error'] == "Invalid surah: 'two'"
+    assert 'surah' in rows['d']['error']
+    assert rows['e']['full_text'] is True
+    assert rows['6']['question'] == "الطهور شطر الايمان"
+    assert rows['7']['error'].startswith("Invalid JSON")
+
+
+def test_csv_input(tmp_path):
+    path = tmp_path / "questions.csv"
+    path.write_text("id,question,surah\nx,الصلاة,2\ny,الصبر,\n", encoding='utf-8')
+    rows = list(read_questions(str(path)))
+    assert [(r['id'], r.get('surah')) for r in rows] == [('x', 2), ('y', None)]
+
+
+def test_completed_ids_ignore_torn_lines_and_optionally_errors(tmp_path):
+    path = tmp_path / "answers.jsonl"
+    path.write_text('{"id": "a", "response": {}}\n{"id": "b", "error": "x"}\n{"id": "c", "resp',
+                    encoding='utf-8')
+    assert completed_ids(str(path), retry_errors=False) == {'a', 'b'}
+    assert completed_ids(str(path), retry_errors=True) == {'a'}
+    # A later successful answer for a failed id counts
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n{"id": "b", "response": {}}\n')
+    assert completed_ids(str(path), retry_errors=True) == {'a', 'b'}
+    assert completed_ids(str(tmp_path / "missing.jsonl"), retry_errors=True) == set()
+
+
+def run_batch_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['batch.py', *args, '--concurrency', '4'])
+    batch.main()
+
+
+def answers(path):
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def test_interrupted_batch_resumes_and_retries_errors(monkeypatch, questions, tiny_indices_dir, tmp_path):
+    output = str(tmp_path / "answers.jsonl")
+    cli = [questions, output, '--indices-dir', tiny_indices_dir]
+
+    # LLM unavailable: two questions answered (degraded) before the "interruption"
+    monkeypatch.setattr(gemini_llm, 'create_backend', lambda api_key: None)
+    run_batch_cli(monkeypatch, *cli, '--limit', '2')
+    first = answers(output)
+    assert {e['id'] for e in first} == {'a', 'b'}
+    assert all(e['response']['degraded'] and e['error'].startswith("Degraded") for e in first)
+    # Killed while writing c's answer
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write('{"id": "c", "que')
+
+    # The resumed run answers only the rest
+    monkeypatch.undo()
+    monkeypatch.setenv('MUSTADIL_LLM_BACKEND', 'fake')
+    monkeypatch.setenv('MUSTADIL_FAKE_LLM_LATENCY', '0')
+    run_batch_cli(monkeypatch, *cli)
+    second = answers(output)[2:]
+    assert sorted(e['id'] for e in second) == ['6', '7', 'c', 'd', 'e']
+    assert {e['id'] for e in second if 'error' in e} == {'7', 'c', 'd'}
+    assert all(r['text'] for r in next(e for e in second if e['id'] == 'e')['response']['results'])
+
+    # Nothing left without --retry-errors; with it, only failed and degraded ids run again
+    run_batch_cli(monkeypatch, *cli)
+    assert len(answers(output)) == 7
+    run_batch_cli(monkeypatch, *cli, '--retry-errors')
+    retried = answers(output)[7:]
+    assert sorted(e['id'] for e in retried) == ['7', 'a', 'b', 'c', 'd']
+    assert {e['id'] for e in retried if 'error' in e} == {'7', 'c', 'd'}
+    assert all(not e['response']['degraded'] for e in retried if e['id'] in ('a', 'b'))
+    assert completed_ids(output, retry_errors=True) == {'a', 'b', 'e', '6'}
@@ -0,0 +1,62 @@
+import pytest
+from benchmark import (find_regressions, parity_reference, percentile, run_engine_benchmarks, topk_overlap,
+                       warm_engine)
+from bm25_search import BM25SearchEngine
+from load_engines import load_engines_fast
+from startup import is_unbuilt
+
+
+def test_percentile_interpolates_between_ranks():
+    assert percentile([4, 1, 3, 2], 50) == 2.5
+    assert percentile([1, 2, 3, 4, 5], 95) == pytest.approx(4.8)
+    assert percentile([], 95) == 0.0
+
+
+def test_topk_overlap():
+    assert topk_overlap([{'doc_id': 'a'}, {'doc_id': 'b'}], [{'doc_id': 'b'}, {'doc_id': 'c'}]) == 0.5
+    assert topk_overlap([], []) == 1.0
+
+
+def test_parity_reference_scores_with_the_plain_formula(tiny_engines):
+    engine = tiny_engines['bm25_quran']
+    reference = parity_reference(engine)
+    plain = BM25SearchEngine('Quran', tiny_engines['quran_inverted_index'], engine.doc_metadata,
+                             tiny_engines['processor'])
+    for query in ("الصلاة", "فباي الاء ربكما تكذبان", "الصلوة"):
+        assert reference.search(query, top_k=10) == plain.search(query, top_k=10)
+    # The served engine keeps its stems, typo expansion and duplicate collapse
+    assert engine.stem_index is not None and engine.term_dictionary is not None
+    assert engine.duplicate_clusters is not None
+
+
+def test_warm_engine_builds_deferred_engines_before_timing(tiny_indices_dir):
+    engines = load_engines_fast(tiny_indices_dir)
+    engine = engines['tfidf_lib_quran']
+    assert is_unbuilt(engine)
+    warm = warm_engine(engine, ["الصلاة"], 5)
+    assert not is_unbuilt(engine)
+    assert warm['build_ms'] > 0 and warm['warmup_ms'] > 0
+
+
+def test_report_has_warmup_latency_and_parity_entries(tiny_engines):
+    report = run_engine_benchmarks(tiny_engines, ["bm25", "bm25_lib"], top_k=5, repeat=1)
+    assert set(report['quran/bm25_lib/warmup']) == {'build_ms', 'warmup_ms'}
+    assert report['hadith/bm25/single_term']['count'] == 6
+    assert 0.0 <= report['quran/parity/bm25~bm25_lib']['topk_overlap'] <= 1.0
+
+
+def test_find_regressions_flags_slower_p95_and_lower_overlap():
+    baseline = {
+        'quran/bm25/single_term': {'p95_ms': 10.0},
+        'quran/parity/bm25~bm25_lib': {'topk_overlap': 0.9},
+        '_meta': {'load_time_s': 1.0},
+    }
+    report = {
+        'quran/bm25/single_term': {'p95_ms': 13.0},
+        'quran/parity/bm25~bm25_lib': {'topk_overlap': 0.6},
+        'quran/bm25/warmup': {'build_ms': 0.0, 'warmup_ms': 5.0},
+        '_meta': {'load_time_s': 9.0},
+    }
+    regressions = find_regressions(report, baseline, tolerance=0.2)
+    assert len(regressions) == 2
+    assert find_regressions(report, baseline, tolerance=0.5) == []
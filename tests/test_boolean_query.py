@@ -0,0 +1,97 @@
+import random
+import pytest
+import boolean_query
+from boolean_query import (BooleanIndex, BooleanQueryError, galloping_intersect, is_boolean_query,
+                           parse_boolean_query, positive_terms)
+
+TERMS = ['a', 'b', 'c', 'd', 'e']
+
+
+def random_corpus(seed, n=60):
+    rng = random.Random(seed)
+    docs = {f'd{i}': {t for t in TERMS if rng.random() < (0.1 if t == 'e' else 0.5)} for i in range(n)}
+    inverted = {t: {'postings': {d: 1 for d, terms in docs.items() if t in terms}} for t in TERMS}
+    return docs, inverted
+
+
+def reference(node, docs):
+    """The expression evaluated with Python sets."""
+    kind = node[0]
+    if kind == 'term':
+        return {d for d, terms in docs.items() if node[1] in terms}
+    if kind == 'not':
+        return set(docs) - reference(node[1], docs)
+    sets = [reference(child, docs) for child in node[1]]
+    return set.union(*sets) if kind == 'or' else set.intersection(*sets)
+
+
+QUERIES = [
+    "a AND b",
+    "a b c",
+    "a OR e",
+    "a NOT b",
+    "NOT a",
+    "e AND NOT (a OR b)",
+    "(a OR b) AND (c OR NOT d)",
+    "a AND b NOT c NOT e",
+    "NOT a NOT b",
+]
+
+
+@pytest.mark.parametrize('bitmap_ratio', [1, 16, 10 ** 9])
+@pytest.mark.parametrize('query', QUERIES)
+def test_evaluation_matches_set_semantics(monkeypatch, query, bitmap_ratio):
+    # 1: every term has a bitmap; 10**9: none do; 16: only the frequent ones
+    monkeypatch.setattr(boolean_query, 'BITMAP_DF_RATIO', bitmap_ratio)
+    for seed in range(5):
+        docs, inverted = random_corpus(seed)
+        index = BooleanIndex(inverted, list(docs))
+        tree = parse_boolean_query(query, lambda word: [word])
+        got = {index.doc_ids[o] for o in index.matching_ordinals(tree)}
+        assert got == reference(tree, docs), (query, seed)
+
+        restrict_to = list(range(0, len(docs), 3))
+        restricted = {index.doc_ids[o] for o in index.matching_ordinals(tree, restrict_to)}
+        assert restricted == got & {index.doc_ids[o] for o in restrict_to}
+
+
+def test_parsing():
+    parse = lambda q: parse_boolean_query(q, lambda word: [word])
+    assert parse("a b OR c") == ('or', [('and', [('term', 'a'), ('term', 'b')]), ('term', 'c')])
+    assert parse("a NOT (b OR c)") == ('and', [('term', 'a'), ('not', ('or', [('term', 'b'), ('term', 'c')]))])
+    assert positive_terms(parse("a NOT b OR c")) == ['a', 'c']
+    for bad in ("a AND", "(a OR b", "a )", "OR a"):
+        with pytest.raises(BooleanQueryError):
+            parse(bad)
+
+
+def test_galloping_intersect():
+    rng = random.Random(0)
+    large = sorted(rng.sample(range(10000), 3000))
+    small = sorted(rng.sample(range(10000), 40))
+    assert galloping_intersect(small, large) == sorted(set(small) & set(large))
+    assert galloping_intersect([], large) == []
+
+
+def test_operators_only_count_in_arabic_queries():
+    assert is_boolean_query("الصلاة AND الزكاة")
+    assert is_boolean_query("الصبر NOT الجزع")
+    assert not is_boolean_query("Is it NOT allowed to pray AND fast on the same day")
+    assert not is_boolean_query("الصلاة والزكاة")
+
+
+def test_boolean_search_scores_only_matching_documents(tiny_engines):
+    engine = tiny_engines['bm25_quran']
+    with_prayer = {r['doc_id'] for r in engine.search_boolean("الصلاة", top_k=50)}
+    with_zakat = {r['doc_id'] for r in engine.search_boolean("الزكاة", top_k=50)}
+    assert '2_43' in with_prayer & with_zakat
+
+    results = engine.search_boolean("الصلاة NOT الزكاة", top_k=50)
+    assert {r['doc_id'] for r in results} == with_prayer - with_zakat
+    assert all(r['score'] > 0 for r in results)
+    assert {r['doc_id'] for r in engine.search_boolean("الصلاة AND الزكاة", top_k=50)} == with_prayer & with_zakat
+    assert {r['doc_id'] for r in engine.search_boolean("الصلاة OR الزكاة", top_k=50)} == with_prayer | with_zakat
+
+
+def test_invalid_boolean_query_is_a_400(app_client):
+    assert app_client.get("/search/bm25/m1/الصلاة AND").status_code == 400
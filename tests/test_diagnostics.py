@@ -0,0 +1,53 @@
+import numpy as np
+from diagnostics import deep_sizeof, index_stats, memory_report
+from load_engines import load_engines_fast
+
+
+def test_shared_objects_are_counted_once():
+    shared = list(range(1000))
+    seen = set()
+    first = deep_sizeof({'a': shared}, seen)
+    second = deep_sizeof({'b': shared}, seen)
+    assert first > deep_sizeof(shared) > second
+
+
+def test_array_views_do_not_count_their_base_twice():
+    base = np.zeros(1_000_000)
+    seen = set()
+    assert deep_sizeof(base, seen) >= base.nbytes
+    assert deep_sizeof(base[:10], seen) < 1000
+    # Measured on its own, a view reaches its base
+    assert deep_sizeof(base[:10]) >= base.nbytes
+
+
+def test_index_stats():
+    index = {term: {'df': df, 'postings': {}} for term, df in (('a', 1), ('b', 1), ('c', 5), ('d', 2000))}
+    stats = index_stats(index, top=2)
+    assert stats['vocabulary'] == 4 and stats['postings'] == 2007 and stats['df_max'] == 2000
+    assert stats['df_buckets'] == {'1': 2, '2-10': 1, '11-100': 0, '101-1000': 0, '>1000': 1}
+    assert stats['longest_postings'] == [['d', 2000], ['c', 5]]
+    assert index_stats({}) == {'vocabulary': 0, 'postings': 0}
+
+
+def test_memory_report_measures_shared_indices_separately(tiny_indices_dir):
+    engines = load_engines_fast(tiny_indices_dir)
+    report = memory_report(engines)
+    assert report['indices']['quran_postings']['bytes'] > 0
+    assert report['indices']['quran_inverted_index']['vocabulary'] == len(engines['quran_inverted_index'])
+    assert 'hadith_stem_index' in report['indices']
+
+    bm25 = report['engines']['bm25_quran']
+    assert bm25['built'] and bm25['vocabulary'] == len(engines['quran_inverted_index'])
+    # The engine's own bytes exclude the postings and records it shares
+    assert bm25['bytes'] < deep_sizeof(engines['bm25_quran'])
+    assert report['engines']['tfidf_lib_quran'] == {'built': False}
+    assert report['total_bytes'] == sum(row['bytes'] for row in report['indices'].values()) + \
+        sum(row.get('bytes', 0) for row in report['engines'].values())
+
+
+def test_memory_endpoint_needs_admin(app_client, monkeypatch):
+    monkeypatch.delenv('MUSTADIL_ADMIN', raising=False)
+    assert app_client.get("/admin/memory").status_code == 404
+    monkeypatch.setenv('MUSTADIL_ADMIN', '1')
+    report = app_client.get("/admin/memory", params={'top': 3}).json()
+    assert len(report['indices']['hadith_inverted_index']['longest_postings']) == 3
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from engine_registry import EngineRegistry, index_version
+
+
+class FakeEngine:
+    def __init__(self, generation):
+        self.generation = generation
+        self.searches = 0
+        self.closed = False
+
+    def search(self, query, top_k=10):
+        self.searches += 1
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+def make_loader():
+    loads = []
+
+    def loader(indices_dir):
+        if indices_dir.endswith('broken'):
+            raise OSError("unreadable index")
+        engine = FakeEngine(len(loads))
+        loads.append(engine)
+        return {'bm25_quran': engine}
+    return loader, loads
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def wait_for_reload(registry):
+    wait_for(lambda: not registry.reloading())
+
+
+def test_index_version_follows_the_files(tmp_path):
+    indices = str(tmp_path)
+    assert index_version(indices).endswith('@missing')
+    (tmp_path / 'quran_index.json').write_text('[]')
+    first = index_version(indices)
+    assert index_version(indices) == first
+    (tmp_path / 'quran_index.json').write_text('[{}]')
+    second = index_version(indices)
+    assert second != first
+    (tmp_path / 'bm25_quran_impact.npz').write_bytes(b'x')
+    assert index_version(indices) != second
+
+
+def test_engines_are_warmed_before_they_take_traffic(tmp_path):
+    loader, loads = make_loader()
+    registry = EngineRegistry(loader, str(tmp_path))
+    registry.load()
+    assert loads[0].searches > 0
+    assert registry.status()['version'] == index_version(str(tmp_path))
+
+
+def test_reload_swaps_after_in_flight_requests_finish(tmp_path):
+    loader, loads = make_loader()
+    registry = EngineRegistry(loader, str(tmp_path), drain_timeout=5)
+    registry.load()
+
+    with registry.acquire() as pinned:
+        assert registry.reload()
+        wait_for(lambda: registry.current()['bm25_quran'] is not pinned['bm25_quran'])
+        # New requests see the new set; the pinned request keeps its engines open
+        assert registry.current()['bm25_quran'].generation == 1
+        assert pinned['bm25_quran'].generation == 0
+        time.sleep(0.05)
+        assert registry.reloading() and not loads[0].closed
+    wait_for_reload(registry)
+    assert loads[0].closed and not loads[1].closed
+
+
+def test_failed_reload_keeps_serving_the_current_set(tmp_path):
+    loader, loads = make_loader()
+    registry = EngineRegistry(loader, str(tmp_path))
+    registry.load()
+    version = registry.version
+    registry.reload(os.path.join(str(tmp_path), 'broken'))
+    wait_for_reload(registry)
+    assert registry.version == version
+    assert registry.current()['bm25_quran'] is loads[0]
+    assert 'unreadable index' in registry.status()['last_error']
+
+
+def test_only_one_reload_runs_at_a_time(tmp_path):
+    release = threading.Event()
+    loader, loads = make_loader()
+
+    def slow_loader(indices_dir):
+        if loads:
+            release.wait(5)
+        return loader(indices_dir)
+
+    registry = EngineRegistry(slow_loader, str(tmp_path))
+    registry.load()
+    assert registry.reload()
+    assert not registry.reload()
+    release.set()
+    wait_for_reload(registry)
+    assert len(loads) == 2
+
+
+def test_admin_endpoints_are_gated(app_client, monkeypatch):
+    monkeypatch.delenv('MUSTADIL_ADMIN', raising=False)
+    assert app_client.post("/admin/reload").status_code == 404
+    assert app_client.get("/admin/engines").status_code == 404
+    monkeypatch.setenv('MUSTADIL_ADMIN', '1')
+    assert app_client.post("/admin/reload", params={'indices_dir': '/no/such/dir'}).status_code == 400
+    assert app_client.get("/admin/engines").json()['version']
@@ -0,0 +1,51 @@
+from english_text import EnglishTextProcessor, detect_language, narrator_text
+from run_user_query import run_pipeline
+
+
+def test_english_tokens_are_folded_stemmed_and_filtered():
+    processor = EnglishTextProcessor()
+    assert processor.preprocess("A'isha narrated: The Prayers of the ladies")['tokens'] == \
+        ['aisha', 'narrated', 'prayer', 'lady']
+    assert processor.preprocess("Ṣalāh")['tokens'] == ['salah']
+    assert [processor.stem(w) for w in ('glass', 'status', 'has', 'wives')] == ['glass', 'status', 'has', 'wive']
+
+
+def test_detect_language():
+    assert detect_language("patience in affliction") == 'en'
+    assert detect_language("الصبر على البلاء") == 'ar'
+    assert detect_language("الصبر on") == 'ar'
+    assert detect_language("ok") == 'ar'
+
+
+def test_narrator_falls_back_to_the_english_isnad():
+    assert narrator_text({'narrator': "Abu Huraira", 'english_text': "..."}) == "Abu Huraira"
+    record = {'narrator': " ", 'english_text': "Yahya related to me from Malik that the Messenger of Allah said"}
+    assert narrator_text(record) == "Yahya related to me from Malik"
+
+
+def test_english_and_narrator_fields_are_searched(tiny_engines):
+    engine = tiny_engines['bm25f_hadith']
+    results = engine.search("patience", top_k=5)
+    assert {r['doc_id'] for r in results} == {'6', '11'}
+    assert all(r['matched_fields'] == ['english'] and r['matched_tokens'] == [] for r in results)
+
+    by_narrator = engine.search("Abu Huraira", top_k=5)
+    # 3 and 5 are the same hadith, 9 has the same narrator; other Abus follow
+    assert {r['doc_id'] for r in by_narrator[:2]} == {'3', '9'}
+    assert {r['doc_id'] for r in by_narrator[2:]} == {'6', '11'}
+    assert all(r['matched_fields'] == ['narrator'] for r in by_narrator)
+
+    arabic = engine.search("الصلاة", top_k=5)
+    assert arabic and all('arabic' in r['matched_fields'] for r in arabic)
+    assert tiny_engines['bm25f_quran'].search("patience") == []
+
+
+class NoLLM:
+    def __getattr__(self, name):
+        raise AssertionError("English questions should not reach the LLM")
+
+
+def test_english_questions_skip_query_generation(tiny_engines):
+    response = run_pipeline(tiny_engines, "fasts Ramadan out of faith", "bm25", "m1", {'m1': NoLLM()})
+    assert response.results and response.results[0].doc_id == '3'
+    assert all(r.observation == "Direct search (English question)" for r in response.results)
@@ -0,0 +1,65 @@
+import pytest
+from gemini_llm import SearchModelOne, SearchModelTwo
+from llm_backends import FakeBackend, FakeBackendError, LLMResponse, RecordingBackend, create_backend
+from llm_gateway import GatewayBackend
+
+SEARCH_CONFIG = {"response_json_schema": {"title": "SearchResponse"}}
+
+
+def test_model_one_generates_and_validates_on_the_fake_backend():
+    model = SearchModelOne(backend=FakeBackend(latency=0))
+    queries = model.generate_queries("الصبر على البلاء")
+    assert queries == [{'query': "الصبر على البلاء", 'type': 'quran'},
+                       {'query': "الصبر على البلاء", 'type': 'hadith'}]
+
+    candidates = [{'query': q['query'], 'type': q['type'],
+                   'results': [{'text': 'نص اول'}, {'text': 'نص ثان'}]} for q in queries]
+    validations = model.filter_results_batch("الصبر على البلاء", candidates)
+    assert {q: [v['index'] for v in found] for q, found in validations.items()} == {0: [0, 1], 1: [0, 1]}
+    assert all(v['is_relevant'] for found in validations.values() for v in found)
+
+
+def test_model_two_gets_phrases_from_the_fake_backend():
+    queries = SearchModelTwo(backend=FakeBackend(latency=0)).generate_queries("الصبر على البلاء")
+    assert {q['type'] for q in queries} == {'quran', 'hadith'}
+    assert all(q['query'] for q in queries)
+
+
+def test_errors_are_transient_and_deterministic_per_seed():
+    def outcomes(seed):
+        backend = FakeBackend(latency=0, error_rate=0.5, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                backend.generate_content("m", "q", SEARCH_CONFIG)
+                results.append(True)
+            except FakeBackendError as e:
+                assert e.code == 503
+                results.append(False)
+        return results
+
+    assert outcomes(7) == outcomes(7)
+    assert True in outcomes(7) and False in outcomes(7)
+
+
+def test_recorded_responses_are_replayed(tmp_path):
+    class Canned:
+        def generate_content(self, model, contents, config=None):
+            return LLMResponse(text='{"queries": []}')
+
+    fixtures = str(tmp_path / "fixtures.jsonl")
+    RecordingBackend(Canned(), fixtures).generate_content("m", "سؤال", SEARCH_CONFIG)
+    replay = FakeBackend(fixtures_path=fixtures, latency=0)
+    assert replay.generate_content("m", "سؤال", SEARCH_CONFIG).text == '{"queries": []}'
+    # Unrecorded prompts are synthesized
+    assert "queries" in replay.generate_content("m", "سؤال اخر", SEARCH_CONFIG).text
+
+
+def test_create_backend_selection(monkeypatch):
+    monkeypatch.setenv("MUSTADIL_LLM_BACKEND", "fake")
+    monkeypatch.setenv("MUSTADIL_FAKE_LLM_LATENCY", "0")
+    backend = create_backend("")
+    assert isinstance(backend, GatewayBackend) and isinstance(backend.backend, FakeBackend)
+
+    monkeypatch.setenv("MUSTADIL_LLM_BACKEND", "gemini")
+    assert create_backend("") is None
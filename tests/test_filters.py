@@ -0,0 +1,55 @@
+import pytest
+from batch import read_questions
+from filters import build_filter_tables, filters_from_params, resolve_doc_filters
+
+
+def test_row_ranges_are_run_length_encoded():
+    docs = [{'chapter': 1, 'verse': 1}, {'chapter': 1, 'verse': 2}, {'chapter': 2, 'verse': 1},
+            {'chapter': 1, 'verse': 3}]
+    assert build_filter_tables(docs) == {'chapter': {'1': [[0, 2], [3, 4]], '2': [[2, 3]]}}
+
+
+def test_surah_and_verse_range_resolve_to_rows(tiny_engines):
+    tables = tiny_engines['quran_filters']
+    assert tables.resolve({'chapter': 2, 'verse_from': 40, 'verse_to': 160}).doc_ids == \
+        {'2_43', '2_45', '2_153', '2_155'}
+    assert tables.resolve({'chapter': 1, 'verse_to': 2}).doc_ids == {'1_1', '1_2'}
+    assert tables.resolve({'chapter': 114}).doc_ids == frozenset()
+    assert tables.resolve({}) is None
+
+
+def test_book_and_chapter_resolve_to_rows(tiny_engines):
+    tables = tiny_engines['hadith_filters']
+    assert tables.resolve({'book': 'Sahih al-Bukhari', 'chapter_id': 2}).doc_ids == {'3', '4', '5'}
+    assert tables.resolve({'book': 'Muwatta Malik'}).doc_ids == {'10', '11'}
+    # chapter_id alone matches that chapter in every book
+    assert tables.resolve({'chapter_id': 1}).doc_ids == {'1', '2', '6', '7', '10', '11'}
+
+
+@pytest.mark.parametrize('key', ['bm25_quran', 'tfidf_quran'])
+def test_filtered_search_only_scores_matching_rows(tiny_engines, key):
+    doc_filters = resolve_doc_filters(tiny_engines, filters_from_params(surah=2, verse_from=40, verse_to=160))
+    unfiltered = [r['doc_id'] for r in tiny_engines[key].search("الصلاة", top_k=20)]
+    filtered = [r['doc_id'] for r in tiny_engines[key].search("الصلاة", top_k=20, doc_filter=doc_filters['quran'])]
+    assert filtered and set(filtered) <= doc_filters['quran'].doc_ids
+    assert filtered == [doc_id for doc_id in unfiltered if doc_id in doc_filters['quran'].doc_ids]
+
+
+def test_filtering_one_corpus_excludes_the_other(tiny_engines):
+    doc_filters = resolve_doc_filters(tiny_engines, filters_from_params(book='Sahih Muslim'))
+    assert doc_filters['hadith'].doc_ids == {'6', '7', '8', '9'}
+    assert len(doc_filters['quran']) == 0
+    assert tiny_engines['bm25_quran'].search("الصلاة", doc_filter=doc_filters['quran']) == []
+    assert resolve_doc_filters(tiny_engines, filters_from_params()) == {}
+
+
+def test_verse_range_without_a_surah_is_rejected(app_client, tmp_path):
+    with pytest.raises(ValueError):
+        filters_from_params(verse_from=1)
+    assert app_client.get("/search/bm25/m1/الصلاة", params={'verse_to': 5}).status_code == 400
+
+    path = tmp_path / "questions.jsonl"
+    path.write_text('{"id": "a", "question": "الصلاة", "verse_from": 3}\n'
+                    '{"id": "b", "question": "الصلاة", "surah": 2, "verse_from": 3}\n', encoding='utf-8')
+    rows = {row['id']: row for row in read_questions(str(path))}
+    assert 'surah' in rows['a']['error'] and 'error' not in rows['b']
@@ -0,0 +1,93 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+import frozen_index
+from frozen_index import FrozenPostings, accumulate, doc_filter_mask, row_index, shared_postings, top_k_rows
+from filters import DocFilter
+
+
+def test_postings_are_sorted_read_only_views():
+    index = {
+        'a': {'df': 2, 'postings': {'d2': [0, 3], 'd0': [1]}},
+        'b': {'df': 1, 'postings': {'d1': 4}},
+    }
+    postings = FrozenPostings(index, row_index(['d0', 'd1', 'd2']), 3)
+    rows, tfs = postings.get('a')
+    assert rows.tolist() == [0, 2] and tfs.tolist() == [1.0, 2.0]
+    assert postings.get('b')[1].tolist() == [4.0]
+    assert postings.get('c') is None and postings.df_of('a') == 2
+    with pytest.raises(ValueError):
+        rows[0] = 1
+    with pytest.raises(ValueError):
+        postings.rows[0] = 1
+    with pytest.raises(TypeError):
+        postings.term_ids['c'] = 2
+
+
+def random_postings(seed, n_docs, n_terms=6):
+    rng = np.random.default_rng(seed)
+    postings = []
+    for weight in range(1, n_terms + 1):
+        rows = np.sort(rng.choice(n_docs, size=rng.integers(1, n_docs), replace=False)).astype(np.int32)
+        postings.append((rows, rng.integers(1, 5, size=len(rows)).astype(np.float32), float(weight)))
+    return postings
+
+
+def contribution(rows, tfs, weight):
+    return np.stack([weight * tfs, np.ones(len(rows))])
+
+
+@pytest.mark.parametrize('masked', [False, True])
+def test_sectioned_scoring_equals_serial_scoring(monkeypatch, masked):
+    n_docs = 500
+    postings = random_postings(0, n_docs)
+    mask = doc_filter_mask(DocFilter(np.arange(0, n_docs, 7), frozenset()), n_docs) if masked else None
+    with frozen_index.serial_scoring():
+        serial = accumulate(n_docs, postings, contribution, mask, n_outputs=2)
+
+    monkeypatch.setattr(frozen_index, 'SCORING_THREADS', 4)
+    monkeypatch.setattr(frozen_index, 'SECTION_MIN_POSTINGS', 1)
+    sectioned = accumulate(n_docs, postings, contribution, mask, n_outputs=2)
+    assert np.allclose(sectioned[0], serial[0]) and np.array_equal(sectioned[1], serial[1])
+
+    expected = np.zeros(n_docs)
+    for rows, tfs, w in postings:
+        keep = mask[rows] if masked else slice(None)
+        np.add.at(expected, rows[keep], w * tfs[keep])
+    assert np.allclose(serial[0][0], expected)
+
+
+def test_top_k_rows_keeps_one_row_per_cluster():
+    scores = np.array([5.0, 4.0, 3.0, 0.0, 2.0])
+    matched = np.array([1, 1, 2, 0, 1])
+    assert top_k_rows(scores, matched, 3) == [0, 1, 2]
+    assert top_k_rows(scores, matched, 3, by_matched=True) == [2, 0, 1]
+    assert top_k_rows(scores, matched, 3, cluster_of=np.array([0, 0, 2, 3, 4])) == [0, 2, 4]
+
+
+def test_shared_postings_must_cover_the_engines_documents():
+    index = {'a': {'df': 1, 'postings': {'d0': [0]}}}
+    postings = FrozenPostings(index, row_index(['d0', 'd1']), 2)
+    assert shared_postings(index, ['d0', 'd1'], postings) is postings
+    with pytest.raises(ValueError):
+        shared_postings(index, ['d0'], postings)
+
+
+def test_engines_share_one_postings_object(tiny_engines):
+    for corpus in ('quran', 'hadith'):
+        postings = tiny_engines[f'bm25_{corpus}'].postings
+        for key in ('tfidf', 'vsm', 'hybrid'):
+            assert tiny_engines[f'{key}_{corpus}'].postings is postings
+        assert tiny_engines[f'bm25f_{corpus}'].fields['arabic'] is postings
+
+
+def test_concurrent_searches_match_serial_searches(tiny_engines, monkeypatch):
+    monkeypatch.setattr(frozen_index, 'SECTION_MIN_POSTINGS', 1)
+    engine = tiny_engines['bm25_hadith']
+    queries = ["الصلاة", "من صام رمضان", "الصبر على البلاء", "الزكاة", "الايمان"] * 20
+    random.Random(0).shuffle(queries)
+    expected = {q: engine.search(q, top_k=5) for q in set(queries)}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda q: engine.search(q, top_k=5), queries))
+    assert all(result == expected[q] for q, result in zip(queries, results))
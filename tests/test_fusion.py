@@ -0,0 +1,44 @@
+from fusion import comb_sum, reciprocal_rank_fusion
+from run_user_query import fuse_query_results
+
+
+def hit(doc_id, score=1.0, **extra):
+    return {'doc_id': doc_id, 'score': score, 'text': doc_id, **extra}
+
+
+def test_rrf_rewards_documents_found_by_several_queries():
+    fused = reciprocal_rank_fusion([[hit('a'), hit('b')], [hit('c'), hit('b')], [hit('b')]])
+    assert [r['doc_id'] for r in fused] == ['b', 'a', 'c']
+    assert fused[0]['fused_score'] == 2 / 62 + 1 / 61
+
+
+def test_rrf_keeps_the_best_scoring_copy_of_a_document():
+    fused = reciprocal_rank_fusion([[hit('a', 1.0, query=1)], [hit('a', 3.0, query=2)]])
+    assert fused == [{**hit('a', 3.0, query=2), 'fused_score': 2 / 61}]
+
+
+def test_comb_sum_normalizes_each_list_by_its_max_score():
+    fused = comb_sum([[hit('a', 10.0), hit('b', 5.0)], [hit('b', 1.0)]])
+    assert [(r['doc_id'], r['fused_score']) for r in fused] == [('b', 1.5), ('a', 1.0)]
+
+
+def test_fuse_query_results_fuses_per_source_within_the_candidate_budget():
+    query_results_map = [
+        {'query': 'q1', 'type': 'quran', 'results': [hit('1_1'), hit('1_2'), hit('1_3')]},
+        {'query': 'q2', 'type': 'hadith', 'results': [hit('7')]},
+        {'query': 'q3', 'type': 'quran', 'results': [hit('1_3'), hit('1_4')]},
+    ]
+    fused = fuse_query_results(query_results_map, budget={'quran': 2, 'hadith': 5})
+    assert [item['type'] for item in fused] == ['quran', 'hadith']
+    assert fused[0]['query'] == 'q1 | q3'
+    assert [r['doc_id'] for r in fused[0]['results']] == ['1_3', '1_1']
+    assert [r['doc_id'] for r in fused[1]['results']] == ['7']
+
+
+def test_fuse_query_results_sends_one_member_of_each_duplicate_cluster():
+    query_results_map = [
+        {'query': 'q1', 'type': 'hadith', 'results': [hit('3', cluster_id='3'), hit('8')]},
+        {'query': 'q2', 'type': 'hadith', 'results': [hit('5', cluster_id='3')]},
+    ]
+    fused = fuse_query_results(query_results_map)
+    assert [r['doc_id'] for r in fused[0]['results']] == ['3', '8']
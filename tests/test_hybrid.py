@@ -0,0 +1,57 @@
+import pytest
+from bm25_search import BM25SearchEngine
+from fusion import RRF_K
+from hybrid_search import HybridSearchEngine
+from metrics import POSTINGS_TRAVERSED
+from vsm_search import VectorSpaceModel
+
+QUERY = "استعينوا بالصبر والصلاة"
+
+
+@pytest.fixture(scope='module')
+def quran(tiny_engines):
+    return (tiny_engines['quran_inverted_index'], tiny_engines['bm25_quran'].doc_metadata,
+            tiny_engines['processor'])
+
+
+def scores(results):
+    return {r['doc_id']: r['score'] for r in results}
+
+
+def test_weighted_fusion_matches_separate_bm25_and_cosine(quran):
+    bm25 = scores(BM25SearchEngine('Quran', *quran).search(QUERY, top_k=50))
+    cosine = scores(VectorSpaceModel('Quran', *quran).search(QUERY, top_k=50))
+    hybrid = scores(HybridSearchEngine('Quran', *quran).search(QUERY, top_k=50))
+
+    assert set(hybrid) == set(bm25)
+    max_bm25 = max(bm25.values())
+    for doc_id, score in hybrid.items():
+        assert score == pytest.approx(0.5 * bm25[doc_id] / max_bm25 + 0.5 * cosine.get(doc_id, 0.0))
+
+
+def test_rrf_fusion_sums_weighted_reciprocal_ranks_of_both_lists(quran):
+    bm25 = BM25SearchEngine('Quran', *quran).search(QUERY, top_k=50)
+    cosine = VectorSpaceModel('Quran', *quran).search(QUERY, top_k=50)
+    expected = {}
+    for ranked in (bm25, cosine):
+        for rank, r in enumerate(ranked, start=1):
+            expected[r['doc_id']] = expected.get(r['doc_id'], 0.0) + 0.5 / (RRF_K + rank)
+
+    hybrid = scores(HybridSearchEngine('Quran', *quran, fusion="rrf").search(QUERY, top_k=50))
+    assert hybrid == pytest.approx(expected)
+
+
+def test_postings_are_traversed_once_for_both_scores(quran):
+    engine = HybridSearchEngine('Quran', *quran)
+    before = POSTINGS_TRAVERSED.value(engine='HybridSearchEngine', corpus='quran')
+    engine.search(QUERY, top_k=5)
+    inverted_index = quran[0]
+    tokens = set(quran[2].preprocess(QUERY)['tokens'])
+    expected = sum(inverted_index[t]['df'] for t in tokens if t in inverted_index)
+    assert POSTINGS_TRAVERSED.value(engine='HybridSearchEngine', corpus='quran') - before == expected
+
+
+def test_duplicate_clusters_collapse_to_one_hit(tiny_engines):
+    results = tiny_engines['hybrid_quran'].search("فباي الاء ربكما تكذبان", top_k=5)
+    assert [r['doc_id'] for r in results].count('55_13') == 1
+    assert not {'55_16', '55_18'} & {r['doc_id'] for r in results}
@@ -0,0 +1,95 @@
+import math
+import time
+import numpy as np
+import pytest
+from impact_index import ImpactIndex, RankedResults, index_fingerprint, load_impact_index, save_impact_index
+from indexing import build_inverted_index_quran
+
+VOCABULARY = [f"كلمة{chr(0x0628 + i)}" for i in range(12)]
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    rng = np.random.default_rng(0)
+    records = [{'chapter': 1, 'verse': v, 'tokens': list(rng.choice(VOCABULARY, size=rng.integers(3, 15)))}
+               for v in range(1, 301)]
+    return records, build_inverted_index_quran(records)
+
+
+def exact_bm25(records, inverted, terms, k1=1.5, b=0.75):
+    lengths = np.array([len(r['tokens']) for r in records], dtype=np.float64)
+    row_of = {f"1_{r['verse']}": i for i, r in enumerate(records)}
+    scores = np.zeros(len(records))
+    for term in terms:
+        entry = inverted[term]
+        idf = math.log((len(records) - entry['df'] + 0.5) / (entry['df'] + 0.5) + 1)
+        for doc_id, positions in entry['postings'].items():
+            row, tf = row_of[doc_id], len(positions)
+            scores[row] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[row] / lengths.mean()))
+    return scores
+
+
+def build(records, inverted):
+    return ImpactIndex.build(inverted, [f"1_{r['verse']}" for r in records], [len(r['tokens']) for r in records])
+
+
+def test_complete_scoring_matches_bm25_up_to_quantization(corpus):
+    records, inverted = corpus
+    index = build(records, inverted)
+    terms = VOCABULARY[:3]
+    scores, exact, scored = index.search([(t, 1.0) for t in terms], len(records))
+    assert exact and scored == sum(inverted[t]['df'] for t in terms)
+    expected = exact_bm25(records, inverted, terms)
+    # Each term's impact is rounded to the nearest of 255 levels
+    assert np.all(np.abs(scores - expected) <= len(terms) * index.scale / 2 + 1e-9)
+
+
+def test_a_postings_budget_scores_the_highest_impacts_first(corpus):
+    records, inverted = corpus
+    index = build(records, inverted)
+    term = VOCABULARY[0]
+    scores, exact, scored = index.search([(term, 1.0)], len(records), postings_budget=10, block_size=4)
+    assert not exact and scored == 10
+    expected = exact_bm25(records, inverted, [term])
+    threshold = np.sort(expected)[-10]
+    # Ties at the quantized cut-off may go either way
+    assert np.all(expected[scores > 0] >= threshold - index.scale)
+
+
+def test_an_expired_deadline_still_scores_one_block(corpus):
+    records, inverted = corpus
+    index = build(records, inverted)
+    scores, exact, scored = index.search([(VOCABULARY[0], 1.0)], len(records), deadline=time.perf_counter() - 1,
+                                         block_size=4)
+    assert not exact and scored == 4 and np.count_nonzero(scores) == 4
+
+
+def test_engine_uses_the_impact_index_only_when_over_budget(tiny_engines):
+    engine = tiny_engines['bm25_hadith']
+    assert engine.impact_index is not None
+    query = "الصلاة والزكاة الايمان"
+    exact = engine.search(query, top_k=5)
+    generous = engine.search(query, top_k=5, deadline=time.perf_counter() + 60, postings_budget=10 ** 6)
+    assert generous == exact and getattr(generous, 'exact', True)
+
+    truncated = engine.search(query, top_k=5, postings_budget=2)
+    assert isinstance(truncated, RankedResults) and not truncated.exact
+    assert truncated.postings_scored == 2 and 1 <= len(truncated) <= 2
+    assert {r['doc_id'] for r in truncated} <= {r['doc_id'] for r in engine.search(query, top_k=20)}
+
+
+def test_saved_impacts_are_rebuilt_when_the_postings_change(tmp_path, corpus):
+    records, inverted = corpus
+    saved = build(records, inverted)
+    save_impact_index(saved, 'quran', str(tmp_path))
+    loaded = load_impact_index(inverted, records, 'quran', str(tmp_path))
+    assert loaded.fingerprint == saved.fingerprint
+    assert np.array_equal(loaded.rows, saved.rows) and np.array_equal(loaded.impacts, saved.impacts)
+
+    changed = {term: {'df': entry['df'], 'postings': dict(entry['postings'])} for term, entry in inverted.items()}
+    changed['جديد'] = {'df': 1, 'postings': {'1_1': [0]}}
+    assert index_fingerprint(changed, saved.doc_ids) != saved.fingerprint
+    rebuilt = load_impact_index(changed, records, 'quran', str(tmp_path))
+    assert 'جديد' in rebuilt and rebuilt.fingerprint == index_fingerprint(changed, saved.doc_ids)
+    # Other BM25 parameters also force a rebuild
+    assert load_impact_index(inverted, records, 'quran', str(tmp_path), k1=1.2).k1 == 1.2
@@ -0,0 +1,127 @@
+import threading
+import time
+import pytest
+from gemini_llm import SearchModelOne
+from llm_backends import FakeBackend, FakeBackendError
+from llm_gateway import CircuitBreaker, CircuitOpenError, GatewayBackend, LLMGateway, LLMTimeoutError
+from run_user_query import run_query
+
+
+def gateway(**kwargs):
+    kwargs.setdefault('base_delay', 0.0)
+    kwargs.setdefault('breaker_factory', lambda call_type: CircuitBreaker(2, 0.05, call_type))
+    return LLMGateway(**kwargs)
+
+
+def failing(code=503):
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise FakeBackendError("down", code)
+    return fn, attempts
+
+
+def test_breaker_opens_then_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow() and breaker.allow()
+
+
+def test_retries_count_as_one_breaker_failure_per_call():
+    gw = gateway(max_retries=2)
+    fn, attempts = failing()
+    with pytest.raises(FakeBackendError):
+        gw.call(fn, call_type="validation")
+    assert len(attempts) == 3
+    assert gw.breaker("validation").state == CircuitBreaker.CLOSED
+
+    with pytest.raises(FakeBackendError):
+        gw.call(fn, call_type="validation")
+    assert gw.breaker("validation").state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        gw.call(fn, call_type="validation")
+    assert len(attempts) == 6
+
+
+def test_breakers_are_kept_per_call_type():
+    gw = gateway(max_retries=0)
+    fn, _ = failing()
+    for _ in range(2):
+        with pytest.raises(FakeBackendError):
+            gw.call(fn, call_type="validation")
+    assert not gw.available("validation")
+    assert gw.available("generation")
+    assert gw.call(lambda: "ok", call_type="generation") == "ok"
+    assert not gw.available("validation")
+
+
+def test_non_retryable_errors_are_not_retried_and_keep_the_breaker_closed():
+    gw = gateway(max_retries=2)
+    fn, attempts = failing(code=400)
+    for _ in range(3):
+        with pytest.raises(FakeBackendError):
+            gw.call(fn)
+    assert len(attempts) == 3
+    assert gw.available()
+
+
+def test_calls_past_the_deadline_time_out():
+    gw = gateway(timeout=0.05, max_retries=0)
+    with pytest.raises(LLMTimeoutError):
+        gw.call(time.sleep, 0.5)
+
+
+def test_in_flight_calls_are_bounded():
+    gw = gateway(max_in_flight=2)
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def fn():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    threads = [threading.Thread(target=gw.call, args=(fn,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+
+class FailingValidation(FakeBackend):
+    def generate_content(self, model, contents, config=None):
+        if config and config.get("response_json_schema", {}).get("title") == "ExtendedValidationResponse":
+            raise FakeBackendError("validator down")
+        return super().generate_content(model, contents, config)
+
+
+def test_failed_validation_returns_the_fused_candidates_unvalidated(tiny_engines):
+    backend = GatewayBackend(FailingValidation(latency=0), gateway(max_retries=1))
+    model = SearchModelOne(backend=backend)
+    for _ in range(3):
+        response = run_query("الصبر", tiny_engines['bm25_quran'], tiny_engines['bm25_hadith'], model)
+        assert response.degraded
+        assert response.results
+        assert all(r.is_relevant is None and r.observation.startswith("Not validated") for r in response.results)
+    # The validation breaker is open; query generation keeps working
+    assert not backend.available("ExtendedValidationResponse")
+    assert model.available()
@@ -0,0 +1,58 @@
+import pytest
+from fusion import reciprocal_rank_fusion
+from load_engines import load_engines_fast
+from near_duplicates import collapse_duplicates, result_cluster
+from run_user_query import FALLBACK_TOP_K, run_pipeline
+from startup import is_unbuilt
+
+
+class NoQueries:
+    """A model whose query generation returns nothing, as without an API key."""
+    backend = None
+
+    def available(self, *args) -> bool:
+        return True
+
+    def generate_queries(self, user_question: str) -> list:
+        return []
+
+
+MODELS = {'m1': NoQueries(), 'm2': NoQueries()}
+
+
+@pytest.fixture
+def fresh_engines(tiny_indices_dir):
+    # Own engine set, so the deferred LSA engines start unbuilt
+    return load_engines_fast(tiny_indices_dir)
+
+
+def test_lsa_keeps_common_content_words(tiny_engines):
+    results = tiny_engines['lsa_hadith'].search("الصلاة", top_k=5)
+    assert results
+    assert all(-1.0 <= r['score'] <= 1.0 for r in results)
+
+
+@pytest.mark.parametrize('model', ['m1', 'm2'])
+def test_no_queries_falls_back_to_the_selected_engine_without_building_lsa(fresh_engines, model):
+    response = run_pipeline(fresh_engines, "الصلاة", 'bm25', model, MODELS)
+    expected = (fresh_engines['bm25_quran'].search("الصلاة", top_k=FALLBACK_TOP_K)
+                + fresh_engines['bm25_hadith'].search("الصلاة", top_k=FALLBACK_TOP_K))
+    assert response.degraded
+    assert [r.doc_id for r in response.results] == [r['doc_id'] for r in expected]
+    assert is_unbuilt(fresh_engines['lsa_quran']) and is_unbuilt(fresh_engines['lsa_hadith'])
+
+
+def test_built_lsa_is_rrf_fused_with_the_lexical_results(fresh_engines):
+    question = "الصبر على البلاء"
+    fresh_engines['lsa_hadith'].get()
+    response = run_pipeline(fresh_engines, question, 'bm25', 'm1', MODELS)
+
+    # The Quran fallback is still unbuilt: lexical results only, and it is not built for the request
+    quran = fresh_engines['bm25_quran'].search(question, top_k=FALLBACK_TOP_K)
+    semantic = fresh_engines['lsa_hadith'].search(question, top_k=FALLBACK_TOP_K)
+    lexical = fresh_engines['bm25_hadith'].search(question, top_k=FALLBACK_TOP_K)
+    hadith = collapse_duplicates(reciprocal_rank_fusion([lexical, semantic]), result_cluster, FALLBACK_TOP_K)
+    assert semantic
+    assert response.degraded
+    assert [r.doc_id for r in response.results] == [r['doc_id'] for r in quran + hadith]
+    assert is_unbuilt(fresh_engines['lsa_quran'])
@@ -0,0 +1,67 @@
+import pytest
+from metrics import (MetricsRegistry, current_request_timings, server_timing_header, stage,
+                     start_request_timings)
+
+
+def test_counter_and_gauge_render_prometheus_samples():
+    registry = MetricsRegistry()
+    hits = registry.counter('hits_total', 'Hits.', ('cache',))
+    hits.inc(cache='a')
+    hits.inc(2, cache='a')
+    depth = registry.gauge('depth', 'Depth.')
+    depth.inc(3)
+    depth.dec()
+    assert hits.value(cache='a') == 3.0
+    assert registry.render().splitlines() == [
+        '# HELP hits_total Hits.', '# TYPE hits_total counter', 'hits_total{cache="a"} 3.0',
+        '# HELP depth Depth.', '# TYPE depth gauge', 'depth 2.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = MetricsRegistry().histogram('latency', 'Latency.', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage='search')
+    assert histogram.count(stage='search') == 4
+    assert histogram.render()[2:] == [
+        'latency_bucket{stage="search",le="0.1"} 1',
+        'latency_bucket{stage="search",le="1.0"} 3',
+        'latency_bucket{stage="search",le="+Inf"} 4',
+        'latency_sum{stage="search"} 6.05',
+        'latency_count{stage="search"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = MetricsRegistry().counter('c', 'C.', ('path',))
+    counter.inc(path='a"b\\c\nd')
+    assert counter.render()[-1] == 'c{path="a\\"b\\\\c\\nd"} 1.0'
+
+
+def test_metric_names_are_unique():
+    registry = MetricsRegistry()
+    registry.counter('x', 'X.')
+    with pytest.raises(ValueError):
+        registry.gauge('x', 'X again.')
+
+
+def test_stages_add_up_in_the_request_timings():
+    start_request_timings()
+    for _ in range(2):
+        with stage('search'):
+            pass
+    timings = current_request_timings()
+    assert list(timings) == ['search'] and timings['search'] >= 0
+    assert server_timing_header({'search': 0.0123, 'total': 0.5}) == 'search;dur=12.30, total;dur=500.00'
+
+
+def test_search_reports_stages_in_server_timing_and_metrics(app_client):
+    response = app_client.get("/search/bm25/m1/الصبر")
+    assert response.status_code == 200
+    stages = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+    assert {'generate_queries', 'search', 'validation', 'build_response', 'total'} <= set(stages)
+
+    metrics = app_client.get("/metrics").text
+    assert 'mustadil_stage_seconds_bucket{stage="search",le="+Inf"}' in metrics
+    assert 'mustadil_engine_search_seconds_count{engine="BM25SearchEngine",corpus="quran"}' in metrics
+    assert 'mustadil_request_seconds_count{path="/search/{engine}/{model}/{query}"}' in metrics
@@ -0,0 +1,67 @@
+import copy
+from near_duplicates import build_duplicate_clusters, cluster_array, collapse_duplicates, result_cluster, shingles
+
+ISNAD = "حدثنا عبد الله بن يوسف قال اخبرنا مالك عن نافع عن عبد الله بن عمر ان رسول الله قال".split()
+MATN = "من صام رمضان ايمانا واحتسابا غفر له ما تقدم من ذنبه ومن قام ليلة القدر ايمانا واحتسابا".split()
+
+
+def hadith(hadith_id, tokens):
+    return {'hadith_id': hadith_id, 'tokens': tokens}
+
+
+def test_shingles():
+    assert shingles(['a', 'b', 'c', 'd', 'e'], 4) == {'a b c d', 'b c d e'}
+    assert shingles(['a', 'b'], 4) == {'a b'}
+    assert shingles([], 4) == set()
+
+
+def test_identical_and_near_identical_texts_cluster_under_the_first_document():
+    near = MATN[:-1] + ['رمضان']
+    other_matn = "الطهور شطر الايمان والحمد لله تملا الميزان وسبحان الله والحمد لله تملان ما بين السماوات والارض".split()
+    docs = [
+        hadith(1, ISNAD + other_matn),
+        hadith(2, MATN),
+        hadith(3, MATN),
+        hadith(4, near),
+        hadith(5, ISNAD + MATN[:4] + other_matn[4:]),
+        hadith(6, []),
+    ]
+    clusters = build_duplicate_clusters(docs)
+    assert clusters == {'2': '2', '3': '2', '4': '2'}
+
+
+def test_hadiths_sharing_only_an_isnad_stay_apart():
+    matns = [MATN, "انما الاعمال بالنيات وانما لكل امرئ ما نوى فمن كانت هجرته الى الله ورسوله".split()]
+    assert build_duplicate_clusters([hadith(i, ISNAD + m) for i, m in enumerate(matns)]) == {}
+
+
+def test_cluster_array_numbers_clusters_apart_from_rows():
+    clusters = {'b': 'b', 'd': 'b'}
+    array = cluster_array(clusters, ['a', 'b', 'c', 'd'])
+    assert array[1] == array[3] and len({array[0], array[1], array[2]}) == 3
+    assert not array.flags.writeable
+    assert cluster_array(None, ['a']) is None
+
+
+def test_collapse_keeps_the_best_of_each_cluster():
+    ranked = [{'doc_id': 'x', 'cluster_id': 'c'}, {'doc_id': 'y', 'cluster_id': None},
+              {'doc_id': 'z', 'cluster_id': 'c'}, {'doc_id': 'w', 'cluster_id': None}]
+    assert [r['doc_id'] for r in collapse_duplicates(ranked, result_cluster)] == ['x', 'y', 'w']
+    assert [r['doc_id'] for r in collapse_duplicates(ranked, result_cluster, top_k=2)] == ['x', 'y']
+
+
+def test_repeated_verses_and_hadiths_collapse_in_search(tiny_engines):
+    assert tiny_engines['quran_clusters'] == {'55_13': '55_13', '55_16': '55_13', '55_18': '55_13'}
+    quran = tiny_engines['bm25_quran']
+    results = quran.search("فباي الاء ربكما تكذبان", top_k=5)
+    assert [r['doc_id'] for r in results] == ['55_13'] and results[0]['cluster_id'] == '55_13'
+
+    uncollapsed = copy.copy(quran)
+    uncollapsed.duplicate_clusters = uncollapsed.cluster_of = None
+    assert {r['doc_id'] for r in uncollapsed.search("فباي الاء ربكما تكذبان", top_k=5)} == \
+        {'55_13', '55_16', '55_18'}
+
+    hadith_ids = [r['doc_id'] for r in tiny_engines['bm25_hadith'].search("من صام رمضان", top_k=5)]
+    assert '3' in hadith_ids and '5' not in hadith_ids
+    # Every engine collapses, including the vector-space ones
+    assert [r['doc_id'] for r in tiny_engines['vsm_quran'].search("ربكما تكذبان", top_k=5)] == ['55_13']
@@ -0,0 +1,79 @@
+import threading
+import time
+import numpy as np
+import pytest
+import frozen_index
+from profiling import profile_call
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+def test_cprofile_report_lists_the_profiled_function():
+    result, report, dump = profile_call(busy, 1000)
+    assert result == busy(1000)
+    assert 'busy' in report
+    assert dump.getstats()
+
+
+def test_sampling_returns_folded_stacks():
+    result, report, folded = profile_call(time.sleep, 0.05, mode="sampling")
+    assert 'samples every' in report
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in folded.splitlines())
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        profile_call(busy, 10, mode="perf")
+
+
+def test_scoring_stays_on_the_profiled_thread(monkeypatch):
+    monkeypatch.setattr(frozen_index, 'SCORING_THREADS', 4)
+    monkeypatch.setattr(frozen_index, 'SECTION_MIN_POSTINGS', 1)
+    rows = np.arange(0, 100, dtype=np.int32)
+    postings = [(rows, np.ones(100, dtype=np.int32), 2.0)]
+
+    def contribution(rows, tfs, weight):
+        return weight * tfs
+
+    sectioned, _ = frozen_index.accumulate(100, postings, contribution)
+
+    def no_pool():
+        raise AssertionError("scoring pool used while profiling")
+
+    monkeypatch.setattr(frozen_index, '_scoring_pool', no_pool)
+    (serial, _), _, _ = profile_call(frozen_index.accumulate, 100, postings, contribution)
+    assert np.array_equal(serial, sectioned)
+
+
+def test_profiled_calls_run_one_at_a_time():
+    active, overlaps = [], []
+
+    def call():
+        active.append(1)
+        overlaps.append(len(active))
+        time.sleep(0.02)
+        active.pop()
+
+    threads = [threading.Thread(target=profile_call, args=(call,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [1, 1, 1, 1]
+
+
+def test_profile_endpoint_needs_admin_and_profiling(app_client, monkeypatch):
+    monkeypatch.setenv('MUSTADIL_PROFILING', '1')
+    monkeypatch.delenv('MUSTADIL_ADMIN', raising=False)
+    assert app_client.get("/admin/profile/bm25/m1/الصبر").status_code == 404
+
+    monkeypatch.setenv('MUSTADIL_ADMIN', '1')
+    monkeypatch.setenv('MUSTADIL_PROFILING', '0')
+    assert app_client.get("/admin/profile/bm25/m1/الصبر").status_code == 404
+
+    monkeypatch.setenv('MUSTADIL_PROFILING', '1')
+    response = app_client.get("/admin/profile/bm25/m1/الصبر")
+    assert response.status_code == 200
+    assert 'run_search' in response.json()['profile']
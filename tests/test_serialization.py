@@ -0,0 +1,47 @@
+import json
+import pytest
+from schemas import AppSearchResponse, SearchResultItem
+from serialization import RESULT_FIELDS, encode_response, parse_fields
+
+
+def sample_response():
+    return AppSearchResponse(
+        user_question="الصبر",
+        generated_queries=[{'query': "الصبر", 'type': 'quran'}],
+        results=[
+            SearchResultItem(doc_id='2_153', snippet="استعينوا بالصبر", highlights=[[9, 15]],
+                             metadata={'chapter': 2, 'verse': 153, 'tokens': ['استعينوا', 'بالصبر']},
+                             score=1.5, is_relevant=True, observation="relevant"),
+            SearchResultItem(doc_id='11', metadata={'book': 'Muwatta Malik', 'hadith_number': 11, 'hadith_id': 11},
+                             score=0.5, is_relevant=None, observation=None),
+        ],
+    )
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None and parse_fields("") is None
+    assert parse_fields(" doc_id, score ,") == {'doc_id', 'score'}
+    with pytest.raises(ValueError, match="bogus"):
+        parse_fields("doc_id,bogus")
+
+
+def test_encoding_matches_the_response_model():
+    response = sample_response()
+    encoded = json.loads(encode_response(response))
+    assert encoded == json.loads(response.model_dump_json())
+    assert encoded['results'][0]['metadata']['tokens'] == ['استعينوا', 'بالصبر']
+    assert set(encoded['results'][0]) == set(RESULT_FIELDS)
+
+
+def test_projection_keeps_only_the_selected_result_fields():
+    encoded = json.loads(encode_response(sample_response(), {'doc_id', 'score'}))
+    assert encoded['results'] == [{'doc_id': '2_153', 'score': 1.5}, {'doc_id': '11', 'score': 0.5}]
+    assert encoded['user_question'] == "الصبر" and encoded['exact'] is True and encoded['degraded'] is False
+
+
+def test_search_endpoint_projects_fields(app_client):
+    response = app_client.get("/search/bm25/m1/الصلاة", params={'fields': 'doc_id,snippet'})
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert results and all(set(r) == {'doc_id', 'snippet'} for r in results)
+    assert app_client.get("/search/bm25/m1/الصلاة", params={'fields': 'nope'}).status_code == 400
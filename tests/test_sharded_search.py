@@ -0,0 +1,52 @@
+import pytest
+from filters import filters_from_params, resolve_doc_filters
+from sharded_search import ShardedSearchEngine, partition_doc_ids, split_postings
+
+QUERIES = ("الصلاة", "من صام رمضان", "الصبر على البلاء", "الزكاة NOT الصبر", "الصلوة")
+
+
+def test_partitions_cover_every_document_once(tiny_engines):
+    metadata = tiny_engines['bm25_hadith'].doc_metadata
+    by_book = partition_doc_ids(metadata, "book")
+    assert [len(ids) for ids in by_book] == [5, 4, 2]
+    for spec in ("book", "1", "3", "100"):
+        shards = partition_doc_ids(metadata, spec)
+        assert sorted(d for ids in shards for d in ids) == sorted(metadata)
+
+
+def test_split_postings_keeps_global_df():
+    index = {'t': {'df': 3, 'postings': {'a': [0], 'b': [1], 'c': [2]}}}
+    shards = split_postings(index, {'a': 0, 'b': 1, 'c': 1}, 2)
+    assert shards == [{'t': {'df': 3, 'postings': {'a': [0]}}},
+                      {'t': {'df': 3, 'postings': {'b': [1], 'c': [2]}}}]
+
+
+@pytest.fixture(scope='module', params=["book", "2"])
+def sharded(request, tiny_engines):
+    engine = tiny_engines['bm25_hadith']
+    sharded = ShardedSearchEngine('Hadith', tiny_engines['hadith_inverted_index'], engine.doc_metadata,
+                                  request.param, term_dictionary=engine.term_dictionary,
+                                  stem_index=engine.stem_index, duplicate_clusters=engine.duplicate_clusters)
+    yield sharded
+    sharded.close()
+
+
+def ranking(results):
+    return [(r['doc_id'], pytest.approx(r['score']), r['matched_tokens']) for r in results]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_sharded_results_equal_unsharded_results(tiny_engines, sharded, query):
+    engine = tiny_engines['bm25_hadith']
+    search = engine.search_boolean if 'NOT' in query else engine.search
+    expected = search(query, top_k=5)
+    got = sharded.search(query, top_k=5)
+    assert expected
+    assert ranking(got) == ranking(expected)
+    assert all(r['text'] == engine.doc_metadata[r['doc_id']]['arabic_original'] for r in got)
+
+
+def test_sharded_search_applies_filters(tiny_engines, sharded):
+    doc_filter = resolve_doc_filters(tiny_engines, filters_from_params(book='Sahih Muslim'))['hadith']
+    expected = tiny_engines['bm25_hadith'].search("الصلاة", top_k=5, doc_filter=doc_filter)
+    assert ranking(sharded.search("الصلاة", top_k=5, doc_filter=doc_filter)) == ranking(expected)
@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+from singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, n):
+    """Start n callers of flight.do(key, fn); returns their (result, shared) pairs or exceptions."""
+    outcomes = []
+    lock = threading.Lock()
+    started = threading.Barrier(n + 1)
+
+    def call():
+        started.wait()
+        try:
+            outcome = flight.do(key, fn)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    # Let every caller reach flight.do before the test releases the leader
+    time.sleep(0.05)
+    return threads, outcomes
+
+
+def wait_for(condition):
+    while not condition():
+        time.sleep(0.001)
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    threads, outcomes = run_concurrently(flight, "q", compute, 5)
+    wait_for(lambda: calls)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True, True]
+    assert {result for result, _ in outcomes} == {"answer"}
+
+
+def test_waiters_get_the_leaders_exception():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("boom")
+
+    threads, outcomes = run_concurrently(flight, "q", fail, 3)
+    wait_for(lambda: "q" in flight._calls)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(outcomes) == 3 and all(isinstance(o, ValueError) for o in outcomes)
+
+
+def test_results_are_not_cached_after_the_call_completes():
+    flight = SingleFlight("test")
+    calls = []
+    assert flight.do("q", lambda: calls.append(1) or len(calls)) == (1, False)
+    assert flight.do("q", lambda: calls.append(1) or len(calls)) == (2, False)
+    assert flight._calls == {}
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    threads, outcomes = run_concurrently(flight, "slow", lambda: release.wait(5) and "slow", 1)
+    wait_for(lambda: "slow" in flight._calls)
+    assert flight.do("fast", lambda: "fast") == ("fast", False)
+    release.set()
+    threads[0].join()
+    assert outcomes == [("slow", False)]
+
+
+def test_leader_exception_is_raised_to_the_leader():
+    with pytest.raises(KeyError):
+        SingleFlight("test").do("q", lambda: {}["missing"])
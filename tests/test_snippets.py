@@ -0,0 +1,59 @@
+from preprocessing import SafeIslamicArabicProcessor
+from snippets import ELLIPSIS, best_window, make_snippet, token_spans, word_spans
+
+processor = SafeIslamicArabicProcessor()
+
+
+def test_spans_point_into_the_diacritized_text():
+    original = "وَأَقِيمُوا الصَّلَاةَ وَآتُوا الزَّكَاةَ"
+    tokens = processor.preprocess(original)['tokens']
+    spans = token_spans(original, tokens)
+    assert len(spans) == len(tokens)
+    assert original[spans[1][0]:spans[1][1]] == "الصَّلَاةَ"
+    assert original[spans[3][0]:spans[3][1]] == "الزَّكَاةَ"
+    assert [w for w, _, _ in word_spans(original)] == tokens
+
+
+def test_unaligned_tokens_fall_back_to_the_leading_words():
+    assert token_spans("كلمة اخرى", ["غير", "مطابق"]) is None
+    assert make_snippet("كلمة اخرى", ["غير", "مطابق"], [0]) == {'snippet': "كلمة اخرى", 'highlights': []}
+
+
+def test_highlights_slice_out_the_matched_words():
+    original = "يَا أَيُّهَا الَّذِينَ آمَنُوا اسْتَعِينُوا بِالصَّبْرِ وَالصَّلَاةِ"
+    tokens = processor.preprocess(original)['tokens']
+    snippet = make_snippet(original, tokens, [5, 6])
+    assert snippet['snippet'] == original
+    assert [snippet['snippet'][s:e] for s, e in snippet['highlights']] == ["بِالصَّبْرِ", "وَالصَّلَاةِ"]
+
+
+def test_long_texts_are_windowed_around_the_matches():
+    words = [f"كلمة{chr(0x0628 + i % 20)}" for i in range(60)]
+    words[40] = "الصلاة"
+    original = ' '.join(words)
+    tokens = processor.preprocess(original)['tokens']
+    snippet = make_snippet(original, tokens, [40], size=10)
+    text = snippet['snippet']
+    assert text.startswith(ELLIPSIS) and text.endswith(ELLIPSIS)
+    [[start, end]] = snippet['highlights']
+    assert text[start:end] == "الصلاة"
+    assert len(text.split()) == 10 + 2
+
+
+def test_best_window_prefers_distinct_terms():
+    tokens = ['a'] * 100
+    tokens[10] = tokens[12] = tokens[14] = 'x'
+    tokens[70], tokens[72] = 'x', 'y'
+    start, end = best_window([10, 12, 14, 70, 72], tokens, size=10)
+    assert start <= 70 and 72 < end
+
+
+def test_search_results_carry_highlighted_snippets(tiny_engines):
+    from run_user_query import run_direct_query
+    response = run_direct_query("الصلاة", tiny_engines['bm25_quran'], tiny_engines['bm25_hadith'])
+    assert response.results
+    for result in response.results:
+        assert result.snippet and result.highlights
+        assert all(result.snippet[s:e] for s, e in result.highlights)
+    verse = next(r for r in response.results if r.doc_id == '2_43')
+    assert [verse.snippet[s:e] for s, e in verse.highlights] == ["الصلاة"]
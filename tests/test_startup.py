@@ -0,0 +1,74 @@
+import os
+import sys
+import threading
+import time
+import types
+from startup import LazyEngine, StartupReport, is_unbuilt, measure_cold_start, parse_importtime, startup_budget
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:       200 |        300 | io
+import time:       500 |        500 |     numpy.core
+import time:      1000 |       1500 |   numpy
+import time:       300 |        300 |   filters
+import time:       200 |       2000 | main
+import time:       100 |        100 | atexit
+"""
+
+
+def test_cold_start_within_budget(indices_dir):
+    # Default configuration: nothing preloaded
+    env = {k: v for k, v in os.environ.items() if not k.startswith('MUSTADIL_PRELOAD')}
+    result = measure_cold_start(env)
+    budget = startup_budget()
+    assert result['cold_start_s'] <= budget, (
+        f"cold start {result['cold_start_s']:.2f}s exceeds {budget:.2f}s: {result['report']}")
+    assert result['heavy_modules_loaded'] == []
+
+
+def test_parse_importtime_lists_the_direct_imports_of_root():
+    total, direct = parse_importtime(IMPORTTIME)
+    assert total == 0.002
+    assert direct == [('numpy', 0.0015), ('filters', 0.0003)]
+
+
+def test_lazy_engine_builds_once_on_first_use(monkeypatch):
+    builds = []
+
+    class SlowEngine:
+        def __init__(self, name):
+            time.sleep(0.02)
+            builds.append(name)
+            self.name = name
+
+        def search(self, query, top_k=10):
+            return [query]
+
+    module = types.ModuleType('slow_engine_module')
+    module.SlowEngine = SlowEngine
+    monkeypatch.setitem(sys.modules, 'slow_engine_module', module)
+
+    report = StartupReport()
+    engine = LazyEngine('slow_quran', 'slow_engine_module', 'SlowEngine', {'name': 'Quran'}, report)
+    assert is_unbuilt(engine) and builds == []
+
+    threads = [threading.Thread(target=engine.get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == ['Quran'] and not is_unbuilt(engine)
+    # Attributes and methods are forwarded to the built engine
+    assert engine.name == 'Quran' and engine.search("الصلاة") == ["الصلاة"]
+    timings = report.as_dict()
+    assert set(timings['import']) == {'slow_engine_module'} and set(timings['engine_build']) == {'slow_quran'}
+
+
+def test_deferred_engines_stay_unbuilt_after_loading(tiny_indices_dir):
+    from load_engines import load_engines_fast
+    engines = load_engines_fast(tiny_indices_dir)
+    deferred = [key for key, engine in engines.items() if isinstance(engine, LazyEngine)]
+    assert 'tfidf_lib_quran' in deferred and 'lsa_hadith' in deferred
+    assert all(is_unbuilt(engines[key]) for key in deferred)
+    assert not is_unbuilt(engines['bm25_quran'])
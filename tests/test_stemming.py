@@ -0,0 +1,65 @@
+import pytest
+from bm25_search import BM25SearchEngine
+from indexing import build_inverted_index_quran
+from preprocessing import SafeIslamicArabicProcessor
+from stemming import LightStemmer, build_stem_index
+
+
+@pytest.fixture(scope='module')
+def processor():
+    return SafeIslamicArabicProcessor()
+
+
+@pytest.fixture(scope='module')
+def stemmer(processor):
+    return LightStemmer(processor)
+
+
+def test_inflected_forms_share_a_stem(stemmer):
+    assert {stemmer.stem(w) for w in ('صلاة', 'يصلون', 'المصلين', 'للمصلين')} == {'صل'}
+    assert stemmer.stem('بالصبر') == stemmer.stem('الصبر') == stemmer.stem('والصبر') == 'صبر'
+
+
+def test_protected_and_short_terms_are_not_stemmed(stemmer):
+    assert stemmer.stem('الله') == 'الله'
+    assert stemmer.stem('الرحمن') == 'الرحمن'
+    assert stemmer.stem('لا') == 'لا'
+
+
+def test_stem_postings_sum_the_surface_postings(stemmer):
+    inverted = {
+        'بالصبر': {'df': 2, 'postings': {'a': [0], 'b': [1, 4]}},
+        'الصبر': {'df': 1, 'postings': {'b': [2]}},
+        'نور': {'df': 1, 'postings': {'a': [3]}},
+    }
+    stems = build_stem_index(inverted, stemmer)
+    assert stems['صبر'] == {'df': 2, 'postings': {'a': 1, 'b': 3}}
+    assert stems['نور'] == {'df': 1, 'postings': {'a': 1}}
+
+
+def verses(*texts):
+    return [{'chapter': 1, 'verse': i, 'tokens': text.split()} for i, text in enumerate(texts, start=1)]
+
+
+def test_stem_variants_match_at_stem_weight(processor, stemmer):
+    records = verses("الصبر نور", "بالصبر نور", "الشكر نور", "الحمد لله")
+    inverted = build_inverted_index_quran(records)
+    metadata = {f"1_{r['verse']}": r for r in records}
+    plain = BM25SearchEngine('Quran', inverted, metadata, processor)
+    stemmed = BM25SearchEngine('Quran', inverted, metadata, processor,
+                               stem_index=build_stem_index(inverted, stemmer), stemmer=stemmer)
+
+    assert [r['doc_id'] for r in plain.search("الصبر")] == ['1_1']
+    results = stemmed.search("الصبر")
+    # The exact form ranks first; the other surface form shares its stem
+    assert [r['doc_id'] for r in results] == ['1_1', '1_2']
+    assert results[1]['score'] < results[0]['score']
+    assert results[1]['positions'] == [0]
+    # A query form that is not indexed at all still matches through its stem
+    assert {r['doc_id'] for r in stemmed.search("والصبر")} == {'1_1', '1_2'}
+
+
+def test_stem_matching_in_the_built_engines(tiny_engines):
+    # يصلون is not in the tiny Quran; للمصلين (107:4) shares its stem
+    assert 'يصلون' not in tiny_engines['quran_inverted_index']
+    assert '107_4' in {r['doc_id'] for r in tiny_engines['bm25_quran'].search("يصلون")}
@@ -0,0 +1,71 @@
+import random
+import pytest
+from term_dictionary import TermDictionary, _bounded_distance, max_edit_distance
+
+
+def levenshtein(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i]
+        for j, cb in enumerate(b, 1):
+            row.append(min(row[j - 1] + 1, prev[j] + 1, prev[j - 1] + (ca != cb)))
+        prev = row
+    return prev[-1]
+
+
+@pytest.fixture(scope='module')
+def vocabulary():
+    rng = random.Random(0)
+    terms = sorted({''.join(rng.choice('ابتسلمن') for _ in range(rng.randint(3, 8))) for _ in range(2000)})
+    dfs = [rng.randint(1, 100) for _ in terms]
+    return TermDictionary(terms, dfs)
+
+
+def test_complete_returns_the_most_frequent_terms_with_the_prefix(vocabulary):
+    for prefix in ('ا', 'بت', 'سلم', 'نننننن'):
+        expected = sorted(((t, df) for t, df in zip(vocabulary.terms, vocabulary.dfs) if t.startswith(prefix)),
+                          key=lambda x: -x[1])
+        got = vocabulary.complete(prefix, limit=5)
+        assert [df for _, df in got] == [df for _, df in expected[:5]]
+        assert all(t.startswith(prefix) for t, _ in got)
+    assert vocabulary.complete('') == []
+
+
+def test_fuzzy_finds_every_term_within_the_edit_bound(vocabulary):
+    rng = random.Random(1)
+    for _ in range(50):
+        token = ''.join(rng.choice('ابتسلمن') for _ in range(rng.randint(3, 8)))
+        bound = max_edit_distance(token)
+        got = vocabulary.fuzzy(token, limit=10 ** 6)
+        distances = {t: levenshtein(token, t) for t in vocabulary.terms}
+        # One edit anywhere; two edits below an exact prefix of `bound` characters
+        expected = {t for t, d in distances.items()
+                    if d <= 1 or (d <= bound and t[:bound] == token[:bound])}
+        assert {t for t, _, _ in got} == expected, token
+        assert all(d == distances[t] for t, d, _ in got)
+        assert [(d, -df) for _, d, df in got] == sorted((d, -df) for _, d, df in got)
+
+
+def test_short_tokens_are_not_corrected(vocabulary):
+    assert max_edit_distance('اب') == 0
+    assert vocabulary.fuzzy('اب') == []
+
+
+def test_bounded_distance_stops_at_the_bound():
+    assert _bounded_distance('الصلاة', 'الصلوة', 2) == 1
+    assert _bounded_distance('الصلاة', 'ال', 2) == 3
+
+
+def test_typos_are_expanded_in_search(tiny_engines):
+    engine = tiny_engines['bm25_quran']
+    assert 'الخاشعبن' not in tiny_engines['quran_terms']
+    results = engine.search("الخاشعبن")
+    assert [r['doc_id'] for r in results] == ['2_45']
+    assert results[0]['matched_tokens'] == ['الخاشعين']
+
+
+def test_autocomplete_endpoint(app_client):
+    completions = app_client.get("/autocomplete/quran/واقيموا الص").json()['completions']
+    assert {'term': 'الصلاة', 'df': 2} in completions
+    assert all(c['term'].startswith('الص') for c in completions)
+    assert app_client.get("/autocomplete/tafsir/ال").status_code == 404